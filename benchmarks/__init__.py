@@ -0,0 +1 @@
+"""Offline benchmarks for the downloader. Run with `python -m benchmarks.<name>`."""
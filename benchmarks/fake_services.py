@@ -0,0 +1,196 @@
+"""Local stand-ins for the Spotify Web API, YouTube search and media hosting.
+
+One threaded HTTP server answers:
+
+    GET /v1/playlists/<id>          playlist snapshot_id
+    GET /v1/playlists/<id>/items    paginated playlist tracks (also /tracks)
+    GET /v1/me/tracks               paginated saved tracks
+    GET /v1/tracks?ids=...          several tracks
+    GET /v1/albums?ids=...          several albums with their first tracks
+    GET /v1/artists/<id>/albums     paginated albums; every artist has all of them
+    GET /search?q=QUERY             {"id": VIDEO_ID}, a search stand-in
+    GET /media/<VIDEO_ID>.m4a       synthetic audio bytes
+    GET /cover/<ALBUM>.jpg          synthetic album cover bytes
+
+Library size, per-request latency and media size are configurable, and
+every request is counted per endpoint so benchmarks can report API usage.
+"""
+
+import functools
+import hashlib
+import http.server
+import json
+import os
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs, urlsplit
+
+# Playlist ID the fake API accepts; any 22-character ID works
+PLAYLIST_ID = '37i9dQZF1DXcBWIGoYBM5M'
+
+MAX_PAGE_SIZE = {'playlist': 100, 'saved': 50, 'artist_albums': 50}
+
+# Consecutive tracks share an album of this many tracks
+ALBUM_SIZE = 12
+
+
+# Synthetic Spotify track object number `index`; covers are served from base_url
+def fake_track(index, base_url=''):
+    album = index // ALBUM_SIZE
+    return {
+        'id': f'{index:022d}',
+        'name': f'Benchmark Track {index}',
+        'duration_ms': 180000 + index % 60000,
+        'track_number': index % ALBUM_SIZE + 1,
+        'external_ids': {'isrc': f'QZBENCH{index:05d}'},
+        'artists': [{'id': f'a{index % 500:021d}', 'name': f'Benchmark Artist {index % 500}'}],
+        'album': {'name': f'Benchmark Album {album}',
+                  'images': [{'url': f'{base_url}/cover/{album}.jpg', 'width': 640, 'height': 640}]},
+    }
+
+
+# Synthetic Spotify album object number `album` with its first page of tracks
+def fake_album(album, tracks, base_url=''):
+    first = album * ALBUM_SIZE
+    items = [{'id': fake_track(index)['id']} for index in range(first, min(first + ALBUM_SIZE, tracks))]
+    return {
+        'id': f'{album:022d}',
+        'name': f'Benchmark Album {album}',
+        'images': [{'url': f'{base_url}/cover/{album}.jpg', 'width': 640, 'height': 640}],
+        'tracks': {'total': len(items), 'offset': 0, 'limit': 50, 'items': items},
+    }
+
+
+class QuietServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Clients closing keep-alive connections early is expected here
+    def handle_error(self, request, client_address):
+        pass
+
+
+class FakeServices:
+    def __init__(self, tracks, api_latency=0.0, media_latency=0.0, media_size=64 * 1024):
+        self.tracks = tracks
+        self.api_latency = api_latency
+        self.media_latency = media_latency
+        self.media = os.urandom(media_size)
+        self.cover = b'\xff\xd8\xff\xe0' + os.urandom(32 * 1024)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def __enter__(self):
+        handler = functools.partial(FakeServicesHandler, self)
+        self._server = QuietServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def count(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+
+    def page(self, kind, query):
+        offset = int(query.get('offset', ['0'])[0])
+        limit = min(int(query.get('limit', ['20'])[0]), MAX_PAGE_SIZE[kind])
+        items = []
+        for index in range(offset, min(offset + limit, self.tracks)):
+            item = {'track': fake_track(index, self.base_url)}
+            if kind == 'saved':
+                # Newest first, like the real endpoint
+                item['added_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(2_000_000_000 - index * 60))
+            items.append(item)
+        return {'total': self.tracks, 'offset': offset, 'limit': limit, 'items': items}
+
+    @property
+    def albums(self):
+        return -(-self.tracks // ALBUM_SIZE)
+
+    # Page of the albums every artist has
+    def album_page(self, query):
+        offset = int(query.get('offset', ['0'])[0])
+        limit = min(int(query.get('limit', ['20'])[0]), MAX_PAGE_SIZE['artist_albums'])
+        items = [{'id': f'{album:022d}'} for album in range(offset, min(offset + limit, self.albums))]
+        return {'total': self.albums, 'offset': offset, 'limit': limit, 'items': items}
+
+
+class FakeServicesHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, services, *args, **kwargs):
+        self.services = services
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+        services = self.services
+
+        if parts[:2] == ['v1', 'playlists'] and len(parts) == 3:
+            services.count('spotify_playlist')
+            time.sleep(services.api_latency)
+            # Changes whenever the library size does
+            self.send_json({'snapshot_id': f'snapshot-{services.tracks}'})
+        elif parts[:2] == ['v1', 'playlists'] and len(parts) == 4:
+            services.count('spotify_playlist_page')
+            time.sleep(services.api_latency)
+            self.send_json(services.page('playlist', query))
+        elif parts == ['v1', 'me', 'tracks']:
+            services.count('spotify_saved_page')
+            time.sleep(services.api_latency)
+            self.send_json(services.page('saved', query))
+        elif parts == ['v1', 'tracks']:
+            services.count('spotify_tracks')
+            time.sleep(services.api_latency)
+            ids = query['ids'][0].split(',')
+            self.send_json({'tracks': [fake_track(int(id), services.base_url) if int(id) < services.tracks else None
+                                       for id in ids]})
+        elif parts == ['v1', 'albums']:
+            services.count('spotify_albums')
+            time.sleep(services.api_latency)
+            ids = query['ids'][0].split(',')
+            self.send_json({'albums': [fake_album(int(id), services.tracks, services.base_url)
+                                       if int(id) < services.albums else None for id in ids]})
+        elif parts[:2] == ['v1', 'artists'] and parts[3:] == ['albums']:
+            services.count('spotify_artist_albums')
+            time.sleep(services.api_latency)
+            self.send_json(services.album_page(query))
+        elif parts == ['search']:
+            services.count('search')
+            time.sleep(services.api_latency)
+            video_id = hashlib.sha1(query.get('q', [''])[0].encode('utf-8')).hexdigest()[:11]
+            self.send_json({'id': video_id})
+        elif parts[0] == 'cover' and len(parts) == 2:
+            services.count('cover')
+            time.sleep(services.api_latency)
+            self.send_body(services.cover, 'image/jpeg')
+        elif parts[0] == 'media' and len(parts) == 2:
+            services.count('media')
+            time.sleep(services.media_latency)
+            self.send_body(services.media, 'audio/mp4')
+        else:
+            services.count('not_found')
+            self.send_json({'error': {'status': 404, 'message': 'Not found'}}, status=404)
+
+    def send_json(self, data, status=200):
+        self.send_body(json.dumps(data).encode('utf-8'), 'application/json', status)
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
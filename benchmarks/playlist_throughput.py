@@ -0,0 +1,176 @@
+"""End-to-end batch throughput against local stand-in services.
+
+Runs the real Spotify paging and resolve / download / transcode pipeline
+against benchmarks.fake_services, so it needs no network access, and
+reports tracks per minute, time to the first finished track, peak RSS
+and the number of API calls per playlist size:
+
+    python -m benchmarks.playlist_throughput --sizes 100,1000,10000 --api-latency 0.05
+
+Every size runs in its own process so peak RSS is measured per run.
+The rate limiters are lifted unless --keep-rate-limits is given, so the
+numbers show the downloader's own overhead rather than the politeness
+delays towards the real services. Without ffmpeg on PATH the transcode
+step is replaced by a rename. The synthetic media is served as AAC in
+.m4a, so --audio-format m4a measures the passthrough path, which needs
+no ffmpeg at all. --trace PATH records every stage of every track
+(downloader.tracing) and writes one trace and stage summary per size,
+with the size appended to the file name.
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from functools import partial
+from urllib.parse import quote
+
+import spotipy
+
+from benchmarks.fake_services import PLAYLIST_ID, FakeServices
+from downloader import core, ratelimit
+from downloader.progress import ProgressAggregator
+from downloader.tracing import traced_run
+from downloader.spotify import iter_playlist_tracks, iter_saved_tracks
+from downloader.transcode import AUDIO_FORMATS, DEFAULT_AUDIO_FORMAT
+
+DEFAULT_SIZES = '100,1000,10000'
+
+# Limiter rate used when the limits are lifted
+UNLIMITED_RATE = 1e6
+
+
+def peak_rss_mib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+# Point the downloader at the stand-in services for this process
+def use_fake_services(services, keep_rate_limits, transcode):
+    base_url = services.base_url
+    if not keep_rate_limits:
+        for limiter in ratelimit.LIMITERS:
+            limiter.rate = limiter.max_rate = UNLIMITED_RATE
+            limiter.burst = limiter._tokens = UNLIMITED_RATE
+
+    def search_youtube(query, session, track=None):
+        with urllib.request.urlopen(f'{base_url}/search?q={quote(query)}') as response:
+            return json.load(response)['id']
+
+    def rename_only(source, output, acodec=None, bitrate=None):
+        os.replace(source, output)
+        return output
+
+    # The stand-in has one result per query, so there are no candidates to score
+    core.search_youtube = partial(ratelimit.YOUTUBE_SEARCH.call, search_youtube)
+    core.WATCH_URL = base_url + '/media/{}.m4a'
+    if not transcode:
+        core.finish_audio = rename_only
+    sp = spotipy.Spotify(auth='benchmark')
+    sp.prefix = base_url + '/v1/'
+    return sp
+
+
+def run_single(args):
+    """ Runs one benchmark in this process and returns its results. """
+    passthrough = args.audio_format == 'm4a'
+    transcode = passthrough or (shutil.which('ffmpeg') is not None and not args.no_transcode)
+    previous_dir = os.getcwd()
+    trace_path = None
+    if args.trace:
+        base, ext = os.path.splitext(os.path.abspath(args.trace))
+        trace_path = f'{base}-{args.tracks}{ext or ".json"}'
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Manifest, search cache and dead letters start empty in the work directory
+        os.chdir(work_dir)
+        with FakeServices(args.tracks, args.api_latency, args.media_latency, args.media_size) as services:
+            sp = use_fake_services(services, args.keep_rate_limits, transcode)
+            config = {'DOWNLOAD_PATH': os.path.join(work_dir, 'out'), 'CONCURRENCY': args.concurrency,
+                      'AUDIO_FORMAT': args.audio_format}
+            os.makedirs(config['DOWNLOAD_PATH'])
+            first_done = []
+
+            def on_complete(track, path):
+                if not first_done:
+                    first_done.append(time.perf_counter())
+
+            start = time.perf_counter()
+            if args.source == 'liked':
+                tracks = iter_saved_tracks(sp)
+            else:
+                tracks = iter_playlist_tracks(sp, PLAYLIST_ID)
+            with traced_run(trace_path), ProgressAggregator(render=False) as progress:
+                summary = core.download_tracks(tracks, config, on_complete=on_complete, progress=progress)
+            elapsed = time.perf_counter() - start
+            calls = dict(services.calls)
+        os.chdir(previous_dir)
+
+    return {
+        'tracks': args.tracks,
+        'source': args.source,
+        'succeeded': summary.succeeded,
+        'failed': len(summary.failed),
+        'seconds': elapsed,
+        'tracks_per_minute': summary.succeeded * 60 / elapsed if elapsed else 0.0,
+        'first_download_seconds': first_done[0] - start if first_done else None,
+        'peak_rss_mib': peak_rss_mib(),
+        'api_calls': calls,
+        'transcode': 'passthrough' if passthrough else 'ffmpeg' if transcode else 'rename',
+    }
+
+
+def print_table(results):
+    print(f'{"tracks":>8}{"ok":>8}{"failed":>8}{"seconds":>10}{"tracks/min":>12}{"first s":>10}{"peak MiB":>10}  api calls')
+    for result in results:
+        first = result['first_download_seconds']
+        calls = ' '.join(f'{name}={count}' for name, count in sorted(result['api_calls'].items()))
+        print(f'{result["tracks"]:>8}{result["succeeded"]:>8}{result["failed"]:>8}{result["seconds"]:>10.1f}'
+              f'{result["tracks_per_minute"]:>12.1f}{first if first is not None else float("nan"):>10.2f}'
+              f'{result["peak_rss_mib"]:>10.1f}  {calls}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated playlist sizes')
+    parser.add_argument('--source', choices=('playlist', 'liked'), default='playlist')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='seconds added to every API and search request')
+    parser.add_argument('--media-latency', type=float, default=0.0, help='seconds added before every media response')
+    parser.add_argument('--media-size', type=int, default=64 * 1024, help='synthetic audio size in bytes')
+    parser.add_argument('-j', '--concurrency', type=int, default=4)
+    parser.add_argument('--keep-rate-limits', action='store_true', help='keep the real services\' rate limits')
+    parser.add_argument('--no-transcode', action='store_true', help='rename instead of running ffmpeg')
+    parser.add_argument('--audio-format', choices=sorted(AUDIO_FORMATS), default=DEFAULT_AUDIO_FORMAT)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--trace', metavar='PATH', help='write a Chrome trace and stage summary of each size')
+    parser.add_argument('--tracks', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.tracks is not None:
+        print(json.dumps(run_single(args)))
+        return
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        command = [sys.executable, '-m', 'benchmarks.playlist_throughput', '--tracks', str(size)]
+        command += [arg for arg in sys.argv[1:] if arg != '--json']
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+        if not args.json:
+            print(f'{size} tracks done in {results[-1]["seconds"]:.1f} s', file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+        print(f'transcode: {results[0]["transcode"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Per-track overhead of a fresh YoutubeDL per download vs. a reused session.
+
+Serves a small synthetic audio file from a local HTTP server, so the
+numbers reflect yt-dlp setup and connection cost rather than the network:
+
+    python -m benchmarks.session_overhead --tracks 50
+"""
+
+import argparse
+import functools
+import http.server
+import os
+import tempfile
+import threading
+import time
+
+import yt_dlp
+
+from benchmarks.fake_services import QuietServer
+from downloader.session import DownloaderSession
+
+YDL_OPTS = {
+    'format': 'bestaudio/best',
+    'quiet': True,
+    'noprogress': True,
+}
+
+
+# Serve `directory` on a random local port in a background thread
+def start_server(directory):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = QuietServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_fresh(urls, out_dir):
+    start = time.perf_counter()
+    for index, url in enumerate(urls):
+        opts = dict(YDL_OPTS, outtmpl=os.path.join(out_dir, f'fresh-{index}.%(ext)s'))
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            ydl.extract_info(url, download=True)
+    return time.perf_counter() - start
+
+
+def bench_session(urls, out_dir):
+    start = time.perf_counter()
+    with DownloaderSession(YDL_OPTS) as session:
+        for index, url in enumerate(urls):
+            session.download(url, os.path.join(out_dir, f'session-{index}.%(ext)s'))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=30, help='downloads per variant')
+    parser.add_argument('--size', type=int, default=256 * 1024, help='synthetic file size in bytes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as media_dir, tempfile.TemporaryDirectory() as out_dir:
+        with open(os.path.join(media_dir, 'track.mp3'), 'wb') as file:
+            file.write(os.urandom(args.size))
+        server = start_server(media_dir)
+        # A distinct query string per track keeps yt-dlp from treating them as the same video
+        base = f'http://127.0.0.1:{server.server_address[1]}/track.mp3'
+        urls = [f'{base}?n={index}' for index in range(args.tracks)]
+        try:
+            fresh = bench_fresh(urls, out_dir)
+            reused = bench_session(urls, out_dir)
+        finally:
+            server.shutdown()
+
+    print(f'{"variant":<22}{"total s":>10}{"ms/track":>12}')
+    print(f'{"YoutubeDL per track":<22}{fresh:>10.2f}{fresh / args.tracks * 1000:>12.1f}')
+    print(f'{"reused session":<22}{reused:>10.2f}{reused / args.tracks * 1000:>12.1f}')
+    print(f'overhead saved per track: {(fresh - reused) / args.tracks * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
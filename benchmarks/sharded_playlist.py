@@ -0,0 +1,107 @@
+"""One playlist shared by several worker processes through a shard queue.
+
+Starts benchmarks.fake_services once, then runs the playlist with 1, 2, 4
+... worker processes that share a shard queue file (downloader.shard) and
+one work directory, as `playlist --shard` does on one host. Prints the
+wall time and the merged report of each run:
+
+    python -m benchmarks.sharded_playlist --tracks 400 --workers 1,2,4 --media-latency 0.2
+
+--kill-after SECONDS kills the first worker that long into every run
+with more than one worker, to show its leased batches being taken over by
+the others once the lease (--lease) runs out.
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_services import PLAYLIST_ID, FakeServices
+from benchmarks.playlist_throughput import use_fake_services
+from downloader import core
+from downloader.cli import batch_result
+from downloader.progress import ProgressAggregator
+from downloader.shard import ShardQueue, ShardWorker
+from downloader.spotify import iter_playlist_tracks
+
+DEFAULT_WORKERS = '1,2,4'
+
+
+# Stands in for FakeServices in a worker process, which only needs the server's address
+class RemoteServices:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+
+# Worker process: work on the shared job until it is done, print the merged report
+def run_worker(args):
+    os.chdir(args.work_dir)
+    sp = use_fake_services(RemoteServices(args.base_url), keep_rate_limits=False, transcode=False)
+    config = {'DOWNLOAD_PATH': os.path.join(args.work_dir, 'out'), 'CONCURRENCY': args.concurrency}
+
+    def download_batch(tracks):
+        with ProgressAggregator(render=False) as progress:
+            return batch_result(core.download_tracks(tracks, config, progress=progress))
+
+    with ShardQueue(args.queue, lease_seconds=args.lease) as queue:
+        worker = ShardWorker(queue, f'playlist:{PLAYLIST_ID}', args.batch_size)
+        report = worker.run(lambda: iter_playlist_tracks(sp, PLAYLIST_ID), download_batch)
+    print(json.dumps(report))
+
+
+def run_shared(args, services, workers):
+    """ Runs the playlist on `workers` processes and returns (seconds, report of the last worker to finish). """
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.makedirs(os.path.join(work_dir, 'out'))
+        command = [sys.executable, '-m', 'benchmarks.sharded_playlist', '--worker', '--base-url', services.base_url,
+                   '--work-dir', work_dir, '--queue', os.path.join(work_dir, 'shard.db'),
+                   '--batch-size', str(args.batch_size), '--lease', str(args.lease), '-j', str(args.concurrency)]
+        start = time.perf_counter()
+        processes = [subprocess.Popen(command, stdout=subprocess.PIPE, text=True) for _ in range(workers)]
+        if args.kill_after and workers > 1:
+            time.sleep(args.kill_after)
+            processes[0].send_signal(signal.SIGKILL)
+        reports = []
+        for process in processes:
+            output, _ = process.communicate()
+            if process.returncode == 0:
+                reports.append(json.loads(output.splitlines()[-1]))
+        elapsed = time.perf_counter() - start
+    return elapsed, reports[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=400, help='playlist size')
+    parser.add_argument('--workers', default=DEFAULT_WORKERS, help='comma-separated worker process counts')
+    parser.add_argument('--batch-size', type=int, default=25)
+    parser.add_argument('-j', '--concurrency', type=int, default=4, help='tracks at a time per worker')
+    parser.add_argument('--media-latency', type=float, default=0.2, help='seconds added before every media response')
+    parser.add_argument('--lease', type=float, default=5.0, help='lease time in seconds')
+    parser.add_argument('--kill-after', type=float, help='kill one worker this many seconds into each run')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--queue', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    print(f'{"workers":>8}{"seconds":>10}{"tracks/min":>12}{"ok":>6}{"skipped":>9}{"failed":>8}  batches per worker')
+    with FakeServices(args.tracks, media_latency=args.media_latency) as services:
+        for workers in (int(count) for count in args.workers.split(',')):
+            elapsed, report = run_shared(args, services, workers)
+            shares = ' '.join(str(share['batches']) for share in report['workers'].values())
+            print(f'{workers:>8}{elapsed:>10.1f}{report["succeeded"] * 60 / elapsed:>12.1f}{report["succeeded"]:>6}'
+                  f'{report["skipped"]:>9}{len(report["failed"]):>8}  {shares}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Shared building blocks for EnDownloader.py and TRDownloader.py."""
@@ -0,0 +1,450 @@
+"""The interactive downloader behind EnDownloader.py and TRDownloader.py.
+
+Both scripts call main() with their language; every prompt and message
+comes from downloader.messages. yt-dlp, spotipy and the download modules
+that depend on them are imported inside the functions that need them, so
+the menu, the settings and --help start without loading them.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from downloader import cli
+from downloader.bandwidth import BANDWIDTH, parse_rate
+from downloader.batch import DEFAULT_CONCURRENCY, DEFAULT_SEGMENTS, get_segments
+from downloader.messages import DEFAULT_LANGUAGE, catalogue
+from downloader.tracing import traced_run
+from downloader.tracks import Track
+from downloader.transcode import (AUDIO_FORMATS, DEFAULT_AUDIO_FORMAT, DEFAULT_MP3_BITRATE, audio_format_selector,
+                                  audio_settings)
+
+# Configuration file path
+CONFIG_FILE = 'config.json' # path to config
+
+# Default download path
+DEFAULT_DOWNLOAD_PATH = os.path.join(os.path.expanduser("~"), "Downloads")
+
+# Set by main()
+config = None
+text = catalogue(DEFAULT_LANGUAGE)
+
+# Load settings or return default values
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, 'r') as file:
+            config = json.load(file)
+            # Decode Unicode characters when loaded from JSON
+            config['DOWNLOAD_PATH'] = bytes(config['DOWNLOAD_PATH'], 'utf-8').decode('unicode_escape')
+            # Also expand ~ character
+            config['DOWNLOAD_PATH'] = os.path.expanduser(config['DOWNLOAD_PATH'])
+            config.setdefault('CONCURRENCY', DEFAULT_CONCURRENCY)
+            config.setdefault('METRICS_FILE', '')
+            config.setdefault('BANDWIDTH_LIMIT', '')
+            config.setdefault('JOB_BANDWIDTH_LIMITS', {})
+            config.setdefault('AUDIO_FORMAT', DEFAULT_AUDIO_FORMAT)
+            config.setdefault('AUDIO_BITRATE', DEFAULT_MP3_BITRATE)
+            config.setdefault('SEGMENTS', DEFAULT_SEGMENTS)
+            return config
+    else:
+        return {'CLIENT_ID': '', 'CLIENT_SECRET': '', 'DOWNLOAD_PATH': DEFAULT_DOWNLOAD_PATH,
+                'CONCURRENCY': DEFAULT_CONCURRENCY, 'METRICS_FILE': '',
+                'BANDWIDTH_LIMIT': '', 'JOB_BANDWIDTH_LIMITS': {},
+                'AUDIO_FORMAT': DEFAULT_AUDIO_FORMAT, 'AUDIO_BITRATE': DEFAULT_MP3_BITRATE,
+                'SEGMENTS': DEFAULT_SEGMENTS}
+
+# Save settings
+def save_config(config):
+    # Expand the path while saving
+    config['DOWNLOAD_PATH'] = os.path.expanduser(config['DOWNLOAD_PATH'])
+    # Properly encode Unicode characters when writing to JSON
+    with open(CONFIG_FILE, 'w') as file:
+        json.dump(config, file, indent=4, ensure_ascii=False)
+
+# Establish Spotify API connection
+def get_spotify_connection(client_id, client_secret):
+    import spotipy
+    from downloader import core
+    try:
+        return core.SPOTIFY.public(client_id, client_secret)
+    except spotipy.SpotifyException as e:
+        print(text('spotify_connection_error', error=e))
+        return None
+
+# Video/Audio downloader
+def choose_download_type():
+    while True:
+        download_type = input(text('prompt_download_type')).strip().lower()
+        if download_type in text('answers_video').split():
+            return 'video'
+        elif download_type in text('answers_audio').split():
+            return 'audio'
+        elif download_type == 'q':
+            return 'q'
+        else:
+            print(text('invalid_download_type'))
+
+def choose_video_quality():
+    while True:
+        print(text('video_quality_options'))
+        print("1. 144p")
+        print("2. 240p")
+        print("3. 360p")
+        print("4. 480p")
+        print("5. 720p")
+        print("6. 1080p")
+        print("7. 4K")
+        choice = input(text('prompt_video_quality')).strip().lower()
+        if choice == '1':
+            return 'bestvideo[height<=144]+bestaudio/best'
+        elif choice == '2':
+            return 'bestvideo[height<=240]+bestaudio/best'
+        elif choice == '3':
+            return 'bestvideo[height<=360]+bestaudio/best'
+        elif choice == '4':
+            return 'bestvideo[height<=480]+bestaudio/best'
+        elif choice == '5':
+            return 'bestvideo[height<=720]+bestaudio/best'
+        elif choice == '6':
+            return 'bestvideo[height<=1080]+bestaudio/best'
+        elif choice == '7':
+            return 'bestvideo[height<=2160]+bestaudio/best'
+        elif choice == 'q':
+            return None
+        else:
+            print(text('invalid_option_number'))
+
+# Bitrate in kbit/s for audio downloads
+def choose_audio_quality():
+    while True:
+        print(text('audio_quality_options'))
+        print(text('audio_quality_best'))
+        print(text('audio_quality_better'))
+        print(text('audio_quality_good'))
+        choice = input(text('prompt_audio_quality')).strip().lower()
+        if choice == '1':
+            return '320'
+        elif choice == '2':
+            return '192'
+        elif choice == '3':
+            return '128'
+        elif choice == 'q':
+            return None
+        else:
+            print(text('invalid_option_number'))
+
+# Download a URL; with audio_bitrate as audio only, re-encoded only if the stream isn't in output_format already
+def download_media(url, quality, output_format, audio_bitrate=None):
+    import yt_dlp
+    from downloader import core
+    from downloader.progress import Throttle
+
+    if audio_bitrate is not None:
+        quality = audio_format_selector(output_format, audio_bitrate)
+
+    # Print at most one progress line per refresh interval; yt-dlp calls the hook far more often
+    throttle = Throttle()
+
+    def progress_hook(d):
+        if d['status'] == 'finished':
+            print(text('media_download_complete'))
+        elif d['status'] == 'downloading' and throttle.ready():
+            percent = d.get('_percent_str', '?').strip()
+            total = (d.get('_total_bytes_str') or d.get('_total_bytes_estimate_str') or '?').strip()
+            print(text('media_downloading', percent=percent, total=total))
+
+    try:
+        with BANDWIDTH.job('media') as bandwidth:
+            core.download_media(url, quality, output_format, text('media_output_path'), [progress_hook], bandwidth,
+                                audio_bitrate, get_segments(config))
+    except yt_dlp.DownloadError as e:
+        print(text('media_download_error', error=e))
+
+# Get tracks from Spotify playlist, from the local cache when the playlist hasn't changed
+def get_playlist_tracks(sp, playlist_id, on_total=None):
+    from downloader.spotify import iter_playlist_tracks
+    from downloader.spotify_cache import SpotifyCache
+    with SpotifyCache() as cache:
+        yield from iter_playlist_tracks(sp, playlist_id, on_total=on_total, cache=cache)
+
+# Read Spotify IDs of `kind` (IDs, URLs or URIs, separated by spaces); None to quit or on an invalid entry
+def input_spotify_ids(prompt, kind):
+    from downloader.spotify import spotify_id
+    values = input(text(prompt)).split()
+    if not values or values[0].lower() == 'q':
+        return None
+    try:
+        return [spotify_id(value, kind) for value in values]
+    except ValueError:
+        print(text('spotify_invalid_link', value=' '.join(values)))
+        return []
+
+# Download a single track, by name and artist or by its Spotify URL
+def download_single_track(sp):
+    from downloader import core
+    from downloader.search_cache import SearchCache
+    from downloader.spotify import iter_tracks_by_id, parse_spotify_link, spotify_id
+    while True:
+        track_name = input(text('prompt_song_name'))
+        if track_name.lower() == 'q':
+            return
+        if parse_spotify_link(track_name):
+            try:
+                # A Spotify track brings everything to tag the song with, and no prompts are needed
+                found = list(iter_tracks_by_id(sp, [spotify_id(track_name, 'track')]))
+            except ValueError:
+                print(text('spotify_invalid_link', value=track_name))
+                continue
+            if not found:
+                print(text('spotify_track_not_found', value=track_name))
+                continue
+            track = found[0]
+            track_name, artist_name = track.name, track.artist
+            match = True
+        else:
+            artist_name = input(text('prompt_artist_name'))
+            if artist_name.lower() == 'q':
+                return
+            # Only the title and artist are known to tag the song with
+            track = Track(None, track_name, artist_name, None, None, None)
+            # ...and nothing to score search results against, so the first one is taken
+            match = False
+        query = f"{track_name} {artist_name}"
+        audio_format, bitrate = audio_settings(config)
+        filename = core.song_filename(track_name, artist_name, audio_format)
+        download_path = os.path.join(config['DOWNLOAD_PATH'], filename)
+        print(text('track_downloading', query=query, filename=filename))
+        with SearchCache() as search_cache, BANDWIDTH.job('track') as bandwidth:
+            video_id = core.search_youtube_and_download(query, download_path, search_cache, bandwidth, bitrate,
+                                                        track=track, match=match)
+        if video_id is None:
+            print(text('track_no_match' if match else 'track_not_found', query=query))
+            continue
+        print(text('track_download_complete', filename=filename))
+
+# Download Spotify tracks through the pipeline with one throttled progress line, then print a summary
+def download_tracks(fetch_tracks, kind):
+    from downloader import core
+    from downloader.progress import ProgressAggregator
+    with ProgressAggregator(metrics_path=config['METRICS_FILE'] or None) as progress, \
+            BANDWIDTH.job(kind) as bandwidth:
+        summary = core.download_tracks(fetch_tracks(progress.set_total), config, progress=progress,
+                                       bandwidth=bandwidth)
+    print_batch_summary(summary)
+
+# Print per-track results of a batch
+def print_batch_summary(summary):
+    print(text('batch_finished', succeeded=summary.succeeded, failed=len(summary.failed), skipped=summary.skipped))
+    for track, error in summary.failed:
+        print(text('batch_failed_track', name=track.name, artist=track.artist, error=error))
+    print(text('batch_search_cache', hits=summary.search_hits, misses=summary.search_misses))
+    if summary.claim_waits:
+        print(text('batch_claim_waits', waited=summary.claim_waits, taken_over=summary.claim_takeovers))
+
+# Download playlist
+def download_playlist(sp):
+    while True:
+        playlist_ids = input_spotify_ids('prompt_playlist_id', 'playlist')
+        if playlist_ids is None:
+            return
+        for playlist_id in playlist_ids:
+            download_tracks(lambda on_total: get_playlist_tracks(sp, playlist_id, on_total), 'playlist')
+
+# Download albums; all of them are looked up together, 20 albums and 50 tracks per request
+def download_albums(sp):
+    from downloader.spotify import iter_album_tracks
+    while True:
+        album_ids = input_spotify_ids('prompt_album_ids', 'album')
+        if album_ids is None:
+            return
+        if album_ids:
+            download_tracks(lambda on_total: iter_album_tracks(sp, album_ids, on_total=on_total), 'album')
+
+# Download an artist's albums and singles
+def download_artist(sp):
+    from downloader.spotify import iter_artist_tracks
+    while True:
+        artist_ids = input_spotify_ids('prompt_artist_id', 'artist')
+        if artist_ids is None:
+            return
+        for artist_id in artist_ids:
+            download_tracks(lambda on_total: iter_artist_tracks(sp, artist_id, on_total=on_total), 'artist')
+
+# Update settings
+def update_settings():
+    global config
+    print(text('settings_title'))
+
+    client_id = input(text('prompt_client_id', current=config['CLIENT_ID']))
+    if client_id:
+        config['CLIENT_ID'] = client_id
+
+    client_secret = input(text('prompt_client_secret', current=config['CLIENT_SECRET']))
+    if client_secret:
+        config['CLIENT_SECRET'] = client_secret
+
+    download_path = input(text('prompt_download_path', current=config['DOWNLOAD_PATH']))
+    if download_path:
+        config['DOWNLOAD_PATH'] = download_path
+    else:
+        config['DOWNLOAD_PATH'] = DEFAULT_DOWNLOAD_PATH
+
+    concurrency = input(text('prompt_concurrency', current=config['CONCURRENCY']))
+    if concurrency.isdigit() and int(concurrency) > 0:
+        config['CONCURRENCY'] = int(concurrency)
+
+    audio_format = input(text('prompt_audio_format', formats=', '.join(AUDIO_FORMATS),
+                              current=config['AUDIO_FORMAT'])).strip().lower()
+    if audio_format in AUDIO_FORMATS:
+        config['AUDIO_FORMAT'] = audio_format
+
+    bandwidth_limit = input(text('prompt_bandwidth_limit', current=config['BANDWIDTH_LIMIT'] or '-'))
+    if bandwidth_limit:
+        try:
+            parse_rate(bandwidth_limit)
+            config['BANDWIDTH_LIMIT'] = '' if bandwidth_limit == '0' else bandwidth_limit
+        except ValueError:
+            print(text('invalid_bandwidth_limit'))
+
+    save_config(config)
+    BANDWIDTH.apply_config(config)
+    print(text('settings_updated'))
+
+# DOWNLOAD LIKED SONGS
+def get_spotify_connection_liked():
+    from downloader import core
+    return core.SPOTIFY.user(config['CLIENT_ID'], config['CLIENT_SECRET'])
+
+# Get liked songs; only the ones added since the last run are fetched
+def get_liked_songs_liked(sp, on_total=None):
+    from downloader.spotify import iter_saved_tracks
+    from downloader.spotify_cache import SpotifyCache
+    with SpotifyCache() as cache:
+        yield from iter_saved_tracks(sp, on_total=on_total, cache=cache)
+
+def download_liked_songs(sp):
+    download_tracks(lambda on_total: get_liked_songs_liked(sp, on_total), 'liked')
+
+def verify_manifest():
+    from downloader.manifest import Manifest
+    with Manifest() as manifest:
+        checked, missing = manifest.verify(repair=True)
+    for row in missing:
+        print(text('manifest_missing_file', path=row['path']))
+    print(text('manifest_checked', checked=checked, missing=len(missing)))
+
+# Main menu
+def main_menu():
+    while True:
+        os.system('cls' if os.name == 'nt' else 'clear')
+        print(text('menu_title'))
+        print(text('menu_media'))
+        print(text('menu_spotify'))
+        print(text('menu_liked'))
+        print(text('menu_settings'))
+        print(text('menu_verify'))
+        print(text('menu_exit'))
+
+        choice = input(text('prompt_menu')).strip().upper()
+
+        try:
+            if choice == '1':
+                download_type = choose_download_type()
+                if not download_type:
+                    print(text('exiting_program'))
+                    exit()
+
+                if download_type == 'video':
+                    quality = choose_video_quality()
+                    if not quality:
+                        print(text('exiting_program'))
+                        exit()
+
+                    output_format = input(text('prompt_output_format')).strip()
+                    video_url = input(text('prompt_media_url')).strip()
+                    download_media(video_url, quality, output_format)
+
+                elif download_type == 'audio':
+                    bitrate = choose_audio_quality()
+                    if not bitrate:
+                        print(text('exiting_program'))
+                        exit()
+
+                    output_format, _ = audio_settings(config)
+                    video_url = input(text('prompt_media_url')).strip()
+                    download_media(video_url, None, output_format, bitrate)
+
+            elif choice == '2':
+                if not config['CLIENT_ID'] or not config['CLIENT_SECRET']:
+                    print(text('credentials_missing'))
+                    update_settings()
+                else:
+                    sp = get_spotify_connection(config['CLIENT_ID'], config['CLIENT_SECRET'])
+                    if sp:
+                        action = input(text('prompt_spotify_action')).strip()
+                        if action == '1':
+                            download_single_track(sp)
+                        elif action == '2':
+                            download_playlist(sp)
+                        elif action == '3':
+                            download_albums(sp)
+                        elif action == '4':
+                            download_artist(sp)
+                        else:
+                            print(text('invalid_selection'))
+
+            elif choice == '3':
+                sp = get_spotify_connection_liked()
+                if sp:
+                    download_liked_songs(sp)
+
+            elif choice == '4':
+                update_settings()
+            elif choice == '5':
+                verify_manifest()
+            elif choice == 'Q':
+                print(text('exiting'))
+                break
+            else:
+                print(text('invalid_selection_retry'))
+        except Exception as e:
+            print(text('error', error=e))
+
+# Load settings with the command line overrides applied
+def load_config_with_args(args):
+    config = load_config()
+    if args.concurrency:
+        config['CONCURRENCY'] = max(1, args.concurrency)
+    if args.metrics:
+        config['METRICS_FILE'] = args.metrics
+    return config
+
+# Main execution
+def main(language=DEFAULT_LANGUAGE):
+    global config, text
+    text = catalogue(language)
+
+    parser = argparse.ArgumentParser(description=text('arg_description'))
+    parser.add_argument('-j', '--concurrency', type=int, help=text('arg_concurrency'))
+    parser.add_argument('--verify-manifest', action='store_true', help=text('arg_verify_manifest'))
+    parser.add_argument('--metrics', metavar='PATH', help=text('arg_metrics'))
+    parser.add_argument('--trace', metavar='PATH', help=text('arg_trace'))
+    parser.add_argument('--profile', metavar='PATH', help=text('arg_profile'))
+    cli.add_commands(parser, text)
+    args = parser.parse_args()
+
+    config = load_config_with_args(args)
+    # Limits edited in config.json take effect without a restart
+    BANDWIDTH.apply_config(config)
+    BANDWIDTH.watch(CONFIG_FILE)
+    with traced_run(args.trace, args.profile):
+        if args.command == 'serve':
+            from downloader import daemon
+            sys.exit(daemon.serve(args, lambda: load_config_with_args(args), text('media_output_path'), text))
+        elif args.command:
+            sys.exit(cli.run(args, config, text('media_output_path')))
+        elif args.verify_manifest:
+            verify_manifest()
+        else:
+            main_menu()
@@ -0,0 +1,264 @@
+"""Global download bandwidth budget with priorities and per-job caps.
+
+Every download belongs to a job: an interactive single track, a playlist
+or liked-songs batch, or a media URL. The bytes all jobs receive come out
+of one shared budget (BANDWIDTH_LIMIT in config.json). When downloads
+compete, the job with the most urgent priority is served first, and jobs
+of the same priority share the budget fairly by the bytes each has been
+given. A job can also be capped on its own (JOB_BANDWIDTH_LIMITS, by job
+type). Both settings are re-read from config.json while the tool runs.
+
+Shaping happens in a yt-dlp progress hook, which yt-dlp calls after every
+block it reads: the hook blocks until the budget covers that block. The
+same hook stops the downloads of a job that was cancelled.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Priorities, most urgent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Priority of each job type; playlist, album and artist syncs and media URLs share the bulk class
+JOB_PRIORITIES = {
+    'track': PRIORITY_INTERACTIVE,
+    'playlist': PRIORITY_BULK,
+    'liked': PRIORITY_BULK,
+    'album': PRIORITY_BULK,
+    'artist': PRIORITY_BULK,
+    'media': PRIORITY_BULK,
+}
+
+# Seconds of traffic a bucket may save up while downloads are idle
+BURST_SECONDS = 0.5
+
+# How often config.json is checked for new limits
+RELOAD_INTERVAL = 2.0
+
+# yt-dlp read size while shaping; small blocks keep the traffic smooth
+SHAPED_OPTS = {
+    'buffersize': 256 * 1024,
+    'noresizebuffer': True,
+}
+
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(value):
+    """ Bytes per second from a number or a string like '512K' or '2.5M'; 0 means unlimited. """
+    if value in (None, ''):
+        return 0
+    if isinstance(value, (int, float)):
+        return max(0, int(value))
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?\s*', str(value), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f'invalid bandwidth limit: {value!r}')
+    return int(float(match.group(1)) * UNITS[match.group(2).upper()])
+
+
+# Raised in the downloads of a cancelled job; like yt-dlp's expected errors it is never retried
+class JobCancelled(Exception):
+    expected = True
+
+
+class _Bucket:
+    """ Token bucket in bytes that may go into debt by one block. """
+
+    def __init__(self):
+        self.rate = 0
+        self.tokens = 0.0
+        self.refilled_at = time.monotonic()
+
+    def set_rate(self, rate):
+        if rate != self.rate:
+            self.rate = rate
+            self.tokens = min(self.tokens, rate * BURST_SECONDS)
+
+    def refill(self, now):
+        if self.rate:
+            self.tokens = min(self.rate * BURST_SECONDS, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    # Seconds until the bucket is out of debt; 0 when unlimited
+    def wait_time(self):
+        if not self.rate or self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def take(self, nbytes):
+        if self.rate:
+            self.tokens -= nbytes
+
+
+class BandwidthJob:
+    """ One job's share of the budget; use its hook as a yt-dlp progress hook. """
+
+    def __init__(self, budget, kind, priority, cap=None):
+        self.budget = budget
+        self.kind = kind
+        self.priority = priority
+        self.cap = cap
+        self.served = 0
+        self.bytes = 0
+        self._bucket = _Bucket()
+        self._downloaded = {}
+        self._lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+    # Own cap if one was given, otherwise the configured cap for the job type
+    def cap_rate(self):
+        return self.cap if self.cap is not None else self.budget.job_caps.get(self.kind, 0)
+
+    # Abort the job's running downloads at their next block
+    def cancel(self):
+        self.cancelled.set()
+
+    def hook(self, d):
+        if self.cancelled.is_set():
+            raise JobCancelled(f'{self.kind} job cancelled')
+        key = d.get('tmpfilename') or d.get('filename')
+        with self._lock:
+            if d['status'] != 'downloading':
+                self._downloaded.pop(key, None)
+                return
+            # Segment and fragment threads of one file report the same running total,
+            # not always in order; only growth counts
+            downloaded = d.get('downloaded_bytes') or 0
+            previous = self._downloaded.get(key, 0)
+            self._downloaded[key] = max(previous, downloaded)
+        self.budget.consume(self, downloaded - previous)
+
+
+class BandwidthBudget:
+    def __init__(self, rate=0):
+        self.job_caps = {}
+        self.bytes = 0
+        self._bucket = _Bucket()
+        self._bucket.set_rate(rate)
+        self._jobs = []
+        self._waiting = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._config_path = None
+        self._config_mtime = None
+        self._checked_at = 0.0
+
+    @property
+    def rate(self):
+        return self._bucket.rate
+
+    # Change the limits, e.g. from the settings menu; running downloads follow right away
+    def configure(self, rate, job_caps=None):
+        with self._condition:
+            self._bucket.set_rate(rate)
+            if job_caps is not None:
+                self.job_caps = dict(job_caps)
+            self._condition.notify_all()
+
+    # Apply BANDWIDTH_LIMIT and JOB_BANDWIDTH_LIMITS from a config dict
+    def apply_config(self, config):
+        caps = {kind: parse_rate(value) for kind, value in (config.get('JOB_BANDWIDTH_LIMITS') or {}).items()}
+        self.configure(parse_rate(config.get('BANDWIDTH_LIMIT')), caps)
+
+    # Re-read the limits from a config file whenever it changes
+    def watch(self, path):
+        self._config_path = path
+        self._config_mtime = None
+        self._reload()
+
+    def _reload(self):
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self._config_path).st_mtime
+            if mtime == self._config_mtime:
+                return
+            with open(self._config_path, 'r') as file:
+                config = json.load(file)
+            self._config_mtime = mtime
+            self.apply_config(config)
+        except (OSError, ValueError):
+            # Missing or half-written config: keep the limits in force
+            pass
+
+    @contextmanager
+    def job(self, kind, cap=None):
+        """ Registers a job of `kind` (see JOB_PRIORITIES) for the duration of the block. """
+        job = BandwidthJob(self, kind, JOB_PRIORITIES.get(kind, PRIORITY_BULK), cap)
+        with self._condition:
+            # A new job starts level with its peers instead of catching up on their history
+            peers = [other.served for other in self._jobs if other.priority == job.priority]
+            job.served = min(peers) if peers else 0
+            self._jobs.append(job)
+        try:
+            yield job
+        finally:
+            with self._condition:
+                self._jobs.remove(job)
+                self._condition.notify_all()
+
+    def consume(self, job, nbytes):
+        """ Blocks until `nbytes` received for `job` fit into the budget and the job's cap. """
+        if nbytes <= 0:
+            return
+        if self._config_path is not None and time.monotonic() - self._checked_at > RELOAD_INTERVAL:
+            self._reload()
+        with self._condition:
+            job._bucket.set_rate(job.cap_rate())
+            if not self._bucket.rate and not job._bucket.rate:
+                self._grant(job, nbytes)
+                return
+            # A job that sat idle doesn't get to make up for it in one burst
+            peers = [other.served for _, other in self._waiting if other.priority == job.priority]
+            if peers:
+                job.served = max(job.served, min(peers))
+            self._sequence += 1
+            request = (self._sequence, job)
+            self._waiting.append(request)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._bucket.refill(now)
+                    job._bucket.set_rate(job.cap_rate())
+                    for _, waiting_job in self._waiting:
+                        waiting_job._bucket.refill(now)
+                    if self._next_request() is request and self._bucket.wait_time() == 0:
+                        self._grant(job, nbytes)
+                        return
+                    self._condition.wait(self._wait_time())
+            finally:
+                self._waiting.remove(request)
+                self._condition.notify_all()
+
+    # The request served next: most urgent priority, then fewest bytes served, then first come;
+    # requests whose job is over its own cap let the others go ahead
+    def _next_request(self):
+        ready = [request for request in self._waiting if request[1]._bucket.wait_time() == 0]
+        if not ready:
+            return None
+        return min(ready, key=lambda request: (request[1].priority, request[1].served, request[0]))
+
+    def _wait_time(self):
+        waits = [self._bucket.wait_time()] + [job._bucket.wait_time() for _, job in self._waiting]
+        waits = [wait for wait in waits if wait > 0]
+        return min(waits) if waits else None
+
+    def _grant(self, job, nbytes):
+        self._bucket.take(nbytes)
+        job._bucket.take(nbytes)
+        job.served += nbytes
+        job.bytes += nbytes
+        self.bytes += nbytes
+
+    # Short human-readable state for progress output
+    def status(self):
+        with self._condition:
+            return f'bandwidth {self._bucket.rate / 1024 ** 2:.1f} MiB/s {len(self._waiting)} waiting'
+
+
+# Shared by every download in the process
+BANDWIDTH = BandwidthBudget()
@@ -0,0 +1,57 @@
+"""Concurrency settings and results of playlist and liked-songs batches."""
+
+import threading
+
+# Default number of tracks processed at the same time
+DEFAULT_CONCURRENCY = 4
+
+# Default number of connections for one large media download
+DEFAULT_SEGMENTS = 4
+
+
+# Per-track outcome of a batch run
+class BatchSummary:
+    def __init__(self):
+        self.succeeded = 0
+        self.skipped = 0
+        self.failed = []
+        self.search_hits = 0
+        self.search_misses = 0
+        # Tracks that waited for a recording another worker was fetching, and those downloaded anyway in the end
+        self.claim_waits = 0
+        self.claim_takeovers = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, item):
+        with self._lock:
+            self.succeeded += 1
+
+    def record_skipped(self, item):
+        with self._lock:
+            self.skipped += 1
+
+    def record_failure(self, item, error):
+        with self._lock:
+            self.failed.append((item, error))
+
+    @property
+    def total(self):
+        return self.succeeded + len(self.failed)
+
+
+# Read the concurrency from config, falling back to the default for bad values
+def get_concurrency(config):
+    try:
+        concurrency = int(config.get('CONCURRENCY', DEFAULT_CONCURRENCY))
+    except (TypeError, ValueError):
+        return DEFAULT_CONCURRENCY
+    return max(1, concurrency)
+
+
+# Read the connections per media download from config, or `override` when given
+def get_segments(config, override=None):
+    try:
+        segments = int(override or config.get('SEGMENTS', DEFAULT_SEGMENTS))
+    except (TypeError, ValueError):
+        return DEFAULT_SEGMENTS
+    return max(1, segments)
@@ -0,0 +1,410 @@
+"""Headless command line for cron jobs and job runners.
+
+Besides the interactive menu, both downloader scripts accept these
+subcommands:
+
+    EnDownloader.py url URL [--audio] [--height 1080] [--format mp4] [--bitrate 192] [--segments 4]
+    EnDownloader.py track NAME ARTIST [--bitrate 192]
+    EnDownloader.py track TRACK_URL [--bitrate 192]
+    EnDownloader.py tracks TRACK_ID...
+    EnDownloader.py playlist PLAYLIST_ID [--shard QUEUE.db] [--batch-size 50]
+    EnDownloader.py album ALBUM_ID... [--shard QUEUE.db] [--batch-size 50]
+    EnDownloader.py artist ARTIST_ID [--shard QUEUE.db] [--batch-size 50]
+    EnDownloader.py liked [--shard QUEUE.db] [--batch-size 50]
+    EnDownloader.py jobs [FILE]      # JSONL, one job per line; stdin when FILE is omitted or '-'
+    EnDownloader.py serve [--listen 127.0.0.1:8765 | --socket PATH] [--workers 2]
+
+Spotify IDs may also be given as open.spotify.com URLs or spotify: URIs;
+album and artist jobs download every track of the albums or of the
+artist's albums and singles.
+
+A job line is an object with a "type" of url, track, tracks, playlist,
+album, artist or liked and the same fields as the matching subcommand, e.g.
+{"type": "playlist", "id": "37i9dQZF1DXcBWIGoYBM5M"} or
+{"type": "album", "ids": ["4aawyAB9vmqN3uQ7FjRGTy"]}, and optionally a
+"bandwidth" cap like "2M" (--bandwidth). Jobs run one after another as
+they are read. --report writes a JSON report of every job ('-' for
+stdout) and the exit status tells how the run went.
+
+With --shard (a "shard" field in a job line) a playlist, album, artist
+or liked-songs job is shared with every other worker, on this host or another, that runs
+it with the same queue file; each reports the merged result of all of
+them (see downloader.shard). serve keeps running
+and takes the same jobs over a local HTTP API (see downloader.daemon).
+"""
+
+import argparse
+import json
+import os
+import sys
+from contextlib import nullcontext
+
+from downloader.bandwidth import BANDWIDTH, JobCancelled, parse_rate
+from downloader.batch import get_segments
+from downloader.tracks import Track
+from downloader.transcode import AUDIO_BITRATES, audio_format_selector, audio_settings
+
+# Exit statuses; when several apply the highest one wins
+EXIT_OK = 0          # every job succeeded
+EXIT_FAILED = 1      # at least one job or track failed
+EXIT_INVALID = 2     # bad arguments or an unreadable job line (argparse uses 2 as well)
+EXIT_CONFIG = 3      # Spotify credentials are missing
+
+STATUS_OK = 'ok'
+STATUS_FAILED = 'failed'
+STATUS_INVALID = 'invalid'
+
+# Fields every job type needs
+JOB_FIELDS = {
+    'url': ('url',),
+    'track': ('name', 'artist'),
+    'tracks': ('ids',),
+    'playlist': ('id',),
+    'album': ('ids',),
+    'artist': ('id',),
+    'liked': (),
+}
+
+VIDEO_HEIGHTS = (144, 240, 360, 480, 720, 1080, 2160)
+
+# Bandwidth job type (downloader.bandwidth) of each job type
+JOB_BANDWIDTH_KINDS = {
+    'url': 'media',
+    'track': 'track',
+    'tracks': 'track',
+    'playlist': 'playlist',
+    'album': 'album',
+    'artist': 'artist',
+    'liked': 'liked',
+}
+
+
+class ConfigError(Exception):
+    pass
+
+
+# Add the headless subcommands to the script's argument parser, with help from the `text` message catalogue
+def add_commands(parser, text):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--report', metavar='PATH', help=text('arg_report'))
+    common.add_argument('--bandwidth', metavar='RATE', help=text('arg_bandwidth'))
+
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    url = commands.add_parser('url', parents=[common], help=text('arg_command_url'))
+    url.add_argument('url')
+    url.add_argument('--audio', action='store_true', help=text('arg_audio'))
+    url.add_argument('--height', type=int, choices=VIDEO_HEIGHTS, default=1080, help=text('arg_height'))
+    url.add_argument('--format', help=text('arg_format'))
+    url.add_argument('--bitrate', choices=AUDIO_BITRATES, help=text('arg_audio_bitrate'))
+    url.add_argument('--segments', type=int, help=text('arg_segments'))
+
+    track = commands.add_parser('track', parents=[common], help=text('arg_command_track'))
+    track.add_argument('name', help=text('arg_track_name'))
+    track.add_argument('artist', nargs='?')
+    track.add_argument('--bitrate', choices=AUDIO_BITRATES, help=text('arg_bitrate'))
+
+    tracks = commands.add_parser('tracks', parents=[common], help=text('arg_command_tracks'))
+    tracks.add_argument('ids', nargs='+', metavar='ID')
+
+    # Options of the jobs that can be shared between workers
+    sharded = argparse.ArgumentParser(add_help=False)
+    sharded.add_argument('--shard', metavar='QUEUE', help=text('arg_shard'))
+    sharded.add_argument('--batch-size', type=int, help=text('arg_batch_size'))
+
+    playlist = commands.add_parser('playlist', parents=[common, sharded], help=text('arg_command_playlist'))
+    playlist.add_argument('id')
+
+    album = commands.add_parser('album', parents=[common, sharded], help=text('arg_command_album'))
+    album.add_argument('ids', nargs='+', metavar='ID')
+
+    artist = commands.add_parser('artist', parents=[common, sharded],
+                                 help=text('arg_command_artist'))
+    artist.add_argument('id')
+
+    commands.add_parser('liked', parents=[common, sharded], help=text('arg_command_liked'))
+
+    jobs = commands.add_parser('jobs', parents=[common], help=text('arg_command_jobs'))
+    jobs.add_argument('file', nargs='?', default='-')
+
+    serve = commands.add_parser('serve', help=text('arg_command_serve'))
+    address = serve.add_mutually_exclusive_group()
+    address.add_argument('--listen', metavar='HOST:PORT', help=text('arg_listen'))
+    address.add_argument('--socket', metavar='PATH', help=text('arg_socket'))
+    serve.add_argument('--workers', type=int, default=2, help=text('arg_workers'))
+
+
+# Turn parsed subcommand arguments into a job
+def job_from_args(args):
+    if args.command == 'url':
+        job = {'type': 'url', 'url': args.url, 'audio': args.audio, 'height': args.height}
+        if args.format:
+            job['format'] = args.format
+        if args.bitrate:
+            job['bitrate'] = args.bitrate
+        if args.segments:
+            job['segments'] = args.segments
+        return job
+    if args.command == 'track':
+        from downloader.spotify import parse_spotify_link
+        if args.artist is not None:
+            job = {'type': 'track', 'name': args.name, 'artist': args.artist}
+        elif parse_spotify_link(args.name):
+            job = {'type': 'tracks', 'ids': [args.name]}
+        else:
+            raise ValueError('ARTIST is required unless NAME is a Spotify track URL')
+        if args.bitrate:
+            job['bitrate'] = args.bitrate
+        return job
+    if args.command == 'tracks':
+        return {'type': 'tracks', 'ids': args.ids}
+    if args.command == 'playlist':
+        job = {'type': 'playlist', 'id': args.id}
+    elif args.command == 'album':
+        job = {'type': 'album', 'ids': args.ids}
+    elif args.command == 'artist':
+        job = {'type': 'artist', 'id': args.id}
+    else:
+        job = {'type': 'liked'}
+    if args.shard:
+        job['shard'] = args.shard
+    if args.batch_size:
+        job['batch_size'] = args.batch_size
+    return job
+
+
+# Parse and validate one JSONL job line; raises ValueError
+def parse_job(line):
+    job = json.loads(line)
+    if not isinstance(job, dict):
+        raise ValueError('job must be a JSON object')
+    fields = JOB_FIELDS.get(job.get('type'))
+    if fields is None:
+        raise ValueError(f"unknown job type: {job.get('type')!r}")
+    missing = [field for field in fields if not job.get(field)]
+    if missing:
+        raise ValueError(f"missing field(s): {', '.join(missing)}")
+    if 'ids' in fields and not isinstance(job['ids'], list):
+        raise ValueError('ids must be a list')
+    return job
+
+
+# Yield (job, error) for every non-empty line of a JSONL stream as it is read
+def iter_job_lines(stream):
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            yield parse_job(line), None
+        except ValueError as e:
+            yield {'line': line}, str(e)
+
+
+def _require_credentials(config):
+    if not config['CLIENT_ID'] or not config['CLIENT_SECRET']:
+        raise ConfigError('Spotify CLIENT_ID and CLIENT_SECRET are not set in config.json')
+
+
+# Report entry of a BatchSummary, as a batch job reports it and a shard worker stores it per batch
+def batch_result(summary):
+    return {
+        'succeeded': summary.succeeded,
+        'skipped': summary.skipped,
+        'failed': [{'id': track.id, 'name': track.name, 'artist': track.artist, 'error': str(error)}
+                   for track, error in summary.failed],
+        'search_cache': {'hits': summary.search_hits, 'misses': summary.search_misses},
+        'claim_waits': {'waited': summary.claim_waits, 'taken_over': summary.claim_takeovers},
+    }
+
+
+# Run a batch job; progress goes only to the metrics file, stderr is kept for job status lines
+def _download_tracks(fetch_tracks, config, bandwidth, search_sessions=None):
+    from downloader import core
+    from downloader.progress import ProgressAggregator
+    with ProgressAggregator(metrics_path=config.get('METRICS_FILE') or None, render=False) as progress:
+        return core.download_tracks(fetch_tracks(progress.set_total), config, progress=progress, bandwidth=bandwidth,
+                                    search_sessions=search_sessions)
+
+
+# Spotify IDs of a job's `ids` or `id` field, which may also hold URLs or URIs; raises ValueError
+def job_spotify_ids(job, kind):
+    from downloader.spotify import spotify_id
+    return [spotify_id(value, kind) for value in job.get('ids') or [job['id']]]
+
+
+# Playlist or saved tracks through the local Spotify metadata cache
+def _iter_cached(iter_spotify_tracks, *args, **kwargs):
+    from downloader.spotify_cache import SpotifyCache
+    with SpotifyCache() as cache:
+        yield from iter_spotify_tracks(*args, cache=cache, **kwargs)
+
+
+# Register the downloader.bandwidth job a job runs as; a "bandwidth" field such as "2M" caps it,
+# otherwise the cap for its type from JOB_BANDWIDTH_LIMITS applies
+def job_bandwidth(job):
+    cap = parse_rate(job['bandwidth']) if job.get('bandwidth') else None
+    return BANDWIDTH.job(JOB_BANDWIDTH_KINDS[job['type']], cap)
+
+
+def run_job(job, config, media_path, bandwidth=None, spotify=None, search_sessions=None):
+    """ Runs one job and returns its result entry for the report.
+
+    A long-running caller passes the bandwidth job to cancel it through,
+    and a core.SpotifyClients and search SessionPool it keeps between jobs.
+    By default the bandwidth job and the pool are created for this job
+    alone, and the process-wide core.SPOTIFY clients are used.
+    """
+    with nullcontext(bandwidth) if bandwidth is not None else job_bandwidth(job) as bandwidth:
+        return _run_job(job, config, media_path, bandwidth, spotify, search_sessions)
+
+
+def _run_job(job, config, media_path, bandwidth, spotify, search_sessions):
+    # Loaded here rather than at the top so --help and argument errors stay fast
+    from downloader import core
+    from downloader.search_cache import SearchCache
+    from downloader.spotify import (iter_album_tracks, iter_artist_tracks, iter_playlist_tracks, iter_saved_tracks,
+                                    iter_tracks_by_id)
+
+    if spotify is None:
+        spotify = core.SPOTIFY
+
+    result = {'job': job, 'status': STATUS_OK, 'error': None}
+    kind = job['type']
+    audio_format, bitrate = audio_settings(config)
+    bitrate = str(job.get('bitrate') or bitrate)
+    if kind == 'url':
+        segments = get_segments(config, job.get('segments'))
+        if job.get('audio', False):
+            output_format = job.get('format') or audio_format
+            quality = audio_format_selector(output_format, bitrate)
+            core.download_media(job['url'], quality, output_format, media_path, bandwidth=bandwidth,
+                                audio_bitrate=bitrate, segments=segments)
+        else:
+            quality = core.video_quality(job.get('height', 1080))
+            core.download_media(job['url'], quality, job.get('format') or 'mp4', media_path, bandwidth=bandwidth,
+                                segments=segments)
+    elif kind == 'track':
+        query = f"{job['name']} {job['artist']}"
+        filename = core.song_filename(job['name'], job['artist'], audio_format)
+        output_path = os.path.join(config['DOWNLOAD_PATH'], filename)
+        with SearchCache() as search_cache:
+            video_id = core.search_youtube_and_download(query, output_path, search_cache, bandwidth, bitrate,
+                                                        search_sessions,
+                                                        Track(None, job['name'], job['artist'], None, None, None),
+                                                        match=False)
+        if video_id is None:
+            raise LookupError(f"No YouTube results for: {query}")
+        result.update(video_id=video_id, path=output_path)
+    elif kind == 'tracks':
+        _require_credentials(config)
+        sp = spotify.public(config['CLIENT_ID'], config['CLIENT_SECRET'])
+        ids = job_spotify_ids(job, 'track')
+        result['tracks'] = _run_batch(job, lambda on_total: iter_tracks_by_id(sp, ids, on_total=on_total), config,
+                                      bandwidth, search_sessions)
+    elif kind == 'playlist':
+        _require_credentials(config)
+        sp = spotify.public(config['CLIENT_ID'], config['CLIENT_SECRET'])
+        playlist_id, = job_spotify_ids(job, 'playlist')
+        result['tracks'] = _run_batch(
+            job, lambda on_total: _iter_cached(iter_playlist_tracks, sp, playlist_id, on_total=on_total), config,
+            bandwidth, search_sessions, f'playlist:{playlist_id}')
+    elif kind == 'album':
+        _require_credentials(config)
+        sp = spotify.public(config['CLIENT_ID'], config['CLIENT_SECRET'])
+        ids = job_spotify_ids(job, 'album')
+        result['tracks'] = _run_batch(job, lambda on_total: iter_album_tracks(sp, ids, on_total=on_total), config,
+                                      bandwidth, search_sessions, f"album:{','.join(ids)}")
+    elif kind == 'artist':
+        _require_credentials(config)
+        sp = spotify.public(config['CLIENT_ID'], config['CLIENT_SECRET'])
+        artist_id, = job_spotify_ids(job, 'artist')
+        result['tracks'] = _run_batch(job, lambda on_total: iter_artist_tracks(sp, artist_id, on_total=on_total),
+                                      config, bandwidth, search_sessions, f'artist:{artist_id}')
+    elif kind == 'liked':
+        _require_credentials(config)
+        sp = spotify.user(config['CLIENT_ID'], config['CLIENT_SECRET'])
+        result['tracks'] = _run_batch(job, lambda on_total: _iter_cached(iter_saved_tracks, sp, on_total=on_total),
+                                      config, bandwidth, search_sessions, 'liked')
+    if result.get('tracks', {}).get('failed'):
+        result['status'] = STATUS_FAILED
+    return result
+
+
+# Download a batch job here, or together with the other workers on job['shard'] that run the job `key`
+def _run_batch(job, fetch_tracks, config, bandwidth, search_sessions, key=None):
+    if not job.get('shard'):
+        return batch_result(_download_tracks(fetch_tracks, config, bandwidth, search_sessions))
+
+    from downloader.shard import SHARD_BATCH_SIZE, ShardQueue, ShardWorker
+
+    def download_batch(tracks):
+        summary = _download_tracks(lambda on_total: tracks, config, bandwidth, search_sessions)
+        # A cancelled batch goes back to the queue for the other workers
+        if bandwidth.cancelled.is_set():
+            raise JobCancelled(f"{job['type']} job cancelled")
+        return batch_result(summary)
+
+    with ShardQueue(job['shard']) as queue:
+        worker = ShardWorker(queue, key, job.get('batch_size') or SHARD_BATCH_SIZE)
+        return worker.run(lambda: fetch_tracks(None), download_batch)
+
+
+# Write the report atomically so a reader never sees half a file
+def write_report(report, path):
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if path == '-':
+        print(text)
+        return
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(text + '\n')
+    os.replace(temp_path, path)
+
+
+def run(args, config, media_path):
+    """ Runs a headless subcommand and returns the process exit status.
+
+    One failing job never stops the following ones; its error goes into
+    the report instead.
+    """
+    if args.command == 'jobs':
+        stream = sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')
+        jobs = iter_job_lines(stream)
+    else:
+        stream = None
+        try:
+            jobs = [(job_from_args(args), None)]
+        except ValueError as e:
+            jobs = [({'command': args.command}, str(e))]
+
+    results = []
+    exit_code = EXIT_OK
+    try:
+        for job, error in jobs:
+            if error is not None:
+                result = {'job': job, 'status': STATUS_INVALID, 'error': error}
+                exit_code = max(exit_code, EXIT_INVALID)
+            else:
+                if args.bandwidth:
+                    job.setdefault('bandwidth', args.bandwidth)
+                try:
+                    result = run_job(job, config, media_path)
+                except ConfigError as e:
+                    result = {'job': job, 'status': STATUS_FAILED, 'error': str(e)}
+                    exit_code = max(exit_code, EXIT_CONFIG)
+                except Exception as e:
+                    result = {'job': job, 'status': STATUS_FAILED, 'error': str(e)}
+                if result['status'] != STATUS_OK:
+                    exit_code = max(exit_code, EXIT_FAILED)
+            # One status line per job on stderr lets a job runner follow progress
+            print(json.dumps({'job': result['job'], 'status': result['status'], 'error': result['error']},
+                             ensure_ascii=False), file=sys.stderr)
+            results.append(result)
+    finally:
+        if stream is not None and stream is not sys.stdin:
+            stream.close()
+
+    if args.report:
+        write_report({'exit_code': exit_code, 'jobs': results}, args.report)
+    return exit_code
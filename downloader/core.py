@@ -0,0 +1,483 @@
+"""Download operations shared by the interactive menus and the headless CLI.
+
+Nothing in here prompts or prints: callers pass callbacks for per-track
+events and report results in their own language.
+"""
+
+import os
+import re
+import threading
+import time
+from contextlib import nullcontext
+from functools import partial
+
+import yt_dlp
+
+from downloader.bandwidth import SHAPED_OPTS, JobCancelled
+from downloader.batch import DEFAULT_SEGMENTS, get_concurrency
+from downloader.cover_cache import CoverCache
+from downloader.dedup import CLAIM_POLL_INTERVAL, CLAIM_WAIT_LIMIT, dedup_key, link_file
+from downloader.manifest import Manifest
+from downloader.matching import SEARCH_CANDIDATES, log_match, match_key, pick_candidate
+from downloader.pipeline import COMPLETE, Requeue, Stage, run_pipeline
+from downloader.ratelimit import YOUTUBE_MEDIA, YOUTUBE_SEARCH
+from downloader.retry import call_with_retry, retry_delay, write_dead_letters
+from downloader.search_cache import SearchCache
+from downloader.segmented import SegmentedYoutubeDL
+from downloader.session import DownloaderSession, SessionPool
+from downloader.tags import write_tags
+from downloader.tracing import span
+from downloader.transcode import (DEFAULT_AUDIO_FORMAT, DEFAULT_MP3_BITRATE, TRANSCODE_WORKERS, audio_format_selector,
+                                  audio_settings, finish_audio)
+
+# Redirect URI registered for the liked-songs OAuth flow
+SPOTIFY_REDIRECT_URI = "http://localhost:8888/callback"
+
+# Statuses spotipy retries on its own; 429 is left to downloader.ratelimit so
+# the shared limiter sees throttling and honours Retry-After for every worker
+SPOTIFY_RETRY_STATUSES = (500, 502, 503, 504)
+
+# Retries of a Spotify request and their backoff factor, as spotipy's own defaults
+SPOTIFY_RETRIES = 3
+SPOTIFY_BACKOFF = 0.3
+
+# yt-dlp options for metadata-only YouTube searches
+SEARCH_OPTS = {
+    'extract_flat': 'in_playlist',
+    'quiet': True,
+}
+
+# yt-dlp options for downloading an audio stream; the format comes from audio_format_selector()
+AUDIO_OPTS = {
+    'format': audio_format_selector(DEFAULT_AUDIO_FORMAT, DEFAULT_MP3_BITRATE),
+    # Resume from the .part file an interrupted attempt left behind
+    'continuedl': True,
+}
+
+# Page of a YouTube video; the offline benchmarks point this at a local server
+WATCH_URL = 'https://www.youtube.com/watch?v={}'
+
+# Format selection for the best video up to `height` pixels, merged with the best audio
+def video_quality(height):
+    return f'bestvideo[height<={height}]+bestaudio/best'
+
+
+# HTTP session for a Spotify client. spotipy's own retries the statuses it is given, but urllib3 also retries
+# any 429 with a Retry-After header and sleeps it out inside the request, where downloader.ratelimit never sees it
+def spotify_session():
+    import requests
+    from urllib3.util.retry import Retry
+    retry = Retry(total=SPOTIFY_RETRIES, connect=None, read=False,
+                  allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']), status=SPOTIFY_RETRIES,
+                  backoff_factor=SPOTIFY_BACKOFF, status_forcelist=SPOTIFY_RETRY_STATUSES,
+                  respect_retry_after_header=False)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# Spotify client for public data (playlists, track search); spotipy is only loaded once a client is needed
+def spotify_client(client_id, client_secret):
+    import spotipy
+    from downloader import spotify_auth
+    return spotipy.Spotify(auth_manager=spotify_auth.client_credentials(client_id, client_secret),
+                           requests_session=spotify_session())
+
+
+# Spotify client acting for the user, needed for liked songs
+def spotify_user_client(client_id, client_secret):
+    import spotipy
+    from downloader import spotify_auth
+    scope = "user-library-read"  # Required permission for user-specific data
+    return spotipy.Spotify(auth_manager=spotify_auth.user_authorization(client_id, client_secret,
+                                                                        SPOTIFY_REDIRECT_URI, scope),
+                           requests_session=spotify_session())
+
+
+class SpotifyClients:
+    """ Spotify clients created on first use and kept for later jobs with the same credentials.
+
+    Clients with the same credentials share one downloader.spotify_auth
+    token manager, which renews the access token before it expires.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def public(self, client_id, client_secret):
+        return self._get(spotify_client, client_id, client_secret)
+
+    def user(self, client_id, client_secret):
+        return self._get(spotify_user_client, client_id, client_secret)
+
+    def _get(self, create, client_id, client_secret):
+        key = (create, client_id, client_secret)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = create(client_id, client_secret)
+            return self._clients[key]
+
+
+# Clients of the interactive menus and the one-shot CLI, kept for the whole process
+SPOTIFY = SpotifyClients()
+
+
+def download_media(url, quality, output_format, output_path, progress_hooks=(), bandwidth=None, audio_bitrate=None,
+                   segments=DEFAULT_SEGMENTS):
+    """ Downloads a video or audio URL into output_path.
+
+    Large files are fetched over `segments` connections, and the video
+    and audio of a merged selection at the same time (see
+    downloader.segmented).
+
+    With audio_bitrate the download is audio in `output_format`: a stream
+    already in that codec is only remuxed, anything else is encoded at
+    audio_bitrate kbit/s. Transient failures are retried with backoff, and
+    each attempt resumes from the .part file of the previous one instead
+    of starting over. `bandwidth` is the downloader.bandwidth job the
+    transfer counts against. Raises yt_dlp.DownloadError once the retries
+    are used up.
+    """
+    os.makedirs(output_path, exist_ok=True)
+
+    ydl_opts = {
+        'format': quality,
+        'outtmpl': f'{output_path}/%(title)s.%(ext)s',
+        'merge_output_format': output_format,
+        'progress_hooks': list(progress_hooks),
+        'continuedl': True,
+        'concurrent_fragment_downloads': segments,
+    }
+    if audio_bitrate is not None:
+        # FFmpegExtractAudio copies the stream instead of encoding when the codec already matches
+        ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': output_format,
+                                       'preferredquality': str(audio_bitrate)}]
+    if bandwidth is not None:
+        ydl_opts.update(SHAPED_OPTS)
+        ydl_opts['progress_hooks'].append(bandwidth.hook)
+    with SegmentedYoutubeDL(ydl_opts) as ydl, span('download', url=url):
+        call_with_retry(ydl.download, [url])
+
+
+# Sanitize file names from invalid characters
+def sanitize_filename(filename):
+    return re.sub(r'[<>:"/\\|?*\x00-\x1F]', '', filename)
+
+
+# File name used for a downloaded song
+def song_filename(track_name, artist_name, audio_format=DEFAULT_AUDIO_FORMAT):
+    return f"{sanitize_filename(track_name)}-{sanitize_filename(artist_name)}.{audio_format}"
+
+
+def search_youtube(query, session, track=None):
+    """ Resolves a search query to a YouTube video ID without downloading anything.
+
+    Without `track` that is the first result. With it, the first
+    SEARCH_CANDIDATES results are scored against the track and the best
+    acceptable one is returned, or None when none is (downloader.matching).
+    """
+    if track is None:
+        with span('search', query=query):
+            info = YOUTUBE_SEARCH.call(session.extract_info, f'ytsearch1:{query}')
+        entries = info.get('entries') or []
+        return entries[0]['id'] if entries else None
+    with span('search', track):
+        info = YOUTUBE_SEARCH.call(session.extract_info, f'ytsearch{SEARCH_CANDIDATES}:{query}')
+    chosen, scored = pick_candidate(track, info.get('entries') or [])
+    log_match(query, track, scored, chosen)
+    return chosen['id'] if chosen else None
+
+
+# Search with a session leased from `sessions`, so a cache hit never creates one
+def search_youtube_pooled(query, sessions, track=None):
+    with sessions.lease() as session:
+        return search_youtube(query, session, track)
+
+
+# Download the audio stream of a video next to output_path, return the downloaded file and its codec
+def download_audio(video_id, output_path, session, search_key=None, search_cache=None):
+    outtmpl = os.path.splitext(output_path)[0] + '.%(ext)s'
+    try:
+        info = YOUTUBE_MEDIA.call(session.download, WATCH_URL.format(video_id), outtmpl)
+    except yt_dlp.DownloadError:
+        # A cached video that fails to download may be gone; search again next time
+        if search_cache is not None and search_key is not None:
+            search_cache.invalidate(search_key)
+        raise
+    download = info['requested_downloads'][0]
+    return download['filepath'], download.get('acodec')
+
+
+# yt-dlp audio options with the transfer counted against a bandwidth job, if there is one
+def _shaped_audio_opts(bandwidth, opts=AUDIO_OPTS):
+    if bandwidth is None:
+        return opts
+    return dict(opts, **SHAPED_OPTS, progress_hooks=list(opts.get('progress_hooks', [])) + [bandwidth.hook])
+
+
+# yt-dlp audio options selecting a stream for `audio_format` at `bitrate`
+def _audio_opts(audio_format, bitrate):
+    return dict(AUDIO_OPTS, format=audio_format_selector(audio_format, bitrate))
+
+
+# Download song from YouTube as output_path's format, tagged with `track` if given; return the video ID or None
+# when nothing (matching `track`) was found. Search results are scored against `track` unless `match` is False,
+# as for free-text searches whose track only carries the typed name. Searches lease from `search_sessions` when
+# given, e.g. a pool that outlives the call
+def search_youtube_and_download(query, output_path, search_cache=None, bandwidth=None, bitrate=DEFAULT_MP3_BITRATE,
+                                search_sessions=None, track=None, match=True):
+    scored = track if match else None
+    with nullcontext(search_sessions) if search_sessions is not None else SessionPool(SEARCH_OPTS) as sessions:
+        search = partial(search_youtube_pooled, sessions=sessions, track=scored)
+        if search_cache is not None:
+            video_id = search_cache.resolve(query, search, match_key(query, scored))
+        else:
+            video_id = search(query)
+    if video_id is None:
+        return None
+    audio_format = os.path.splitext(output_path)[1][1:].lower()
+    with DownloaderSession(_shaped_audio_opts(bandwidth, _audio_opts(audio_format, bitrate))) as audio_session, \
+            span('download', track):
+        source_path, acodec = call_with_retry(download_audio, video_id, output_path, audio_session,
+                                              match_key(query, scored), search_cache)
+    with span('postprocess', track):
+        finish_audio(source_path, output_path, acodec, bitrate)
+    if track is not None:
+        with span('tag', track):
+            write_tags(output_path, track)
+    return video_id
+
+
+# YouTube search query for a Spotify track
+def track_query(track):
+    return f"{track.name} {track.artist}"
+
+
+# Output path of a Spotify track in `audio_format`
+def track_output_path(track, download_dir, audio_format=DEFAULT_AUDIO_FORMAT):
+    return os.path.join(download_dir, song_filename(track.name, track.artist, audio_format))
+
+
+# Output path that no other recording already occupies; same-named songs get their track ID appended
+def unique_output_path(track, download_dir, manifest, audio_format=DEFAULT_AUDIO_FORMAT):
+    output_path = track_output_path(track, download_dir, audio_format)
+    owner = manifest.file_owner(output_path)
+    if owner is None or owner['track_id'] == track.id or (track.isrc and owner['isrc'] == track.isrc):
+        return output_path
+    base, ext = os.path.splitext(output_path)
+    return f"{base} [{track.id}]{ext}"
+
+
+# Mark the current worker busy on an aggregator, if there is one
+def _working(progress, state):
+    return progress.working(state) if progress is not None else nullcontext()
+
+
+# Link a finished copy of the same recording in the same format into place; True when there was one
+def _reuse_copy(track, output_path, manifest):
+    existing = manifest.find_file(track, extension=os.path.splitext(output_path)[1])
+    if existing is None:
+        return False
+    with span('publish', track):
+        link_file(existing, output_path)
+        row = manifest.file_owner(existing)
+        manifest.mark_done(track, row['video_id'] if row else None, output_path)
+    return True
+
+
+class ClaimWaits:
+    """ Tracks of a batch waiting for a recording another worker or process is fetching.
+
+    A waiting track goes back to the pipeline's scheduler instead of
+    holding a resolve worker. After `limit` seconds it takes the claim
+    over and is downloaded anyway, in case the other fetch is stuck.
+    Waiting tracks are counted on `progress`, if given.
+    """
+
+    def __init__(self, progress=None, limit=CLAIM_WAIT_LIMIT):
+        self.progress = progress
+        self.limit = limit
+        self.waited = 0
+        self.taken_over = 0
+        self._since = {}
+        self._lock = threading.Lock()
+
+    # Whether the track keeps waiting; False once it waited `limit` seconds
+    def wait(self, track):
+        now = time.monotonic()
+        with self._lock:
+            since = self._since.setdefault(id(track), now)
+            started = since == now
+            if started:
+                self.waited += 1
+            expired = now - since >= self.limit
+            if expired:
+                del self._since[id(track)]
+                self.taken_over += 1
+        if self.progress is not None and started != expired:
+            self.progress.track_waiting(1 if started else -1)
+        return not expired
+
+    # The track got its recording, from a finished copy or its own claim
+    def stop(self, track):
+        with self._lock:
+            waited = self._since.pop(id(track), None) is not None
+        if waited and self.progress is not None:
+            self.progress.track_waiting(-1)
+
+
+# Pipeline stage 1: reuse a finished copy of the recording, or claim it and resolve a YouTube video ID
+def resolve_track(track, _, download_dir, audio_format, manifest, search_cache, sessions, claim_waits,
+                  on_start=None, on_complete=None, progress=None):
+    output_path = unique_output_path(track, download_dir, manifest, audio_format)
+    key = dedup_key(track)
+    if key is not None:
+        # Another worker or process may be fetching the same recording right now
+        if _reuse_copy(track, output_path, manifest):
+            claim_waits.stop(track)
+            if progress is not None:
+                progress.track_done()
+            if on_complete is not None:
+                on_complete(track, output_path)
+            return COMPLETE
+        if not manifest.claim(key):
+            if claim_waits.wait(track):
+                raise Requeue(CLAIM_POLL_INTERVAL)
+            manifest.claim(key, take_over=True)
+        claim_waits.stop(track)
+    query = track_query(track)
+    if on_start is not None:
+        on_start(track)
+    try:
+        with _working(progress, 'search'):
+            video_id = search_cache.resolve(query, partial(search_youtube_pooled, sessions=sessions, track=track),
+                                            match_key(query, track))
+        if video_id is None:
+            raise LookupError(f"No matching YouTube results for: {query}")
+    except Exception:
+        # A retry of this stage claims again; meanwhile another worker may take over
+        if key is not None:
+            manifest.release(key)
+        raise
+    return video_id, output_path
+
+
+# Pipeline stage 2: download the audio stream and the album cover
+def fetch_track(track, resolved, search_cache, sessions, covers, progress=None):
+    video_id, output_path = resolved
+    with _working(progress, 'connect'), sessions.lease() as session, span('download', track):
+        source_path, acodec = download_audio(video_id, output_path, session, match_key(track_query(track), track),
+                                           search_cache)
+    with _working(progress, 'cover'), span('cover', track):
+        cover = covers.get(track.cover_url)
+    return video_id, output_path, source_path, acodec, cover
+
+
+# Pipeline stage 3: remux or encode into the output format, tag it, record the track as done and release its claim
+def transcode_track(track, downloaded, bitrate, manifest, on_complete=None, progress=None):
+    video_id, output_path, source_path, acodec, cover = downloaded
+    with _working(progress, 'encode'), span('postprocess', track):
+        finish_audio(source_path, output_path, acodec, bitrate)
+    # Tagged before the manifest records the file's size
+    with _working(progress, 'tag'), span('tag', track):
+        write_tags(output_path, track, cover)
+    with span('publish', track):
+        manifest.mark_done(track, video_id, output_path)
+        key = dedup_key(track)
+        if key is not None:
+            manifest.release(key)
+    if progress is not None:
+        progress.track_done()
+    if on_complete is not None:
+        on_complete(track, output_path)
+
+
+# Tracks until the bandwidth job is cancelled; downloads already running stop in the job's hook
+def _until_cancelled(tracks, bandwidth):
+    for track in tracks:
+        if bandwidth.cancelled.is_set():
+            return
+        yield track
+
+
+def download_tracks(tracks, config, on_start=None, on_complete=None, progress=None, bandwidth=None,
+                    search_sessions=None):
+    """ Downloads Spotify tracks through the resolve / download / transcode pipeline.
+
+    Tracks end up as AUDIO_FORMAT files (mp3, m4a or opus) at around
+    AUDIO_BITRATE kbit/s; only streams the format can't hold as they are
+    get re-encoded. Files are tagged from the track data with the album
+    cover embedded, each cover fetched once (downloader.cover_cache).
+    Tracks that already have a file in the download directory are
+    skipped.
+    A recording (same ISRC or track ID) that was downloaded for another
+    playlist or directory, or by another process sharing the manifest, is
+    linked into place instead of downloaded again; while it is still
+    being fetched the track waits without holding a worker, for at most
+    CLAIM_WAIT_LIMIT seconds (ClaimWaits). Failed stages are
+    retried per downloader.retry's policies, and tracks that still fail
+    are appended to the dead-letter file. on_start(track) and
+    on_complete(track, path) are called from worker threads; a
+    downloader.progress.ProgressAggregator passed as `progress` receives
+    the yt-dlp progress of every download and each worker's state, and
+    downloads count against the downloader.bandwidth job `bandwidth`;
+    cancelling that job ends the batch early. Searches lease sessions
+    from `search_sessions` when given, so a long-running caller keeps
+    them warm between batches.
+    Returns the BatchSummary, including the search cache hit and miss
+    counts and how many tracks waited for a recording fetched elsewhere.
+    """
+    concurrency = get_concurrency(config)
+    download_dir = config['DOWNLOAD_PATH']
+    audio_format, bitrate = audio_settings(config)
+    YOUTUBE_SEARCH.configure(concurrency)
+    YOUTUBE_MEDIA.configure(concurrency)
+    audio_opts = _audio_opts(audio_format, bitrate)
+    if progress is not None:
+        # yt-dlp's own per-download progress output is replaced by the aggregator
+        audio_opts = dict(audio_opts, progress_hooks=[progress.hook], noprogress=True, quiet=True)
+    audio_opts = _shaped_audio_opts(bandwidth, audio_opts)
+
+    def skip(track):
+        if manifest.needs_download(track, download_dir):
+            return False
+        if progress is not None:
+            progress.track_skipped()
+        return True
+
+    def on_failure(track, error):
+        manifest.mark_failed(track.id, error)
+        key = dedup_key(track)
+        if key is not None:
+            manifest.release(key)
+        if progress is not None:
+            progress.track_done(ok=False)
+
+    if bandwidth is not None:
+        tracks = _until_cancelled(tracks, bandwidth)
+    search_pool = nullcontext(search_sessions) if search_sessions is not None else SessionPool(SEARCH_OPTS)
+
+    claim_waits = ClaimWaits(progress)
+    with Manifest() as manifest, SearchCache() as search_cache, CoverCache() as covers, \
+            search_pool as search_sessions, SessionPool(audio_opts) as audio_sessions:
+        stages = [
+            Stage('resolve', partial(resolve_track, download_dir=download_dir, audio_format=audio_format,
+                                     manifest=manifest, search_cache=search_cache, sessions=search_sessions,
+                                     claim_waits=claim_waits, on_start=on_start, on_complete=on_complete,
+                                     progress=progress), concurrency),
+            Stage('download', partial(fetch_track, search_cache=search_cache, sessions=audio_sessions,
+                                      covers=covers, progress=progress), concurrency),
+            Stage('transcode', partial(transcode_track, bitrate=bitrate, manifest=manifest,
+                                       on_complete=on_complete, progress=progress), TRANSCODE_WORKERS),
+        ]
+        summary = run_pipeline(tracks, stages, skip=skip, on_failure=on_failure, retry=retry_delay)
+        summary.search_hits = search_cache.hits
+        summary.search_misses = search_cache.misses
+        summary.claim_waits = claim_waits.waited
+        summary.claim_takeovers = claim_waits.taken_over
+    # Tracks of a cancelled job didn't fail; the next run picks them up again
+    write_dead_letters([(track, error) for track, error in summary.failed if not isinstance(error, JobCancelled)])
+    return summary
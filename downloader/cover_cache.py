@@ -0,0 +1,142 @@
+"""Album cover images for tags, fetched once per image.
+
+Every track of an album carries the same cover URL. Images are kept in a
+byte-bounded in-memory LRU in front of a size-bounded SQLite store, and a
+worker asking for an image another worker is fetching waits for that
+fetch, so a 12-track album costs one download however its tracks are
+spread over the workers.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Cache database path, next to config.json
+COVER_CACHE_FILE = 'covers.db'
+
+# Images kept on disk; least recently used ones are evicted beyond this many
+COVER_CACHE_SIZE = 5000
+
+# Bytes of images kept in memory
+COVER_MEMORY_BYTES = 32 * 1024 * 1024
+
+# Seconds to wait for an image
+COVER_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS covers (
+    url TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+# Download an image; requests comes with spotipy
+def fetch_cover(url):
+    import requests
+    response = requests.get(url, timeout=COVER_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+class CoverCache:
+    """ Cover image bytes by URL: memory, then disk, then one fetch.
+
+    Like the search cache, a single SQLite connection is shared between
+    worker threads behind a lock. `fetches` counts the images actually
+    downloaded over the lifetime of the object.
+    """
+
+    def __init__(self, path=COVER_CACHE_FILE, max_entries=COVER_CACHE_SIZE, memory_bytes=COVER_MEMORY_BYTES,
+                 fetch=fetch_cover):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_bytes = memory_bytes
+        self.fetch = fetch
+        self.fetches = 0
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(SCHEMA)
+        self._size = self._db.execute('SELECT COUNT(*) FROM covers').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get(self, url):
+        """ Returns the image at `url`, or None when there is no URL or it can't be fetched. """
+        if not url:
+            return None
+        while True:
+            with self._lock:
+                data = self._memory.get(url)
+                if data is not None:
+                    self._memory.move_to_end(url)
+                    return data
+                pending = self._pending.get(url)
+                if pending is None:
+                    pending = self._pending[url] = threading.Event()
+                    break
+            # Another worker is fetching it; when that fails, this one tries again itself
+            pending.wait()
+        try:
+            data = self._load(url)
+            if data is None:
+                try:
+                    data = self.fetch(url)
+                except Exception:
+                    # A track is still worth having without its cover
+                    return None
+                self._store(url, data)
+            self._remember(url, data)
+            return data
+        finally:
+            with self._lock:
+                del self._pending[url]
+            pending.set()
+
+    def _load(self, url):
+        with self._lock, self._db:
+            row = self._db.execute('SELECT data FROM covers WHERE url = ?', (url,)).fetchone()
+            if row is not None:
+                self._db.execute('UPDATE covers SET last_used = ? WHERE url = ?', (time.time(), url))
+        return row[0] if row else None
+
+    def _store(self, url, data):
+        with self._lock, self._db:
+            self.fetches += 1
+            cursor = self._db.execute('INSERT OR REPLACE INTO covers (url, data, last_used) VALUES (?, ?, ?)',
+                                      (url, data, time.time()))
+            if cursor.rowcount:
+                self._size += 1
+            if self._size > self.max_entries:
+                self._evict()
+
+    # Drop the least recently used images down to 90% of the limit
+    def _evict(self):
+        keep = int(self.max_entries * 0.9)
+        self._db.execute('DELETE FROM covers WHERE url NOT IN '
+                         '(SELECT url FROM covers ORDER BY last_used DESC LIMIT ?)', (keep,))
+        self._size = self._db.execute('SELECT COUNT(*) FROM covers').fetchone()[0]
+
+    # Keep an image in memory, evicting the least recently used ones beyond memory_bytes
+    def _remember(self, url, data):
+        with self._lock:
+            self._memory[url] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
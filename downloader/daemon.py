@@ -0,0 +1,389 @@
+"""Service mode: a local HTTP API in front of a durable job queue.
+
+`EnDownloader.py serve` starts one long-running process that takes the
+same jobs as the jobs subcommand (see downloader.cli) over HTTP, on
+127.0.0.1 or a Unix socket:
+
+    POST   /jobs          submit a job object, answers {"id": ..., "status": "queued"}
+    GET    /jobs          list jobs, newest first (?status=queued&limit=50)
+    GET    /jobs/ID       one job with its result once it finished
+    DELETE /jobs/ID       cancel a queued job, or stop a running one
+
+Jobs are stored in jobs.db before they are acknowledged, so a restart
+loses nothing: jobs that were running when the service stopped are
+queued again and resume from their .part files and the manifest. A pool
+of worker threads runs them, keeping the imported modules, the Spotify
+clients with their tokens and the YouTube search sessions warm between
+jobs, so several users can share one instance without paying the
+startup cost per job.
+"""
+
+import json
+import os
+import signal
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from downloader import cli
+
+# Queue database path, next to config.json
+JOBS_FILE = 'jobs.db'
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_CANCELLED = 'cancelled'
+
+# Seconds an idle worker sleeps before looking at the queue again without being woken
+POLL_INTERVAL = 5.0
+
+# Largest request body accepted, in bytes
+MAX_BODY = 64 * 1024
+
+# Jobs listed when the request doesn't say how many
+DEFAULT_LIST_LIMIT = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class JobQueue:
+    """ Jobs and their results in SQLite, taken oldest first.
+
+    Like the manifest, one connection is shared by all threads behind a
+    lock and every change is committed immediately.
+    """
+
+    def __init__(self, path=JOBS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # Store a job and return its ID
+    def submit(self, job):
+        with self._lock, self._db:
+            cursor = self._db.execute('INSERT INTO jobs (job, status, created_at) VALUES (?, ?, ?)',
+                                      (json.dumps(job, ensure_ascii=False), STATUS_QUEUED, time.time()))
+        return cursor.lastrowid
+
+    # Mark the oldest queued job running and return (id, job), or None when the queue is empty
+    def take(self):
+        with self._lock, self._db:
+            row = self._db.execute('UPDATE jobs SET status = ?, started_at = ? WHERE id = '
+                                   '(SELECT id FROM jobs WHERE status = ? ORDER BY id LIMIT 1) RETURNING id, job',
+                                   (STATUS_RUNNING, time.time(), STATUS_QUEUED)).fetchone()
+        return (row['id'], json.loads(row['job'])) if row else None
+
+    def finish(self, job_id, status, result=None, error=None):
+        result = json.dumps(result, ensure_ascii=False) if result is not None else None
+        with self._lock, self._db:
+            self._db.execute('UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+                             (status, result, error, time.time(), job_id))
+
+    # Put a job that was interrupted by a shutdown back in line
+    def requeue(self, job_id):
+        with self._lock, self._db:
+            self._db.execute('UPDATE jobs SET status = ?, started_at = NULL WHERE id = ?', (STATUS_QUEUED, job_id))
+
+    # Queue again the jobs a previous process left running; returns how many there were
+    def recover(self):
+        with self._lock, self._db:
+            cursor = self._db.execute('UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?',
+                                      (STATUS_QUEUED, STATUS_RUNNING))
+        return cursor.rowcount
+
+    def cancel(self, job_id):
+        """ Cancels the job if it is still queued; returns its status afterwards, None if there is no such job. """
+        with self._lock, self._db:
+            self._db.execute('UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?',
+                             (STATUS_CANCELLED, time.time(), job_id, STATUS_QUEUED))
+            row = self._db.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row['status'] if row else None
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return _job_entry(row) if row else None
+
+    # Jobs newest first, optionally only those with `status`
+    def list(self, status=None, limit=DEFAULT_LIST_LIMIT):
+        query = 'SELECT * FROM jobs'
+        params = ()
+        if status:
+            query += ' WHERE status = ?'
+            params = (status,)
+        with self._lock:
+            rows = self._db.execute(query + ' ORDER BY id DESC LIMIT ?', params + (limit,)).fetchall()
+        return [_job_entry(row) for row in rows]
+
+
+def _job_entry(row):
+    entry = dict(row)
+    entry['job'] = json.loads(entry['job'])
+    entry['result'] = json.loads(entry['result']) if entry['result'] is not None else None
+    return entry
+
+
+class DownloadService:
+    """ The queue and the warm worker pool behind the HTTP API.
+
+    Every job reads config.json again through load_config, so settings
+    changed while the service runs apply to the next job.
+    """
+
+    def __init__(self, queue, load_config, media_path, workers=2):
+        # Loaded once here and then shared by every job
+        from downloader import core
+        from downloader.session import SessionPool
+
+        self.queue = queue
+        self.load_config = load_config
+        self.media_path = media_path
+        self.spotify = core.SpotifyClients()
+        self.search_sessions = SessionPool(core.SEARCH_OPTS)
+        self._workers = max(1, workers)
+        self._threads = []
+        self._running = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopping = False
+
+    def start(self):
+        recovered = self.queue.recover()
+        if recovered:
+            _log({'recovered': recovered})
+        for number in range(1, self._workers + 1):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """ Stops the workers; the jobs they were running are queued again for the next start. """
+        with self._lock:
+            self._stopping = True
+            for bandwidth in self._running.values():
+                bandwidth.cancel()
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self.search_sessions.close()
+
+    def submit(self, job):
+        job_id = self.queue.submit(job)
+        with self._lock:
+            self._wakeup.notify()
+        return job_id
+
+    def cancel(self, job_id):
+        """ Cancels a job; returns its status afterwards, or None if there is no such job.
+
+        A queued job is cancelled right away. A running job stops at the
+        next block any of its downloads reads and reports 'running' until
+        its worker has recorded it as cancelled.
+        """
+        with self._lock:
+            status = self.queue.cancel(job_id)
+            if status == STATUS_RUNNING:
+                self._cancelled.add(job_id)
+                bandwidth = self._running.get(job_id)
+                if bandwidth is not None:
+                    bandwidth.cancel()
+        return status
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._stopping:
+                    entry = self.queue.take()
+                    if entry is not None:
+                        break
+                    self._wakeup.wait(POLL_INTERVAL)
+                else:
+                    return
+            self._run(*entry)
+
+    def _run(self, job_id, job):
+        _log({'id': job_id, 'job': job, 'status': STATUS_RUNNING})
+        result, status, error = None, cli.STATUS_FAILED, None
+        with cli.job_bandwidth(job) as bandwidth:
+            with self._lock:
+                self._running[job_id] = bandwidth
+                if job_id in self._cancelled or self._stopping:
+                    bandwidth.cancel()
+            try:
+                result = cli.run_job(job, self.load_config(), self.media_path, bandwidth, self.spotify,
+                                     self.search_sessions)
+                status, error = result['status'], result['error']
+            except Exception as e:
+                error = str(e)
+            finally:
+                with self._lock:
+                    del self._running[job_id]
+                    self._cancelled.discard(job_id)
+                    stopping = self._stopping
+        if bandwidth.cancelled.is_set():
+            if stopping:
+                self.queue.requeue(job_id)
+                _log({'id': job_id, 'status': STATUS_QUEUED})
+                return
+            status, error = STATUS_CANCELLED, None
+        self.queue.finish(job_id, status, result, error)
+        _log({'id': job_id, 'status': status, 'error': error})
+
+
+# One status line per job event on stderr, in the format of the jobs subcommand
+def _log(event):
+    print(json.dumps(event, ensure_ascii=False), file=sys.stderr)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'Downloader'
+
+    def do_GET(self):
+        parts, query = self._route()
+        service = self.server.service
+        if parts == ['jobs']:
+            status = query.get('status', [None])[0]
+            try:
+                limit = int(query.get('limit', [DEFAULT_LIST_LIMIT])[0])
+            except ValueError:
+                return self._send(400, {'error': 'limit must be a number'})
+            return self._send(200, {'jobs': service.queue.list(status, limit)})
+        job_id = self._job_id(parts)
+        if job_id is None:
+            return self._send(404, {'error': 'not found'})
+        entry = service.queue.get(job_id)
+        if entry is None:
+            return self._send(404, {'error': f'no job {job_id}'})
+        self._send(200, entry)
+
+    def do_POST(self):
+        parts, _ = self._route()
+        if parts != ['jobs']:
+            return self._send(404, {'error': 'not found'})
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY:
+            return self._send(413, {'error': 'job too large'})
+        try:
+            job = cli.parse_job(self.rfile.read(length).decode('utf-8'))
+        except (UnicodeDecodeError, ValueError) as e:
+            return self._send(400, {'error': str(e)})
+        job_id = self.server.service.submit(job)
+        self._send(201, {'id': job_id, 'status': STATUS_QUEUED})
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        job_id = self._job_id(parts)
+        if job_id is None:
+            return self._send(404, {'error': 'not found'})
+        status = self.server.service.cancel(job_id)
+        if status is None:
+            return self._send(404, {'error': f'no job {job_id}'})
+        if status not in (STATUS_CANCELLED, STATUS_RUNNING):
+            return self._send(409, {'id': job_id, 'status': status, 'error': 'job already finished'})
+        self._send(202 if status == STATUS_RUNNING else 200, {'id': job_id, 'status': status})
+
+    def _route(self):
+        url = urlsplit(self.path)
+        return [part for part in url.path.split('/') if part], parse_qs(url.query)
+
+    @staticmethod
+    def _job_id(parts):
+        if len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+            return int(parts[1])
+        return None
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Requests aren't logged; job events are
+    def log_message(self, format, *args):
+        pass
+
+
+# HTTP server on HOST:PORT, or on a Unix socket at socket_path
+def make_server(service, listen=None, socket_path=None):
+    if socket_path:
+        # Windows has no Unix sockets
+        if not hasattr(socketserver, 'ThreadingUnixStreamServer'):
+            raise ValueError('Unix sockets are not supported on this system')
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = socketserver.ThreadingUnixStreamServer(socket_path, _Handler)
+        server.daemon_threads = True
+    else:
+        host, _, port = (listen or f'{DEFAULT_HOST}:{DEFAULT_PORT}').rpartition(':')
+        server = ThreadingHTTPServer((host or DEFAULT_HOST, int(port)), _Handler)
+    server.service = service
+    return server
+
+
+def _raise_interrupt():
+    raise KeyboardInterrupt
+
+
+def serve(args, load_config, media_path, text):
+    """ Runs the service until interrupted and returns the process exit status.
+
+    Messages for the console come from the `text` message catalogue.
+    """
+    with JobQueue() as queue:
+        service = DownloadService(queue, load_config, media_path, args.workers)
+        try:
+            server = make_server(service, args.listen, args.socket)
+        except (OSError, ValueError, OverflowError) as e:
+            print(text('serve_listen_error', error=e), file=sys.stderr)
+            return cli.EXIT_INVALID
+        # A service manager stops the service with SIGTERM; shut down as for Ctrl+C
+        signal.signal(signal.SIGTERM, lambda *_: _raise_interrupt())
+        service.start()
+        _log({'listening': args.socket or args.listen or f'{DEFAULT_HOST}:{DEFAULT_PORT}',
+              'workers': args.workers})
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.stop()
+            if args.socket:
+                os.remove(args.socket)
+    return cli.EXIT_OK
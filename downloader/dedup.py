@@ -0,0 +1,57 @@
+"""Identity of a recording across playlists, and cheap copies of finished files.
+
+A song that sits in several playlists (or in Liked Songs as well) is
+downloaded once. Its ISRC identifies the recording across releases,
+otherwise the Spotify track ID does. Later destinations get a hardlink
+to the first finished file, or a reflink or plain copy where the file
+system can't link.
+"""
+
+import os
+import shutil
+
+# Seconds between two looks at a recording another worker or process is fetching
+CLAIM_POLL_INTERVAL = 0.5
+
+# Seconds a track waits for a recording another process is fetching before downloading it anyway
+CLAIM_WAIT_LIMIT = 10 * 60
+
+# FICLONE ioctl (Linux): share the data blocks of another file, copy-on-write
+FICLONE = 0x40049409
+
+
+# Key under which a track is deduplicated, None when it can't be identified
+def dedup_key(track):
+    if track.isrc:
+        return f'isrc:{track.isrc.upper()}'
+    if track.id:
+        return f'spotify:{track.id}'
+    return None
+
+
+def _reflink(source, destination):
+    import fcntl  # not available on Windows
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def link_file(source, destination):
+    """ Makes `destination` a copy of `source` without downloading it again.
+
+    Tries a hardlink first, then a reflink, then a regular copy. The new
+    name appears atomically, so a reader never sees a partial file.
+    """
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        return
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    temp_path = destination + '.link'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        try:
+            _reflink(source, temp_path)
+        except (OSError, ImportError):
+            shutil.copy2(source, temp_path)
+    os.replace(temp_path, destination)
@@ -0,0 +1,216 @@
+"""SQLite manifest of downloaded Spotify tracks for incremental syncs.
+
+Several processes may share one manifest: SQLite serialises their
+writes, and the claims table makes sure only one of them fetches a
+given recording at a time.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+# Manifest database path, next to config.json
+MANIFEST_FILE = 'manifest.db'
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_MISSING = 'missing'
+
+# Claims older than this are taken over even if their process still seems to run
+CLAIM_TIMEOUT = 2 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    track_id TEXT PRIMARY KEY,
+    video_id TEXT,
+    path TEXT,
+    size INTEGER,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    isrc TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    track_id TEXT NOT NULL,
+    isrc TEXT,
+    video_id TEXT,
+    size INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_track_id ON files (track_id);
+CREATE INDEX IF NOT EXISTS files_isrc ON files (isrc);
+CREATE TABLE IF NOT EXISTS claims (
+    key TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    claimed_at REAL NOT NULL
+);
+"""
+
+
+# Whether a process with this ID is still running on this machine
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        pass
+    return True
+
+
+class Manifest:
+    """ Records which Spotify tracks were downloaded, from which video and where.
+
+    `tracks` holds the latest status of every track, `files` every file a
+    track was written or linked to. One connection is shared by all worker
+    threads and guarded by a lock; every write is committed immediately so
+    an interrupted run keeps what it finished.
+    """
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        # Claims this instance holds, key -> claimed_at; other manifests in this process hold claims of their own
+        self._claims = {}
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            had_files = self._db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'files'").fetchone()
+            columns = [row['name'] for row in self._db.execute('PRAGMA table_info(tracks)')]
+            if columns and 'isrc' not in columns:
+                self._db.execute('ALTER TABLE tracks ADD COLUMN isrc TEXT')
+            self._db.executescript(SCHEMA)
+            if not had_files:
+                # Manifests from before the files table: every finished track has one file
+                self._db.execute(
+                    'INSERT OR IGNORE INTO files (path, track_id, isrc, video_id, size, updated_at) '
+                    'SELECT path, track_id, isrc, video_id, size, updated_at FROM tracks '
+                    'WHERE status = ? AND path IS NOT NULL', (STATUS_DONE,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            with self._db:
+                # A claim taken over since has another pid or time and stays with its new holder
+                self._db.executemany('DELETE FROM claims WHERE key = ? AND pid = ? AND claimed_at = ?',
+                                     [(key, os.getpid(), claimed_at) for key, claimed_at in self._claims.items()])
+            self._claims.clear()
+            self._db.close()
+
+    def get(self, track_id):
+        with self._lock:
+            return self._db.execute('SELECT * FROM tracks WHERE track_id = ?', (track_id,)).fetchone()
+
+    # Row of the file at `path`, None when the manifest doesn't know it
+    def file_owner(self, path):
+        with self._lock:
+            return self._db.execute('SELECT * FROM files WHERE path = ?', (path,)).fetchone()
+
+    def find_file(self, track, directory=None, same_track=False, extension=None):
+        """ Returns an intact file of this track, or of the same recording (ISRC).
+
+        Only files in `directory` count when it is given, only files with
+        `extension` (e.g. '.mp3') when that is given, and only files of
+        this very Spotify track with same_track=True. Returns None if there
+        is none.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT * FROM files WHERE track_id = ? OR (isrc IS NOT NULL AND isrc = ?) '
+                'ORDER BY track_id = ? DESC, updated_at',
+                (track.id, None if same_track else track.isrc, track.id)).fetchall()
+        if directory is not None:
+            directory = os.path.abspath(directory)
+        for row in rows:
+            path = row['path']
+            if directory is not None and os.path.dirname(os.path.abspath(path)) != directory:
+                continue
+            if extension is not None and os.path.splitext(path)[1].lower() != extension.lower():
+                continue
+            if os.path.exists(path) and (row['size'] is None or os.path.getsize(path) == row['size']):
+                return path
+        return None
+
+    # Tracks without a Spotify ID (local files) can't be tracked and are always processed
+    def needs_download(self, track, directory):
+        if not track.id:
+            return True
+        return self.find_file(track, directory, same_track=True) is None
+
+    def mark_done(self, track, video_id, path):
+        if not track.id:
+            return
+        size = os.path.getsize(path) if os.path.exists(path) else None
+        self._write(track.id, video_id, path, size, STATUS_DONE, None, track.isrc)
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO files (path, track_id, isrc, video_id, size, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (path, track.id, track.isrc, video_id, size, time.time()))
+
+    def mark_failed(self, track_id, error):
+        if not track_id:
+            return
+        self._write(track_id, None, None, None, STATUS_FAILED, str(error))
+
+    def _write(self, track_id, video_id, path, size, status, error, isrc=None):
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO tracks (track_id, video_id, path, size, status, error, updated_at, isrc) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (track_id, video_id, path, size, status, error, time.time(), isrc))
+
+    def claim(self, key, take_over=False):
+        """ Reserves a recording for download by this process.
+
+        Returns False while another worker, in this process or any other
+        sharing the manifest, holds it. Claims of processes that are gone,
+        or older than CLAIM_TIMEOUT, are taken over, and with take_over=True
+        any claim is.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute('SELECT pid, claimed_at FROM claims WHERE key = ?', (key,)).fetchone()
+            if row is not None and not take_over and now - row['claimed_at'] < CLAIM_TIMEOUT \
+                    and _process_alive(row['pid']):
+                return False
+            self._db.execute('INSERT OR REPLACE INTO claims (key, pid, claimed_at) VALUES (?, ?, ?)',
+                             (key, os.getpid(), now))
+            self._claims[key] = now
+            return True
+
+    def release(self, key):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM claims WHERE key = ?', (key,))
+            self._claims.pop(key, None)
+
+    def verify(self, repair=False):
+        """ Checks recorded files for ones that are gone or changed size.
+
+        Returns the number of files checked and the list of bad ones.
+
+        With repair=True those files are forgotten and their tracks marked
+        missing, so the next sync of their playlist downloads them again.
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM files').fetchall()
+        missing = []
+        for row in rows:
+            path = row['path']
+            if not os.path.exists(path) or (row['size'] is not None and os.path.getsize(path) != row['size']):
+                missing.append(row)
+        if repair and missing:
+            with self._lock, self._db:
+                self._db.executemany('DELETE FROM files WHERE path = ?', [(row['path'],) for row in missing])
+                self._db.executemany('UPDATE tracks SET status = ?, updated_at = ? WHERE track_id = ?',
+                                     [(STATUS_MISSING, time.time(), row['track_id']) for row in missing])
+        return len(rows), missing
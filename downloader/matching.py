@@ -0,0 +1,172 @@
+"""Scoring YouTube search results against the Spotify track they stand for.
+
+The first search result is often a live version, a cover or an hour-long
+compilation. Instead, the top SEARCH_CANDIDATES results are fetched as
+flat, metadata-only entries, which costs the same single search request,
+and scored on duration, title and channel before any media is requested.
+Candidates too far off the track's duration or scoring below
+MIN_MATCH_SCORE are rejected. Every decision is appended to
+MATCH_LOG_FILE with the scores of all candidates, to tune the thresholds
+against.
+"""
+
+import json
+import re
+import threading
+import time
+import unicodedata
+from difflib import SequenceMatcher
+
+# Search results scored per track
+SEARCH_CANDIDATES = 5
+
+# Seconds a video may differ from the track and still get the full duration score
+DURATION_TOLERANCE = 7
+
+# Seconds, or share of the track's duration when that is more, beyond which a video is rejected
+DURATION_LIMIT = 30
+DURATION_LIMIT_SHARE = 0.2
+
+# Weight of each part of a score; a part that can't be scored (no duration) leaves the others to share
+WEIGHTS = {'title': 0.45, 'artist': 0.3, 'duration': 0.25}
+
+# Lowest score a candidate is downloaded with
+MIN_MATCH_SCORE = 0.55
+
+# Words that mark another version of a song; each costs a candidate VERSION_PENALTY of its score,
+# unless the track's own name has it too
+VERSION_WORDS = ('live', 'cover', 'karaoke', 'instrumental', 'remix', 'acoustic', 'nightcore', 'sped up', 'slowed',
+                 'reverb', '8d', 'reaction', 'full album', 'compilation', 'hour', 'hours')
+VERSION_PENALTY = 0.5
+
+# Candidate decisions, one JSON line per search, next to config.json
+MATCH_LOG_FILE = 'search_matches.jsonl'
+
+# Version of the scoring rules; bump it when they change, so picks cached under older rules are searched again
+MATCH_VERSION = 1
+
+# Rejection reasons in the log
+REJECT_DURATION = 'duration'
+REJECT_SCORE = 'score'
+
+# Spotify's " - Remastered 2011" style suffixes and "(feat. ...)" credits, which video titles rarely repeat
+NAME_EXTRAS = re.compile(r'\s+-\s+.*$|\s*[(\[](?:feat|ft|with)\.?\s[^)\]]*[)\]]', re.IGNORECASE)
+
+_log_lock = threading.Lock()
+
+
+# Lower-case words without accents or punctuation; Turkish dotless i has no accent to drop and is folded by hand
+def _words(text):
+    text = unicodedata.normalize('NFKD', text or '').casefold().replace('ı', 'i')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r'\w+', text)
+
+
+def _compact(text):
+    return ''.join(_words(text))
+
+
+# Share of the words of the track's name found in the video title
+def _title_score(name, title):
+    wanted = _words(NAME_EXTRAS.sub('', name)) or _words(name)
+    if not wanted:
+        return 0.0
+    found = set(_words(title))
+    return sum(word in found for word in wanted) / len(wanted)
+
+
+# 1 when an artist's name is in the channel or title ("Artist - Topic", "ArtistVEVO"), otherwise how alike they look
+def _artist_score(artists, channel, title):
+    channel, title = _compact(channel), _compact(title)
+    best = 0.0
+    for artist in artists:
+        artist = _compact(artist)
+        if not artist:
+            continue
+        if artist in channel or artist in title:
+            return 1.0
+        best = max(best, SequenceMatcher(None, artist, channel).ratio())
+    return best
+
+
+# (score, rejected) of a video `duration` seconds long; None as score when either duration is unknown
+def _duration_score(duration_ms, duration):
+    if not duration_ms or not duration:
+        return None, False
+    expected = duration_ms / 1000
+    difference = abs(duration - expected)
+    limit = max(DURATION_LIMIT, expected * DURATION_LIMIT_SHARE)
+    if difference >= limit:
+        return 0.0, True
+    if difference <= DURATION_TOLERANCE:
+        return 1.0, False
+    return 1 - (difference - DURATION_TOLERANCE) / (limit - DURATION_TOLERANCE), False
+
+
+# Words of VERSION_WORDS in the title but not in the track's name
+def _version_words(name, title):
+    name, title = f" {' '.join(_words(name))} ", f" {' '.join(_words(title))} "
+    return [word for word in VERSION_WORDS if f' {word} ' in title and f' {word} ' not in name]
+
+
+def score_candidate(track, entry):
+    """ Scores a flat search entry against a Track.
+
+    Returns (score from 0 to 1, rejection reason or None). A candidate
+    too far off the track's duration is rejected whatever its score.
+    """
+    title = entry.get('title') or ''
+    channel = entry.get('channel') or entry.get('uploader') or ''
+    parts = {
+        'title': _title_score(track.name, title),
+        'artist': _artist_score(track.artists or (track.artist,), channel, title),
+    }
+    duration, too_far = _duration_score(track.duration_ms, entry.get('duration'))
+    if too_far:
+        return 0.0, REJECT_DURATION
+    if duration is not None:
+        parts['duration'] = duration
+    score = sum(WEIGHTS[part] * value for part, value in parts.items()) / sum(WEIGHTS[part] for part in parts)
+    score *= (1 - VERSION_PENALTY) ** len(_version_words(track.name, title))
+    return score, None
+
+
+def pick_candidate(track, entries, min_score=MIN_MATCH_SCORE):
+    """ Returns the best scoring acceptable entry, or None, and every entry as (entry, score, rejection reason).
+
+    Between equal scores the higher search result wins.
+    """
+    scored = []
+    for entry in entries:
+        score, reason = score_candidate(track, entry)
+        if reason is None and score < min_score:
+            reason = REJECT_SCORE
+        scored.append((entry, score, reason))
+    accepted = [(score, -rank, entry) for rank, (entry, score, reason) in enumerate(scored) if reason is None]
+    return (max(accepted, key=lambda item: item[:2])[2] if accepted else None), scored
+
+
+# Search cache key of `query` scored against `track`. A scored pick depends on the scoring rules and on the
+# track's duration, so neither a plain first result nor a pick made under other rules may answer it
+def match_key(query, track):
+    if track is None:
+        return query
+    duration = round(track.duration_ms / 1000) if track.duration_ms else '-'
+    return f'{query}\x1fmatch v{MATCH_VERSION} duration {duration}'
+
+
+# Append one search's candidates and the pick to the match log
+def log_match(query, track, scored, chosen, path=MATCH_LOG_FILE):
+    entry = {
+        'query': query,
+        'track_id': track.id,
+        'duration': track.duration_ms / 1000 if track.duration_ms else None,
+        'chosen': chosen['id'] if chosen else None,
+        'candidates': [{'id': candidate.get('id'), 'title': candidate.get('title'),
+                        'channel': candidate.get('channel') or candidate.get('uploader'),
+                        'duration': candidate.get('duration'), 'score': round(score, 3), 'rejected': reason}
+                       for candidate, score, reason in scored],
+        'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with _log_lock, open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(entry, ensure_ascii=False) + '\n')
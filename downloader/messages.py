@@ -0,0 +1,219 @@
+"""User-facing text of the interactive downloader, per language.
+
+Every entry is a str.format template with named fields. EnDownloader.py
+runs with 'en' and TRDownloader.py with 'tr'; a key missing from a
+language falls back to English.
+"""
+
+DEFAULT_LANGUAGE = 'en'
+
+MESSAGES = {
+    'en': {
+        # Values that differ per language but are not sentences
+        'media_output_path': 'downloads',
+        'answers_video': 'video v',
+        'answers_audio': 'audio a',
+
+        'arg_description': 'Media and Spotify downloader',
+        'arg_concurrency': 'number of tracks downloaded in parallel',
+        'arg_verify_manifest': 'verify the download manifest against the files on disk and exit',
+        'arg_metrics': 'periodically write batch progress metrics to PATH (JSON, or Prometheus text for *.prom)',
+        'arg_trace': 'record timed spans of every track stage and write them to PATH as a Chrome trace, with a latency summary',
+        'arg_profile': 'run under cProfile and write the profile to PATH',
+        'arg_report': "write a JSON results report to PATH ('-' for stdout)",
+        'arg_bandwidth': 'cap the download rate of each job, e.g. 2M or 500K',
+        'arg_command_url': 'download a video or audio URL',
+        'arg_audio': 'download audio only',
+        'arg_height': 'maximum video height',
+        'arg_format': 'output container (default: mp4, or AUDIO_FORMAT from config.json with --audio)',
+        'arg_audio_bitrate': 'audio bitrate in kbit/s with --audio',
+        'arg_segments': 'connections per large download (default: SEGMENTS from config.json)',
+        'arg_command_track': 'search a song on YouTube and download it',
+        'arg_track_name': 'song name, or a Spotify track URL without ARTIST',
+        'arg_bitrate': 'audio bitrate in kbit/s',
+        'arg_command_tracks': 'download Spotify tracks by ID, URL or URI',
+        'arg_shard': 'share the job with other workers using this SQLite file',
+        'arg_batch_size': 'tracks a worker takes at a time with --shard (default: 50)',
+        'arg_command_playlist': 'download a Spotify playlist',
+        'arg_command_album': 'download Spotify albums',
+        'arg_command_artist': "download a Spotify artist's albums and singles",
+        'arg_command_liked': 'download your liked songs from Spotify',
+        'arg_command_jobs': 'run jobs from a JSONL file or stdin',
+        'arg_command_serve': 'run as a service taking jobs over a local HTTP API',
+        'arg_listen': 'address to listen on (default: 127.0.0.1:8765)',
+        'arg_socket': 'listen on a Unix socket instead of TCP',
+        'arg_workers': 'jobs run at the same time',
+        'serve_listen_error': 'Cannot listen: {error}',
+
+        'spotify_connection_error': 'Error connecting to Spotify API: {error}',
+        'prompt_download_type': "Select the type you want to download (video / audio) or 'q' to quit: ",
+        'invalid_download_type': "Invalid option. Please enter 'video', 'audio', or 'q'.",
+        'video_quality_options': 'Video quality options:',
+        'prompt_video_quality': "Enter the number of the quality option you want to download (1-7) or 'q' to quit: ",
+        'audio_quality_options': 'Audio quality options:',
+        'audio_quality_best': '1. Best audio quality (320kbps)',
+        'audio_quality_better': '2. Better audio quality (192kbps)',
+        'audio_quality_good': '3. Good audio quality (128kbps)',
+        'prompt_audio_quality': "Enter the number of the audio quality option you want to download (1-3) or 'q' to quit: ",
+        'invalid_option_number': "Invalid option. Please enter a valid option number or 'q'.",
+        'media_download_error': 'An error occurred while downloading media: {error}',
+        'media_download_complete': 'Download complete.',
+        'media_downloading': 'Downloading... Downloaded: {percent} of {total}',
+
+        'prompt_song_name': "Enter the song name or a Spotify track URL (type 'q' to quit): ",
+        'prompt_artist_name': "Enter the artist name (type 'q' to quit): ",
+        'track_downloading': 'Downloading: {query} as {filename}',
+        'track_download_complete': 'Download complete: {filename}',
+        'track_not_found': 'No YouTube results for: {query}',
+        'track_no_match': 'No YouTube result matches: {query}',
+        'batch_finished': 'Finished: {succeeded} succeeded, {failed} failed, {skipped} already downloaded.',
+        'batch_failed_track': '  Failed: {name} - {artist}: {error}',
+        'batch_search_cache': 'Search cache: {hits} hits, {misses} misses.',
+        'batch_claim_waits': '{waited} tracks waited for a download running elsewhere, {taken_over} of them gave up waiting.',
+        'prompt_playlist_id': "Enter the Spotify playlist ID or URL (type 'q' to quit): ",
+        'prompt_album_ids': "Enter one or more Spotify album IDs or URLs, separated by spaces (type 'q' to quit): ",
+        'prompt_artist_id': "Enter the Spotify artist ID or URL (type 'q' to quit): ",
+        'spotify_invalid_link': 'Not a valid ID or URL for this option: {value}',
+        'spotify_track_not_found': 'Track not found on Spotify: {value}',
+
+        'settings_title': '\n--- Update Settings ---',
+        'prompt_client_id': 'Enter Spotify Client ID (current: {current}): ',
+        'prompt_client_secret': 'Enter Spotify Client Secret (current: {current}): ',
+        'prompt_download_path': 'Enter download path (current: {current}): ',
+        'prompt_concurrency': 'Enter number of parallel downloads (current: {current}): ',
+        'prompt_audio_format': 'Enter audio format for songs ({formats}) (current: {current}): ',
+        'prompt_bandwidth_limit': 'Enter total download bandwidth limit, e.g. 2M or 500K, 0 for none (current: {current}): ',
+        'invalid_bandwidth_limit': 'Invalid bandwidth limit, keeping the current one.',
+        'settings_updated': 'Settings updated successfully.',
+
+        'manifest_missing_file': '  Missing: {path}',
+        'manifest_checked': 'Manifest checked: {checked} downloaded files, {missing} missing files marked for re-download.',
+
+        'menu_title': '\n--- Main Menu ---',
+        'menu_media': '1. Video/Audio Downloader',
+        'menu_spotify': '2. Spotify Downloader',
+        'menu_liked': '3. Download Liked Songs from Spotify',
+        'menu_settings': '4. Update Settings',
+        'menu_verify': '5. Verify Download Manifest',
+        'menu_exit': 'Q. Exit',
+        'prompt_menu': 'Choose an option: ',
+        'exiting_program': 'Exiting the program.',
+        'prompt_output_format': 'Select download format (e.g., mp4, mkv, webm): ',
+        'prompt_media_url': 'Enter the URL of the video or audio you want to download: ',
+        'credentials_missing': 'Please set the API credentials first.',
+        'prompt_spotify_action': '1. Download Single Track\n2. Download Playlist\n3. Download Albums\n4. Download Artist Discography\nOption: ',
+        'invalid_selection': 'Invalid selection.',
+        'exiting': 'Exiting...',
+        'invalid_selection_retry': 'Invalid selection, please try again.',
+        'error': 'An error occurred: {error}',
+    },
+    'tr': {
+        'media_output_path': 'indirilenler',
+        'answers_video': 'video v',
+        'answers_audio': 'ses s',
+
+        'arg_description': 'Medya ve Spotify indirici',
+        'arg_concurrency': 'paralel indirilecek şarkı sayısı',
+        'arg_verify_manifest': 'indirme kaydını diskteki dosyalarla karşılaştır ve çık',
+        'arg_metrics': 'toplu indirme ilerleme metriklerini düzenli olarak PATH dosyasına yaz (JSON, *.prom için Prometheus metni)',
+        'arg_trace': "her şarkı aşamasının sürelerini kaydet ve PATH dosyasına Chrome izi olarak, gecikme özetiyle birlikte yaz",
+        'arg_profile': "cProfile ile çalıştır ve profili PATH dosyasına yaz",
+        'arg_report': "JSON sonuç raporunu PATH dosyasına yaz (stdout için '-')",
+        'arg_bandwidth': 'her işin indirme hızını sınırla, ör. 2M veya 500K',
+        'arg_command_url': "bir video veya ses URL'sini indir",
+        'arg_audio': 'yalnızca sesi indir',
+        'arg_height': 'en yüksek video yüksekliği',
+        'arg_format': 'çıktı kapsayıcısı (varsayılan: mp4, --audio ile config.json içindeki AUDIO_FORMAT)',
+        'arg_audio_bitrate': '--audio ile kbit/s cinsinden ses bit hızı',
+        'arg_segments': 'büyük indirmeler için bağlantı sayısı (varsayılan: config.json içindeki SEGMENTS)',
+        'arg_command_track': "bir şarkıyı YouTube'da ara ve indir",
+        'arg_track_name': "şarkı adı veya ARTIST olmadan bir Spotify şarkı URL'si",
+        'arg_bitrate': 'kbit/s cinsinden ses bit hızı',
+        'arg_command_tracks': 'Spotify şarkılarını ID, URL veya URI ile indir',
+        'arg_shard': 'işi bu SQLite dosyasını kullanan diğer çalışanlarla paylaş',
+        'arg_batch_size': '--shard ile bir çalışanın tek seferde aldığı şarkı sayısı (varsayılan: 50)',
+        'arg_command_playlist': 'bir Spotify çalma listesini indir',
+        'arg_command_album': 'Spotify albümlerini indir',
+        'arg_command_artist': "bir Spotify sanatçısının albümlerini ve single'larını indir",
+        'arg_command_liked': "Spotify'da beğendiğin şarkıları indir",
+        'arg_command_jobs': "işleri bir JSONL dosyasından veya stdin'den çalıştır",
+        'arg_command_serve': 'yerel bir HTTP API üzerinden iş alan bir servis olarak çalış',
+        'arg_listen': 'dinlenecek adres (varsayılan: 127.0.0.1:8765)',
+        'arg_socket': 'TCP yerine bir Unix soketinde dinle',
+        'arg_workers': 'aynı anda çalışan iş sayısı',
+        'serve_listen_error': 'Dinlenemiyor: {error}',
+
+        'spotify_connection_error': "Spotify API'ye bağlanırken bir hata oluştu: {error}",
+        'prompt_download_type': "İndirmek istediğiniz türü seçin (video / ses) veya 'q' ile çıkış yapın: ",
+        'invalid_download_type': "Geçersiz seçenek. Lütfen 'video', 'ses' veya 'q' girin.",
+        'video_quality_options': 'Video kalitesi seçenekleri:',
+        'prompt_video_quality': "İndirmek istediğiniz kalite seçeneğinin numarasını girin (1-7) veya 'q' ile çıkış yapın: ",
+        'audio_quality_options': 'Ses kalitesi seçenekleri:',
+        'audio_quality_best': '1. En iyi ses kalitesi (320kbps)',
+        'audio_quality_better': '2. Daha iyi ses kalitesi (192kbps)',
+        'audio_quality_good': '3. İyi ses kalitesi (128kbps)',
+        'prompt_audio_quality': "İndirmek istediğiniz ses kalitesi seçeneğinin numarasını girin (1-3) veya 'q' ile çıkış yapın: ",
+        'invalid_option_number': "Geçersiz seçenek. Lütfen geçerli bir seçenek numarası veya 'q' girin.",
+        'media_download_error': 'Medya indirilirken bir hata oluştu: {error}',
+        'media_download_complete': 'İndirme tamamlandı.',
+        'media_downloading': 'İndiriliyor... İndirilen: {percent} of {total}',
+
+        'prompt_song_name': "Şarkı adını veya Spotify şarkı URL'sini girin (çıkmak için 'q' yazın): ",
+        'prompt_artist_name': "Sanatçı adını girin (çıkmak için 'q' yazın): ",
+        'track_downloading': 'İndiriliyor: {query} olarak {filename}',
+        'track_download_complete': 'İndirme tamamlandı: {filename}',
+        'track_not_found': 'YouTube sonucu bulunamadı: {query}',
+        'track_no_match': 'Eşleşen YouTube sonucu bulunamadı: {query}',
+        'batch_finished': 'Tamamlandı: {succeeded} başarılı, {failed} başarısız, {skipped} zaten indirilmiş.',
+        'batch_failed_track': '  Başarısız: {name} - {artist}: {error}',
+        'batch_search_cache': 'Arama önbelleği: {hits} isabet, {misses} ıska.',
+        'batch_claim_waits': '{waited} şarkı başka yerde süren bir indirmeyi bekledi, {taken_over} tanesi beklemeyi bıraktı.',
+        'prompt_playlist_id': "Spotify çalma listesi ID'sini veya URL'sini girin (çıkmak için 'q' yazın): ",
+        'prompt_album_ids': "Bir veya daha fazla Spotify albüm ID'si veya URL'si girin, boşlukla ayırarak (çıkmak için 'q' yazın): ",
+        'prompt_artist_id': "Spotify sanatçı ID'sini veya URL'sini girin (çıkmak için 'q' yazın): ",
+        'spotify_invalid_link': 'Bu seçenek için geçerli bir ID veya URL değil: {value}',
+        'spotify_track_not_found': "Şarkı Spotify'da bulunamadı: {value}",
+
+        'settings_title': '\n--- Ayarları Güncelle ---',
+        'prompt_client_id': "Spotify Client ID'sini girin (mevcut: {current}): ",
+        'prompt_client_secret': "Spotify Client Secret'ı girin (mevcut: {current}): ",
+        'prompt_download_path': 'İndirme yolunu girin (mevcut: {current}): ',
+        'prompt_concurrency': 'Paralel indirme sayısını girin (mevcut: {current}): ',
+        'prompt_audio_format': 'Şarkılar için ses formatını girin ({formats}) (mevcut: {current}): ',
+        'prompt_bandwidth_limit': 'Toplam indirme bant genişliği sınırını girin, örn. 2M veya 500K, sınırsız için 0 (mevcut: {current}): ',
+        'invalid_bandwidth_limit': 'Geçersiz bant genişliği sınırı, mevcut değer korunuyor.',
+        'settings_updated': 'Ayarlar başarıyla güncellendi.',
+
+        'manifest_missing_file': '  Eksik: {path}',
+        'manifest_checked': 'Kayıt kontrol edildi: {checked} indirilmiş dosya, {missing} eksik dosya yeniden indirilmek üzere işaretlendi.',
+
+        'menu_title': '\n--- Ana Menü ---',
+        'menu_media': '1. Video/Ses İndirici',
+        'menu_spotify': '2. Spotify İndirici',
+        'menu_liked': '3. Spotify Beğenilen Şarkıları İndir',
+        'menu_settings': '4. Ayarları Güncelle',
+        'menu_verify': '5. İndirme Kaydını Doğrula',
+        'menu_exit': 'Q. Çıkış',
+        'prompt_menu': 'Bir seçenek seçin: ',
+        'exiting_program': 'Programdan çıkılıyor.',
+        'prompt_output_format': 'İndirme formatını seçin (örn. mp4, mkv, webm): ',
+        'prompt_media_url': "İndirmek istediğiniz video veya ses URL'sini girin: ",
+        'credentials_missing': 'Lütfen önce API kimlik bilgilerini ayarlayın.',
+        'prompt_spotify_action': '1. Tek Şarkı İndir\n2. Çalma Listesi İndir\n3. Albüm İndir\n4. Sanatçı Diskografisi İndir\nSeçenek: ',
+        'invalid_selection': 'Geçersiz seçim.',
+        'exiting': 'Çıkılıyor...',
+        'invalid_selection_retry': 'Geçersiz seçim, lütfen tekrar deneyin.',
+        'error': 'Bir hata oluştu: {error}',
+    },
+}
+
+
+# Message catalogue for `language`: a function key, **fields -> text
+def catalogue(language):
+    messages = MESSAGES.get(language, {})
+    fallback = MESSAGES[DEFAULT_LANGUAGE]
+
+    def text(key, **fields):
+        template = messages.get(key, fallback[key])
+        return template.format(**fields) if fields else template
+    return text
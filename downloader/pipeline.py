@@ -0,0 +1,114 @@
+"""Staged track pipeline joined by bounded queues."""
+
+import queue
+import threading
+from collections import namedtuple
+
+from downloader.batch import BatchSummary
+from downloader.retry import RetryScheduler
+
+# One step of the pipeline: func(item, value) returns the value for the next stage
+Stage = namedtuple('Stage', ['name', 'func', 'workers'])
+
+# Returned by a stage to finish an item successfully without running the later stages
+COMPLETE = object()
+
+_DONE = object()
+
+
+class Requeue(Exception):
+    """ Raised by a stage that can't handle an item yet, to get it back after `delay` seconds.
+
+    Unlike a retry this is not a failure: no attempt is counted.
+    """
+
+    def __init__(self, delay):
+        super().__init__(delay)
+        self.delay = delay
+
+
+def run_pipeline(items, stages, skip=None, on_failure=None, retry=None):
+    """ Pushes every item through `stages`, each on its own pool of threads.
+
+    Stages are connected by queues holding at most twice the next stage's
+    worker count, so a slow stage applies back-pressure to the ones before
+    it and `items` is only consumed as fast as the pipeline drains. The
+    first stage receives the item itself as its value.
+
+    When a stage raises, retry(error, attempt) may return a delay in
+    seconds: the item is then put back into the same stage after that
+    delay by a scheduler thread, without holding a worker. Otherwise the
+    item is dropped, recorded in the summary and on_failure(item, error)
+    is called; the rest of the batch carries on. A stage raising Requeue
+    gets the item back the same way, with the attempt count unchanged.
+    """
+    summary = BatchSummary()
+    queues = [queue.Queue(maxsize=stage.workers * 2) for stage in stages]
+    scheduler = RetryScheduler()
+    threads = []
+
+    # Items fed in and not yet finished, including those waiting for a retry
+    pending = [0]
+    idle = threading.Condition()
+
+    def finish():
+        with idle:
+            pending[0] -= 1
+            if pending[0] == 0:
+                idle.notify_all()
+
+    def work(index):
+        stage = stages[index]
+        while True:
+            job = queues[index].get()
+            if job is _DONE:
+                break
+            item, value, attempt = job
+            try:
+                result = stage.func(item, value)
+            except Requeue as e:
+                scheduler.schedule(e.delay, lambda job=(item, value, attempt): queues[index].put(job))
+                continue
+            except Exception as e:
+                delay = retry(e, attempt) if retry is not None else None
+                if delay is not None:
+                    scheduler.schedule(delay, lambda job=(item, value, attempt + 1): queues[index].put(job))
+                    continue
+                summary.record_failure(item, e)
+                if on_failure is not None:
+                    on_failure(item, e)
+                finish()
+                continue
+            if result is not COMPLETE and index + 1 < len(stages):
+                queues[index + 1].put((item, result, 1))
+            else:
+                summary.record_success(item)
+                finish()
+
+    for index, stage in enumerate(stages):
+        for number in range(1, stage.workers + 1):
+            thread = threading.Thread(target=work, args=(index,), name=f'{stage.name}-{number}', daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    try:
+        for item in items:
+            if skip is not None and skip(item):
+                summary.record_skipped(item)
+                continue
+            with idle:
+                pending[0] += 1
+            queues[0].put((item, item, 1))
+
+        # Retries can send an item back to any stage, so wait until nothing is left anywhere
+        with idle:
+            while pending[0]:
+                idle.wait()
+    finally:
+        scheduler.close()
+        for index, stage in enumerate(stages):
+            for _ in range(stage.workers):
+                queues[index].put(_DONE)
+        for thread in threads:
+            thread.join()
+    return summary
@@ -0,0 +1,259 @@
+"""Aggregated batch progress with a throttled renderer and metrics export.
+
+yt-dlp calls its progress hooks many times per second per download. The
+aggregator only updates counters in those hooks; a single background
+thread renders one status line every REFRESH_INTERVAL seconds and
+periodically writes the same counters to a metrics file, as JSON or, for
+a path ending in .prom, in Prometheus text format.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from downloader import ratelimit
+from downloader.bandwidth import BANDWIDTH
+
+# Seconds between two rendered status lines
+REFRESH_INTERVAL = 2.0
+
+# Seconds between two metrics file writes
+METRICS_INTERVAL = 10.0
+
+# Rates are averaged over this many seconds
+RATE_WINDOW = 30.0
+
+
+# Lets through at most one call per interval; for per-callback output such as progress hooks
+class Throttle:
+    def __init__(self, interval=REFRESH_INTERVAL):
+        self.interval = interval
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def ready(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last < self.interval:
+                return False
+            self._last = now
+            return True
+
+
+def _format_bytes(count):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if count < 1024 or unit == 'GiB':
+            return f'{count:.1f} {unit}' if unit != 'B' else f'{count:.0f} B'
+        count /= 1024
+
+
+def _format_eta(seconds):
+    if seconds is None:
+        return '--:--:--'
+    seconds = int(seconds)
+    return f'{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+class ProgressAggregator:
+    """ Collects progress from every worker of a batch.
+
+    Use it as a context manager around the batch: entering starts the
+    render/metrics thread, leaving stops it after a final render and
+    metrics write. render=False keeps it silent (metrics only).
+    """
+
+    def __init__(self, metrics_path=None, render=True, stream=None,
+                 refresh=REFRESH_INTERVAL, metrics_interval=METRICS_INTERVAL):
+        self.metrics_path = metrics_path
+        self.render_enabled = render
+        self.stream = stream or sys.stdout
+        self.refresh = refresh
+        self.metrics_interval = metrics_interval
+        self.total = None
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        # Tracks waiting for a recording another worker or process is fetching
+        self.waiting = 0
+        self.bytes_downloaded = 0
+        self.started_at = time.monotonic()
+        self._workers = {}
+        self._file_bytes = {}
+        self._samples = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name='progress', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._flush()
+
+    # Expected number of tracks, once the first Spotify page tells us
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+
+    # Show the calling worker thread as busy with `state` ('search', 'encode', ...) until the block ends
+    @contextmanager
+    def working(self, state):
+        name = threading.current_thread().name
+        with self._lock:
+            self._workers[name] = state
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._workers.pop(name, None)
+
+    def track_done(self, ok=True):
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def track_skipped(self):
+        with self._lock:
+            self.skipped += 1
+
+    # A track starts (1) or stops (-1) waiting for a recording that is being fetched elsewhere
+    def track_waiting(self, change=1):
+        with self._lock:
+            self.waiting += change
+
+    def hook(self, d):
+        """ yt-dlp progress hook; cheap enough to run on every callback. """
+        filename = d.get('filename') or d.get('tmpfilename')
+        downloaded = d.get('downloaded_bytes') or 0
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        with self._lock:
+            previous = self._file_bytes.get(filename, 0)
+            if downloaded > previous:
+                self.bytes_downloaded += downloaded - previous
+                self._file_bytes[filename] = downloaded
+            if d.get('status') == 'finished':
+                self._file_bytes.pop(filename, None)
+                self._workers[threading.current_thread().name] = 'downloaded'
+            elif total:
+                self._workers[threading.current_thread().name] = f'{downloaded * 100 // total}%'
+            else:
+                self._workers[threading.current_thread().name] = _format_bytes(downloaded)
+
+    def snapshot(self):
+        """ Current counters and rates as a dict. """
+        now = time.monotonic()
+        with self._lock:
+            finished = self.completed + self.failed + self.skipped
+            self._samples.append((now, self.bytes_downloaded, finished))
+            while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW:
+                self._samples.popleft()
+            first_time, first_bytes, first_finished = self._samples[0]
+            span = now - first_time
+            bytes_per_second = (self.bytes_downloaded - first_bytes) / span if span > 0 else 0.0
+            tracks_per_minute = (finished - first_finished) * 60 / span if span > 0 else 0.0
+            remaining = self.total - finished if self.total is not None else None
+            eta = remaining * 60 / tracks_per_minute if remaining is not None and tracks_per_minute > 0 else None
+            return {
+                'total': self.total,
+                'completed': self.completed,
+                'failed': self.failed,
+                'skipped': self.skipped,
+                'waiting': self.waiting,
+                'bytes_downloaded': self.bytes_downloaded,
+                'bytes_per_second': bytes_per_second,
+                'tracks_per_minute': tracks_per_minute,
+                'eta_seconds': eta,
+                'elapsed_seconds': now - self.started_at,
+                'workers': dict(self._workers),
+            }
+
+    def render(self, snapshot):
+        done = snapshot['completed'] + snapshot['failed'] + snapshot['skipped']
+        total = snapshot['total'] if snapshot['total'] is not None else '?'
+        workers = ' '.join(f'{name}:{state}' for name, state in sorted(snapshot['workers'].items()))
+        line = (f"[{done}/{total}] {_format_bytes(snapshot['bytes_per_second'])}/s "
+                f"{snapshot['tracks_per_minute']:.1f} tracks/min ETA {_format_eta(snapshot['eta_seconds'])} "
+                f"ok {snapshot['completed']} failed {snapshot['failed']} skipped {snapshot['skipped']}")
+        if snapshot['waiting']:
+            line += f" waiting {snapshot['waiting']}"
+        if workers:
+            line += f' | {workers}'
+        if BANDWIDTH.rate:
+            line += f' | {BANDWIDTH.status()}'
+        print(f'{line} | {ratelimit.status_line()}', file=self.stream, flush=True)
+
+    def write_metrics(self, snapshot):
+        if self.metrics_path.endswith('.prom'):
+            text = prometheus_text(snapshot)
+        else:
+            limiters = {limiter.name: {'rate': limiter.rate, 'concurrency': limiter.concurrency,
+                                       'active': limiter.active, 'throttled': limiter.throttled}
+                        for limiter in ratelimit.LIMITERS}
+            text = json.dumps(dict(snapshot, limiters=limiters, updated_at=time.time()), indent=2) + '\n'
+        temp_path = self.metrics_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(temp_path, self.metrics_path)
+
+    def _run(self):
+        last_metrics = time.monotonic()
+        while not self._stop.wait(self.refresh):
+            snapshot = self.snapshot()
+            if self.render_enabled:
+                self.render(snapshot)
+            if self.metrics_path and time.monotonic() - last_metrics >= self.metrics_interval:
+                self.write_metrics(snapshot)
+                last_metrics = time.monotonic()
+
+    def _flush(self):
+        snapshot = self.snapshot()
+        if self.render_enabled:
+            self.render(snapshot)
+        if self.metrics_path:
+            self.write_metrics(snapshot)
+
+
+def prometheus_text(snapshot):
+    """ Renders a snapshot in the Prometheus text exposition format. """
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{name}{labels} {value}' for labels, value in samples)
+
+    if snapshot['total'] is not None:
+        family('downloader_tracks_total', 'gauge', 'Tracks in the current batch', [('', snapshot['total'])])
+    family('downloader_tracks_completed', 'counter', 'Tracks downloaded successfully', [('', snapshot['completed'])])
+    family('downloader_tracks_failed', 'counter', 'Tracks that failed for good', [('', snapshot['failed'])])
+    family('downloader_tracks_skipped', 'counter', 'Tracks already in the manifest', [('', snapshot['skipped'])])
+    family('downloader_tracks_waiting', 'gauge', 'Tracks waiting for a recording fetched elsewhere',
+           [('', snapshot['waiting'])])
+    family('downloader_downloaded_bytes', 'counter', 'Bytes downloaded', [('', snapshot['bytes_downloaded'])])
+    family('downloader_download_bytes_per_second', 'gauge', 'Recent download throughput',
+           [('', f"{snapshot['bytes_per_second']:.1f}")])
+    family('downloader_tracks_per_minute', 'gauge', 'Recent track throughput',
+           [('', f"{snapshot['tracks_per_minute']:.2f}")])
+    if snapshot['eta_seconds'] is not None:
+        family('downloader_eta_seconds', 'gauge', 'Estimated time to finish the batch',
+               [('', f"{snapshot['eta_seconds']:.0f}")])
+    family('downloader_busy_workers', 'gauge', 'Workers currently handling a track', [('', len(snapshot['workers']))])
+
+    limiters = [(f'{{limiter="{limiter.name}"}}', limiter) for limiter in ratelimit.LIMITERS]
+    family('downloader_ratelimit_rate', 'gauge', 'Allowed requests per second',
+           [(labels, f'{limiter.rate:.2f}') for labels, limiter in limiters])
+    family('downloader_ratelimit_concurrency', 'gauge', 'Allowed concurrent requests',
+           [(labels, limiter.concurrency) for labels, limiter in limiters])
+    family('downloader_ratelimit_throttled', 'counter', 'HTTP 429 responses seen',
+           [(labels, limiter.throttled) for labels, limiter in limiters])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,169 @@
+"""Client-side rate limiting with adaptive (AIMD) concurrency.
+
+One limiter per remote service is shared by every worker in the process:
+a token bucket caps the request rate, and a concurrency limit is raised
+by one after a run of healthy calls and halved on throttling (HTTP 429)
+or, where a latency target is set, on slow responses. A Retry-After from
+the server pauses the whole bucket, not just the thread that saw it.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from downloader.retry import ERROR_RATE_LIMITED, classify_error, retry_after
+
+# Pause used when a 429 arrives without a Retry-After header
+DEFAULT_THROTTLE_PAUSE = 5.0
+
+# Decreases closer together than this count as one congestion event
+DECREASE_COOLDOWN = 2.0
+
+# How many throttled attempts RateLimiter.call() absorbs before giving up
+MAX_THROTTLE_RETRIES = 5
+
+
+class RateLimiter:
+    def __init__(self, name, rate, burst, max_concurrency, min_concurrency=1, latency_target=None):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.active = 0
+        self.throttled = 0
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._successes = 0
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    # Raise or lower the ceiling, e.g. from the CONCURRENCY setting. A limiter held below its ceiling after
+    # throttling stays there and climbs back by additive increase; one running at its ceiling follows it
+    def configure(self, max_concurrency):
+        with self._condition:
+            max_concurrency = max(self.min_concurrency, max_concurrency)
+            if self.concurrency >= self.max_concurrency:
+                self.concurrency = max_concurrency
+            else:
+                self.concurrency = min(self.concurrency, max_concurrency)
+            self.max_concurrency = max_concurrency
+            self._condition.notify_all()
+
+    def acquire(self):
+        with self._condition:
+            while self.active >= self.concurrency:
+                self._condition.wait()
+            self.active += 1
+        try:
+            self._take_token()
+        except BaseException:
+            self._leave()
+            raise
+
+    def _take_token(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+                    self._refilled_at = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def _leave(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def release(self, latency, error=None):
+        with self._condition:
+            self.active -= 1
+            now = time.monotonic()
+            if error is not None and classify_error(error) == ERROR_RATE_LIMITED:
+                self.throttled += 1
+                pause = retry_after(error) or DEFAULT_THROTTLE_PAUSE
+                self._paused_until = max(self._paused_until, now + pause)
+                self._decrease(now, rate=True)
+            elif error is None and self.latency_target is not None and latency > self.latency_target:
+                self._decrease(now, rate=False)
+            elif error is None:
+                self._increase()
+            self._condition.notify_all()
+
+    # Multiplicative decrease, once per congestion event
+    def _decrease(self, now, rate):
+        self._successes = 0
+        if now - self._decreased_at < DECREASE_COOLDOWN:
+            return
+        self._decreased_at = now
+        self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+        if rate:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    # Additive increase: one more slot after `concurrency` healthy calls in a row
+    def _increase(self):
+        self._successes += 1
+        if self._successes >= self.concurrency:
+            self._successes = 0
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.release(time.monotonic() - start, e)
+            raise
+        else:
+            self.release(time.monotonic() - start)
+
+    def call(self, func, *args, **kwargs):
+        """ Runs func inside a slot, waiting out and retrying throttled attempts. """
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            try:
+                with self.slot():
+                    return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == MAX_THROTTLE_RETRIES or classify_error(e) != ERROR_RATE_LIMITED:
+                    raise
+
+    # Short human-readable state for progress output
+    def status(self):
+        with self._condition:
+            text = f'{self.name} {self.rate:.1f}/s {self.active}/{self.concurrency}'
+            backoff = self._paused_until - time.monotonic()
+        if backoff > 0:
+            text += f' backoff {backoff:.0f}s'
+        if self.throttled:
+            text += f' 429x{self.throttled}'
+        return text
+
+
+# Spotify Web API calls (pagination, lookups)
+SPOTIFY = RateLimiter('spotify', rate=10.0, burst=10, max_concurrency=4, latency_target=5.0)
+
+# YouTube searches; slow answers are an early sign of throttling
+YOUTUBE_SEARCH = RateLimiter('youtube-search', rate=2.0, burst=4, max_concurrency=4, latency_target=10.0)
+
+# YouTube extraction and download starts; download time depends on size, so no latency target
+YOUTUBE_MEDIA = RateLimiter('youtube-media', rate=2.0, burst=4, max_concurrency=4)
+
+LIMITERS = (SPOTIFY, YOUTUBE_SEARCH, YOUTUBE_MEDIA)
+
+
+# One line describing every limiter
+def status_line():
+    return ' | '.join(limiter.status() for limiter in LIMITERS)
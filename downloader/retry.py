@@ -0,0 +1,194 @@
+"""Retry policies, jittered exponential backoff and the retry scheduler."""
+
+import heapq
+import itertools
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from email.utils import parsedate_to_datetime
+
+import requests
+from yt_dlp.networking.exceptions import TransportError
+
+# How often and how patiently one class of error is retried
+RetryPolicy = namedtuple('RetryPolicy', ['attempts', 'base_delay', 'max_delay'])
+
+# Error classes, see classify_error()
+ERROR_RATE_LIMITED = 'rate_limited'
+ERROR_SERVER = 'server'
+ERROR_NETWORK = 'network'
+ERROR_PERMANENT = 'permanent'
+ERROR_OTHER = 'other'
+
+DEFAULT_POLICIES = {
+    ERROR_RATE_LIMITED: RetryPolicy(attempts=6, base_delay=5.0, max_delay=300.0),
+    ERROR_SERVER: RetryPolicy(attempts=4, base_delay=2.0, max_delay=60.0),
+    ERROR_NETWORK: RetryPolicy(attempts=5, base_delay=1.0, max_delay=60.0),
+    ERROR_PERMANENT: RetryPolicy(attempts=1, base_delay=0.0, max_delay=0.0),
+    ERROR_OTHER: RetryPolicy(attempts=2, base_delay=2.0, max_delay=30.0),
+}
+
+# Tracks that still failed after their last attempt, appended after every batch
+DEAD_LETTER_FILE = 'dead_letter.jsonl'
+
+HTTP_STATUS_RE = re.compile(r'HTTP Error (\d{3})')
+
+
+# Walk an error and the errors it wraps (yt-dlp nests them in exc_info and cause)
+def _error_chain(error):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        exc_info = getattr(error, 'exc_info', None)
+        wrapped = exc_info[1] if isinstance(exc_info, tuple) and len(exc_info) > 1 else None
+        error = wrapped or getattr(error, 'cause', None) or error.__cause__ or error.__context__
+
+
+# HTTP status carried by a yt-dlp, spotipy or requests error, if any
+def _http_status(error):
+    for attr in ('status', 'http_status'):
+        status = getattr(error, attr, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if isinstance(status, int):
+        return status
+    match = HTTP_STATUS_RE.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+# Seconds the server asked us to wait (Retry-After), if it said so
+def retry_after(error):
+    for cause in _error_chain(error):
+        headers = getattr(cause, 'headers', None) or getattr(getattr(cause, 'response', None), 'headers', None)
+        value = headers.get('Retry-After') if headers else None
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def classify_error(error):
+    """ Sorts an exception into one of the ERROR_* classes.
+
+    Rate limiting and server errors are recognised by HTTP status, dropped
+    connections by their transport exception type. Client errors, missing
+    search results and videos yt-dlp reports as expected failures (private,
+    removed, geo-blocked) are permanent and not worth another attempt.
+    """
+    for cause in _error_chain(error):
+        status = _http_status(cause)
+        if status == 429:
+            return ERROR_RATE_LIMITED
+        if status is not None and status >= 500:
+            return ERROR_SERVER
+        if status is not None and 400 <= status < 500:
+            return ERROR_PERMANENT
+        if isinstance(cause, (TransportError, requests.ConnectionError, requests.Timeout,
+                              ConnectionError, TimeoutError)):
+            return ERROR_NETWORK
+        if isinstance(cause, LookupError) or getattr(cause, 'expected', False) is True:
+            return ERROR_PERMANENT
+        if isinstance(cause, subprocess.CalledProcessError):
+            return ERROR_OTHER
+    return ERROR_OTHER
+
+
+# Full-jitter exponential backoff: uniform between 0 and the capped exponential delay
+def backoff_delay(policy, attempt):
+    return random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1)))
+
+
+def retry_delay(error, attempt, policies=DEFAULT_POLICIES):
+    """ Returns how long to wait before attempt `attempt + 1`, or None to give up. """
+    error_class = classify_error(error)
+    policy = policies[error_class]
+    if attempt >= policy.attempts:
+        return None
+    delay = backoff_delay(policy, attempt)
+    if error_class == ERROR_RATE_LIMITED:
+        delay = max(delay, retry_after(error) or 0.0)
+    return delay
+
+
+# Call func(*args) and retry it in place according to the policies; for one-off work
+def call_with_retry(func, *args, policies=DEFAULT_POLICIES, **kwargs):
+    attempt = 1
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            delay = retry_delay(e, attempt, policies)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+class RetryScheduler:
+    """ Runs callbacks after a delay on one background thread.
+
+    Pipeline workers hand a failed item to the scheduler instead of
+    sleeping, so a backoff never ties up a download slot.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='retry-scheduler', daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay, callback):
+        with self._condition:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), callback))
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+                _, _, callback = heapq.heappop(self._heap)
+            callback()
+
+
+# Append the tracks that failed for good to the dead-letter file
+def write_dead_letters(failed, path=DEAD_LETTER_FILE):
+    if not failed:
+        return
+    failed_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with open(path, 'a', encoding='utf-8') as file:
+        for track, error in failed:
+            entry = {
+                'id': track.id,
+                'name': track.name,
+                'artist': track.artist,
+                'error': str(error),
+                'error_class': classify_error(error),
+                'failed_at': failed_at,
+            }
+            file.write(json.dumps(entry, ensure_ascii=False) + '\n')
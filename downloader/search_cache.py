@@ -0,0 +1,117 @@
+"""On-disk cache mapping YouTube search queries to video IDs."""
+
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Cache database path, next to config.json
+SEARCH_CACHE_FILE = 'search_cache.db'
+
+# Entries older than this are searched again
+SEARCH_CACHE_TTL = 30 * 24 * 3600
+
+# Least recently used entries are evicted beyond this many
+SEARCH_CACHE_SIZE = 20000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    query TEXT PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+# Fold case, width and spacing so equivalent queries share a cache entry
+def normalize_query(query):
+    query = unicodedata.normalize('NFKC', query).casefold()
+    return re.sub(r'\s+', ' ', query).strip()
+
+
+class SearchCache:
+    """ TTL and size-bounded LRU cache of search query -> video ID.
+
+    Like the manifest, a single SQLite connection is shared between worker
+    threads behind a lock. Hit and miss counts cover the lifetime of the
+    object so they can be reported at the end of a run.
+    """
+
+    def __init__(self, path=SEARCH_CACHE_FILE, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(SCHEMA)
+        self._size = self._db.execute('SELECT COUNT(*) FROM searches').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get(self, query):
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute('SELECT video_id, created_at FROM searches WHERE query = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute('DELETE FROM searches WHERE query = ?', (key,))
+                self._size -= 1
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE searches SET last_used = ? WHERE query = ?', (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, query, video_id):
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock, self._db:
+            cursor = self._db.execute('UPDATE searches SET video_id = ?, created_at = ?, last_used = ? WHERE query = ?',
+                                      (video_id, now, now, key))
+            if cursor.rowcount == 0:
+                self._db.execute('INSERT INTO searches (query, video_id, created_at, last_used) VALUES (?, ?, ?, ?)',
+                                 (key, video_id, now, now))
+                self._size += 1
+            if self._size > self.max_entries:
+                self._evict()
+
+    # Forget a query, e.g. when its cached video can no longer be downloaded
+    def invalidate(self, query):
+        with self._lock, self._db:
+            if self._db.execute('DELETE FROM searches WHERE query = ?', (normalize_query(query),)).rowcount:
+                self._size -= 1
+
+    # Drop the least recently used entries down to 90% of the limit
+    def _evict(self):
+        keep = int(self.max_entries * 0.9)
+        self._db.execute('DELETE FROM searches WHERE query NOT IN '
+                         '(SELECT query FROM searches ORDER BY last_used DESC LIMIT ?)', (keep,))
+        self._size = self._db.execute('SELECT COUNT(*) FROM searches').fetchone()[0]
+
+    # Return the cached video ID for query, calling search(query) on a miss. The entry is stored under `key`
+    # when given, for results that depend on more than the query
+    def resolve(self, query, search, key=None):
+        key = query if key is None else key
+        video_id = self.get(key)
+        if video_id is None:
+            video_id = search(query)
+            if video_id is not None:
+                self.put(key, video_id)
+        return video_id
@@ -0,0 +1,253 @@
+"""Multi-connection downloads of large media files.
+
+A single HTTP connection rarely fills a high-latency link, which hurts
+most with large 1080p and 4K selections. SegmentedYoutubeDL downloads:
+
+- large progressive files (plain HTTP) as byte ranges fetched over
+  `segments` connections at once, written straight into place in the
+  .part file, so nothing beyond one read block per connection is held in
+  memory;
+- DASH and HLS fragments `segments` at a time (yt-dlp's
+  concurrent_fragment_downloads);
+- the video and audio formats of a bestvideo+bestaudio selection at the
+  same time instead of one after the other.
+
+Finished byte ranges are recorded next to the .part file, so an
+interrupted segmented download resumes with the ranges still missing.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import yt_dlp
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+from yt_dlp.utils import ContentTooShortError, DownloadError
+
+# Files smaller than this are downloaded over one connection
+MIN_SEGMENTED_SIZE = 16 * 1024 * 1024
+
+# Byte range requested at a time; free connections take the next missing one
+PIECE_SIZE = 8 * 1024 * 1024
+
+# Bytes read from a connection at a time
+READ_SIZE = 256 * 1024
+
+# Default attempts per byte range, like yt-dlp's fragment_retries
+PIECE_RETRIES = 10
+
+
+# The server answered a range request with the whole file
+class RangesNotSupported(Exception):
+    pass
+
+
+class SegmentedHttpFD(HttpFD):
+    """ HttpFD that splits a large file into byte ranges fetched in parallel.
+
+    Falls back to the regular single-connection download when the size is
+    unknown or small, when there is a single-connection .part file to
+    resume, or when the server doesn't answer range requests.
+    """
+
+    def real_download(self, filename, info_dict):
+        segments = self.params.get('concurrent_fragment_downloads') or 1
+        tmpfilename = self.temp_name(filename)
+        state_path = tmpfilename + '.segments'
+        resumable = not os.path.exists(tmpfilename) or os.path.exists(state_path)
+        if segments < 2 or filename == '-' or tmpfilename == filename or not resumable:
+            return super().real_download(filename, info_dict)
+        size = info_dict.get('filesize') or self._probe_size(info_dict)
+        if not size or size < MIN_SEGMENTED_SIZE:
+            return super().real_download(filename, info_dict)
+        try:
+            return self._download_segments(filename, tmpfilename, state_path, size, segments, info_dict)
+        except RangesNotSupported:
+            self.try_remove(tmpfilename)
+            self.try_remove(state_path)
+            return super().real_download(filename, info_dict)
+
+    # Content length of a server that accepts range requests, None otherwise
+    def _probe_size(self, info_dict):
+        try:
+            response = self.ydl.urlopen(Request(info_dict['url'], headers=info_dict.get('http_headers'),
+                                                method='HEAD'))
+        except (HTTPError, TransportError):
+            return None
+        with response:
+            if response.headers.get('Accept-Ranges', '').lower() != 'bytes':
+                return None
+            length = response.headers.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+
+    def _download_segments(self, filename, tmpfilename, state_path, size, segments, info_dict):
+        pieces = [(start, min(start + PIECE_SIZE, size)) for start in range(0, size, PIECE_SIZE)]
+        done = set()
+        if os.path.exists(state_path):
+            with open(state_path, 'r') as file:
+                state = json.load(file)
+            if state.get('size') == size:
+                done = set(state['done'])
+        if not os.path.exists(tmpfilename):
+            with open(tmpfilename, 'wb') as file:
+                file.truncate(size)
+        missing = [index for index in range(len(pieces)) if index not in done]
+
+        lock = threading.Lock()
+        progress = {'downloaded': sum(pieces[index][1] - pieces[index][0] for index in done)}
+        start_time = time.time()
+
+        def report(nbytes):
+            # One report at a time keeps downloaded_bytes increasing for every hook
+            with lock:
+                progress['downloaded'] += nbytes
+                now = time.time()
+                speed = self.calc_speed(start_time, now, progress['downloaded'])
+                self._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': progress['downloaded'],
+                    'total_bytes': size,
+                    'tmpfilename': tmpfilename,
+                    'filename': filename,
+                    'eta': self.calc_eta(speed, size - progress['downloaded']),
+                    'speed': speed,
+                    'elapsed': now - start_time,
+                    'ctx_id': info_dict.get('ctx_id'),
+                }, info_dict)
+
+        def finish_piece(index):
+            with lock:
+                done.add(index)
+                temp_path = state_path + '.tmp'
+                with open(temp_path, 'w') as file:
+                    json.dump({'size': size, 'done': sorted(done)}, file)
+                os.replace(temp_path, state_path)
+
+        def fetch(index):
+            if failed.is_set():
+                return
+            start, end = pieces[index]
+            position = {'offset': start}
+            retries = self.params.get('fragment_retries', PIECE_RETRIES)
+            for attempt in range(retries + 1):
+                try:
+                    # A retry continues where the previous attempt stopped
+                    self._fetch_piece(info_dict, tmpfilename, position, end, report)
+                    finish_piece(index)
+                    return
+                except (HTTPError, TransportError, ContentTooShortError, OSError) as e:
+                    if attempt == retries:
+                        raise DownloadError(f'byte range {start}-{end - 1} failed: {e}') from e
+                    time.sleep(min(2 ** attempt, 30))
+
+        self.report_destination(filename)
+        # After a failed range the queued ones are dropped; the .segments file keeps what finished
+        failed = threading.Event()
+        with ThreadPoolExecutor(max_workers=segments) as pool:
+            try:
+                for future in [pool.submit(fetch, index) for index in missing]:
+                    future.result()
+            except BaseException:
+                failed.set()
+                raise
+
+        self.try_remove(state_path)
+        self.try_rename(tmpfilename, filename)
+        self._hook_progress({
+            'downloaded_bytes': size,
+            'total_bytes': size,
+            'filename': filename,
+            'status': 'finished',
+            'elapsed': time.time() - start_time,
+            'ctx_id': info_dict.get('ctx_id'),
+        }, info_dict)
+        return True
+
+    def _fetch_piece(self, info_dict, tmpfilename, position, end, report):
+        """ Writes bytes position['offset']..end-1 into tmpfilename at their offset, advancing the offset. """
+        start = position['offset']
+        headers = dict(info_dict.get('http_headers') or {}, Range=f'bytes={start}-{end - 1}')
+        headers['Accept-Encoding'] = 'identity'
+        with self.ydl.urlopen(Request(info_dict['url'], headers=headers)) as response:
+            if response.status != 206:
+                raise RangesNotSupported()
+            # Every connection has its own handle, so writes at different offsets don't interfere
+            with open(tmpfilename, 'r+b') as file:
+                file.seek(start)
+                while position['offset'] < end:
+                    block = response.read(min(READ_SIZE, end - position['offset']))
+                    if not block:
+                        break
+                    file.write(block)
+                    position['offset'] += len(block)
+                    report(len(block))
+        if position['offset'] != end:
+            raise ContentTooShortError(position['offset'] - start, end - start)
+
+
+class SegmentedYoutubeDL(yt_dlp.YoutubeDL):
+    """ YoutubeDL using SegmentedHttpFD for plain HTTP downloads.
+
+    `concurrent_fragment_downloads` sets the number of connections. For a
+    merge of several formats, yt-dlp calls dl() once per format in a row;
+    the first call starts the remaining formats on their own threads and
+    the later calls wait for those instead of starting over.
+    """
+
+    def __init__(self, params=None, *args, **kwargs):
+        super().__init__(params, *args, **kwargs)
+        self._merge_info = None
+        self._prefetched = {}
+
+    def process_info(self, info_dict):
+        self._merge_info = info_dict if len(info_dict.get('requested_formats') or ()) > 1 else None
+        try:
+            return super().process_info(info_dict)
+        finally:
+            self._merge_info = None
+            # After a failure yt-dlp never asks for the remaining formats: drop the queued ones and let the
+            # running ones finish, so no thread still writes a .part file when this call returns
+            prefetched, self._prefetched = self._prefetched, {}
+            for future in prefetched.values():
+                future.cancel()
+            wait(prefetched.values())
+
+    def dl(self, name, info, subtitle=False, test=False):
+        if name in self._prefetched:
+            return self._prefetched.pop(name).result()
+        if not test and not subtitle and name != '-' and self._merge_info is not None:
+            self._prefetch_other_formats(name, info)
+        return self._dl(name, info, subtitle, test)
+
+    def _dl(self, name, info, subtitle=False, test=False):
+        protocol = info.get('protocol') or ''
+        if test or subtitle or name == '-' or protocol not in ('http', 'https') \
+                or self.params.get('external_downloader'):
+            return super().dl(name, info, subtitle, test)
+        fd = SegmentedHttpFD(self, self.params)
+        for hook in self._progress_hooks:
+            fd.add_progress_hook(hook)
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        return fd.download(name, new_info, subtitle)
+
+    # Start the formats after `info`'s on their own threads, under the names yt-dlp will ask for
+    def _prefetch_other_formats(self, name, info):
+        formats = self._merge_info['requested_formats']
+        suffix = f".f{info['format_id']}.{info['ext']}"
+        if not name.endswith(suffix) or formats[0]['format_id'] != info['format_id']:
+            return
+        base = name[:-len(suffix)]
+        pool = ThreadPoolExecutor(max_workers=len(formats) - 1)
+        for fmt in formats[1:]:
+            other_info = dict(self._merge_info)
+            del other_info['requested_formats']
+            other_info.update(fmt)
+            other_name = f"{base}.f{fmt['format_id']}.{fmt['ext']}"
+            self._prefetched[other_name] = pool.submit(self._dl, other_name, other_info)
+        pool.shutdown(wait=False)
@@ -0,0 +1,79 @@
+"""Long-lived yt-dlp sessions reused across tracks."""
+
+import threading
+from contextlib import contextmanager
+
+import yt_dlp
+
+
+class DownloaderSession:
+    """ One YoutubeDL instance kept open across many downloads.
+
+    Creating a YoutubeDL loads the extractor list and opens a fresh HTTP
+    connection pool, which is pure overhead when the same worker handles
+    thousands of tracks. A session is created once and only its output
+    template is swapped per download. It is not thread-safe: only one
+    thread may use it at a time (see SessionPool).
+    """
+
+    def __init__(self, params=None):
+        self.ydl = yt_dlp.YoutubeDL(dict(params or {}))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.ydl.close()
+
+    def extract_info(self, url, download=False):
+        return self.ydl.extract_info(url, download=download)
+
+    # Download url to outtmpl and return the info dict
+    def download(self, url, outtmpl):
+        self.ydl.params['outtmpl']['default'] = outtmpl
+        return self.ydl.extract_info(url, download=True)
+
+
+class SessionPool:
+    """ DownloaderSessions built from the same params, each used by one thread at a time.
+
+    A session is leased for one call and goes back to the pool afterwards,
+    so the pool holds at most as many sessions as threads used it at once,
+    and a long-lived pool keeps them warm across batches whose worker
+    threads come and go.
+    """
+
+    def __init__(self, params=None):
+        self.params = params
+        self._idle = []
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def lease(self):
+        with self._lock:
+            session = self._idle.pop() if self._idle else None
+        if session is None:
+            session = DownloaderSession(self.params)
+            with self._lock:
+                self._sessions.append(session)
+        try:
+            yield session
+        finally:
+            with self._lock:
+                self._idle.append(session)
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions, self._idle = self._sessions, [], []
+        for session in sessions:
+            session.close()
@@ -0,0 +1,350 @@
+"""One playlist or liked-songs job shared by several worker processes or hosts.
+
+Workers that run the same job against the same shard queue, a SQLite file
+they can all reach, split its tracks between them without a broker. The
+first worker lists the tracks and stores them in numbered batches while
+every worker, the first one included, leases a batch at a time, downloads
+it and stores the outcome. Leases are renewed while a worker is alive and
+run out LEASE_SECONDS after the last renewal, so the batches of a worker
+that crashed, and the listing if it was the lister, are taken over by the
+others. A batch whose lease ran out MAX_ATTEMPTS times, say one that
+crashes every worker taking it, is given up with all its tracks failed
+instead of being handed round forever. Every worker stays until the whole job is done and returns the
+outcome of all batches merged into one report.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from downloader.tracks import track_from_dict, track_to_dict
+
+# Tracks leased at a time
+SHARD_BATCH_SIZE = 50
+
+# Seconds a lease lasts without being renewed
+LEASE_SECONDS = 120.0
+
+# Seconds a worker waits before looking at the queue again when nothing is free
+POLL_INTERVAL = 2.0
+
+# Leases of a batch that may run out before it is given up as failed
+MAX_ATTEMPTS = 3
+
+# Workers joining a job that finished less than this long ago get its report instead of starting it over
+FINISHED_GRACE = 10 * 60
+
+# Job statuses
+LISTING = 'listing'
+LISTED = 'listed'
+DONE = 'done'
+
+# Batch statuses
+PENDING = 'pending'
+LEASED = 'leased'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shard_jobs (
+    job TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS shard_batches (
+    job TEXT NOT NULL,
+    batch INTEGER NOT NULL,
+    tracks TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    PRIMARY KEY (job, batch)
+);
+"""
+
+
+# Name of this worker in leases and reports
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class ShardQueue:
+    """ Jobs, their batches and the leases on them in one SQLite file.
+
+    Changes that read before they write run in BEGIN IMMEDIATE
+    transactions, so the processes sharing the file see each lease
+    change atomically. Like the other databases, one connection is shared
+    by the threads of a process behind a lock.
+    """
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # No WAL: it needs memory shared between the processes, which workers on other hosts don't have
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._transaction() as db:
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    db.execute(statement)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def join(self, job, worker):
+        """ Returns True when `worker` has to list the job's tracks.
+
+        That is the case for a new job, for a job finished longer than
+        FINISHED_GRACE ago (it starts over) and for a job whose lister's
+        lease ran out.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute('SELECT * FROM shard_jobs WHERE job = ?', (job,)).fetchone()
+            if row is not None:
+                if row['status'] == DONE and now - row['finished_at'] < FINISHED_GRACE:
+                    return False
+                if row['status'] == LISTED or (row['status'] == LISTING and row['lease_expires'] > now):
+                    return False
+                if row['status'] == LISTING:
+                    db.execute('UPDATE shard_jobs SET owner = ?, lease_expires = ? WHERE job = ?',
+                               (worker, now + self.lease_seconds, job))
+                    return True
+            db.execute('DELETE FROM shard_batches WHERE job = ?', (job,))
+            db.execute('INSERT OR REPLACE INTO shard_jobs (job, status, owner, lease_expires, error, created_at, '
+                       'finished_at) VALUES (?, ?, ?, ?, NULL, ?, NULL)',
+                       (job, LISTING, worker, now + self.lease_seconds, now))
+            return True
+
+    # Store batch `number`; a lister that took over lists the same batches again, which are kept as they were
+    def add_batch(self, job, number, tracks):
+        text = json.dumps([track_to_dict(track) for track in tracks], ensure_ascii=False)
+        with self._lock:
+            self._db.execute('INSERT OR IGNORE INTO shard_batches (job, batch, tracks, status) VALUES (?, ?, ?, ?)',
+                             (job, number, text, PENDING))
+
+    # All batches are stored; a worker whose listing was taken over changes nothing
+    def finish_listing(self, job, worker, error=None):
+        status, finished_at = (DONE, time.time()) if error is not None else (LISTED, None)
+        with self._lock:
+            self._db.execute('UPDATE shard_jobs SET status = ?, error = ?, finished_at = ?, lease_expires = NULL '
+                             'WHERE job = ? AND owner = ? AND status = ?',
+                             (status, error, finished_at, job, worker, LISTING))
+
+    def lease(self, job, worker):
+        """ Leases the lowest free batch, pending or with an expired lease; returns (number, tracks) or None.
+
+        Free batches whose lease ran out max_attempts times are recorded
+        as failed instead.
+        """
+        now = time.time()
+        free = '(status = ? OR (status = ? AND lease_expires < ?))'
+        with self._transaction() as db:
+            given_up = db.execute(f'SELECT batch, tracks, attempts FROM shard_batches WHERE job = ? AND {free} '
+                                  'AND attempts >= ?', (job, PENDING, LEASED, now, self.max_attempts)).fetchall()
+            for batch in given_up:
+                result = _failed_batch([track_from_dict(data) for data in json.loads(batch['tracks'])],
+                                       f"given up after {batch['attempts']} attempts")
+                db.execute('UPDATE shard_batches SET status = ?, result = ?, lease_expires = NULL '
+                           'WHERE job = ? AND batch = ?',
+                           (DONE, json.dumps(result, ensure_ascii=False), job, batch['batch']))
+            row = db.execute(
+                'UPDATE shard_batches SET status = ?, owner = ?, lease_expires = ?, attempts = attempts + 1 '
+                f'WHERE job = ? AND batch = (SELECT batch FROM shard_batches WHERE job = ? AND {free} '
+                'ORDER BY batch LIMIT 1) RETURNING batch, tracks',
+                (LEASED, worker, now + self.lease_seconds, job, job, PENDING, LEASED, now)).fetchone()
+        if row is None:
+            return None
+        return row['batch'], [track_from_dict(data) for data in json.loads(row['tracks'])]
+
+    # Extend every lease `worker` holds on the job, the listing included when `listing` is set
+    def renew(self, job, worker, listing=False):
+        expires = time.time() + self.lease_seconds
+        with self._lock:
+            self._db.execute('UPDATE shard_batches SET lease_expires = ? WHERE job = ? AND owner = ? AND status = ?',
+                             (expires, job, worker, LEASED))
+            if listing:
+                self._db.execute('UPDATE shard_jobs SET lease_expires = ? WHERE job = ? AND owner = ? AND status = ?',
+                                 (expires, job, worker, LISTING))
+
+    # Record a batch's outcome; False when its lease went to another worker, whose outcome counts instead
+    def complete(self, job, worker, number, result):
+        with self._lock:
+            cursor = self._db.execute(
+                'UPDATE shard_batches SET status = ?, result = ?, lease_expires = NULL '
+                'WHERE job = ? AND batch = ? AND owner = ? AND status = ?',
+                (DONE, json.dumps(result, ensure_ascii=False), job, number, worker, LEASED))
+        return cursor.rowcount == 1
+
+    # Hand a batch back right away, e.g. after an error, instead of letting its lease run out; a batch handed
+    # back doesn't count as an attempt
+    def release(self, job, worker, number):
+        with self._lock:
+            self._db.execute('UPDATE shard_batches SET status = ?, owner = NULL, lease_expires = NULL, '
+                             'attempts = attempts - 1 '
+                             'WHERE job = ? AND batch = ? AND owner = ? AND status = ?',
+                             (PENDING, job, number, worker, LEASED))
+
+    def finish(self, job):
+        """ Marks the job done once it is listed and every batch is; returns whether it is done. """
+        with self._transaction() as db:
+            row = db.execute('SELECT status FROM shard_jobs WHERE job = ?', (job,)).fetchone()
+            if row is None or row['status'] == DONE:
+                return row is not None
+            if row['status'] == LISTING:
+                return False
+            if db.execute('SELECT 1 FROM shard_batches WHERE job = ? AND status != ? LIMIT 1',
+                          (job, DONE)).fetchone():
+                return False
+            db.execute('UPDATE shard_jobs SET status = ?, finished_at = ? WHERE job = ?', (DONE, time.time(), job))
+            return True
+
+    # The listing error of the job, if listing failed
+    def error(self, job):
+        with self._lock:
+            row = self._db.execute('SELECT error FROM shard_jobs WHERE job = ?', (job,)).fetchone()
+        return row['error'] if row else None
+
+    # (owner, result) of every finished batch
+    def results(self, job):
+        with self._lock:
+            rows = self._db.execute('SELECT owner, result FROM shard_batches WHERE job = ? AND status = ? '
+                                    'ORDER BY batch', (job, DONE)).fetchall()
+        return [(row['owner'], json.loads(row['result'])) for row in rows]
+
+
+# Result of a batch none of whose tracks could be downloaded, in the form download_batch returns
+def _failed_batch(tracks, error):
+    return {
+        'succeeded': 0,
+        'skipped': 0,
+        'failed': [{'id': track.id, 'name': track.name, 'artist': track.artist, 'error': error} for track in tracks],
+        'search_cache': {'hits': 0, 'misses': 0},
+        'claim_waits': {'waited': 0, 'taken_over': 0},
+    }
+
+
+def merge_results(results):
+    """ Merges batch results into one: counts are summed, failures listed, and each worker's share kept. """
+    merged = {'succeeded': 0, 'skipped': 0, 'failed': [], 'search_cache': {'hits': 0, 'misses': 0},
+              'claim_waits': {'waited': 0, 'taken_over': 0}, 'batches': len(results), 'workers': {}}
+    for owner, result in results:
+        merged['succeeded'] += result['succeeded']
+        merged['skipped'] += result['skipped']
+        merged['failed'].extend(result['failed'])
+        for key in ('hits', 'misses'):
+            merged['search_cache'][key] += result['search_cache'][key]
+        # Batches stored by workers from before claim waits were reported have none
+        for key, count in result.get('claim_waits', {}).items():
+            merged['claim_waits'][key] += count
+        share = merged['workers'].setdefault(owner, {'batches': 0, 'succeeded': 0, 'skipped': 0, 'failed': 0})
+        share['batches'] += 1
+        share['succeeded'] += result['succeeded']
+        share['skipped'] += result['skipped']
+        share['failed'] += len(result['failed'])
+    return merged
+
+
+# Raised when the job's tracks couldn't be listed
+class ListingError(Exception):
+    pass
+
+
+class ShardWorker:
+    """ One worker's part in a shared job.
+
+    run(list_tracks, download_batch) returns when the whole job is done.
+    list_tracks() yields the job's tracks in a stable order and is only
+    called when this worker lists them. download_batch(tracks) downloads
+    one batch and returns its result: a dict with succeeded, skipped,
+    failed and search_cache entries like downloader.cli reports.
+    """
+
+    def __init__(self, queue, job, batch_size=SHARD_BATCH_SIZE, worker=None):
+        self.queue = queue
+        self.job = job
+        self.batch_size = max(1, batch_size)
+        self.worker = worker or worker_name()
+        self._listing = None
+        self._stop = threading.Event()
+
+    def run(self, list_tracks, download_batch):
+        heartbeat = threading.Thread(target=self._heartbeat, name='shard-heartbeat', daemon=True)
+        heartbeat.start()
+        try:
+            while True:
+                if not self._is_listing() and self.queue.join(self.job, self.worker):
+                    self._listing = threading.Thread(target=self._list, args=(list_tracks,), name='shard-listing',
+                                                     daemon=True)
+                    self._listing.start()
+                leased = self.queue.lease(self.job, self.worker)
+                if leased is not None:
+                    number, tracks = leased
+                    try:
+                        result = download_batch(tracks)
+                    except BaseException:
+                        self.queue.release(self.job, self.worker, number)
+                        raise
+                    self.queue.complete(self.job, self.worker, number, result)
+                    continue
+                if self.queue.finish(self.job):
+                    break
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self._stop.set()
+            heartbeat.join()
+        error = self.queue.error(self.job)
+        if error is not None:
+            raise ListingError(error)
+        return dict(merge_results(self.queue.results(self.job)), worker=self.worker)
+
+    def _is_listing(self):
+        return self._listing is not None and self._listing.is_alive()
+
+    def _list(self, list_tracks):
+        batch, number = [], 0
+        try:
+            for track in list_tracks():
+                batch.append(track)
+                if len(batch) == self.batch_size:
+                    self.queue.add_batch(self.job, number, batch)
+                    batch, number = [], number + 1
+            if batch:
+                self.queue.add_batch(self.job, number, batch)
+        except Exception as e:
+            self.queue.finish_listing(self.job, self.worker, str(e))
+            return
+        self.queue.finish_listing(self.job, self.worker)
+
+    def _heartbeat(self):
+        # Renewing at a quarter of the lease time survives a missed renewal or two
+        while not self._stop.wait(self.queue.lease_seconds / 4):
+            self.queue.renew(self.job, self.worker, listing=self._is_listing())
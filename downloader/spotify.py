@@ -0,0 +1,268 @@
+"""Spotify Web API helpers shared by both downloaders."""
+
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from downloader.ratelimit import SPOTIFY
+from downloader.tracing import span
+from downloader.tracks import iter_tracks, track_from_item
+
+# Largest page sizes the endpoints accept
+PLAYLIST_PAGE_SIZE = 100
+SAVED_TRACKS_PAGE_SIZE = 50
+ALBUM_TRACKS_PAGE_SIZE = 50
+ARTIST_ALBUMS_PAGE_SIZE = 50
+
+# Most IDs the several-items endpoints take per request
+ALBUMS_PER_REQUEST = 20
+TRACKS_PER_REQUEST = 50
+
+# How many pages are requested at the same time
+PAGE_CONCURRENCY = 4
+
+# Only the fields the downloader reads from a playlist item
+PLAYLIST_TRACK_FIELDS = ('total,items(track(id,name,duration_ms,track_number,external_ids(isrc),artists(id,name),'
+                         'album(name,images)))')
+
+# Release types that make up an artist's discography; compilations and appearances are left out
+ARTIST_ALBUM_GROUPS = 'album,single'
+
+# open.spotify.com URL (with or without a locale) or spotify: URI of a track, album, artist or playlist
+SPOTIFY_LINK = re.compile(r'(?:https?://open\.spotify\.com/(?:intl-[\w-]+/)?|spotify:)'
+                          r'(track|album|artist|playlist)[/:]([A-Za-z0-9]{22})')
+
+
+# (kind, id) of a Spotify URL or URI, None for anything else
+def parse_spotify_link(text):
+    match = SPOTIFY_LINK.match(text.strip())
+    return (match.group(1), match.group(2)) if match else None
+
+
+def spotify_id(text, kind):
+    """ Returns the ID of a `kind` item given as an ID, URL or URI.
+
+    Raises ValueError for a link to another kind of item.
+    """
+    link = parse_spotify_link(text)
+    if link is None:
+        return text.strip()
+    if link[0] != kind:
+        raise ValueError(f'not a Spotify {kind}: {text}')
+    return link[1]
+
+
+# fetch(arg) timed as a `name` span when tracing is on
+def _traced(name, fetch):
+    def traced(arg):
+        with span(name):
+            return fetch(arg)
+    return traced
+
+
+def iter_pages(fetch_page, page_size, concurrency=PAGE_CONCURRENCY, on_total=None):
+    """ Yields every item of an offset-paginated endpoint, in order.
+
+    The first page is requested alone to learn `total`. Its items are
+    yielded right away while the following offsets are fetched on a small
+    thread pool; no more than `concurrency` pages are ever buffered, so
+    memory stays bounded regardless of the library size. on_total(total)
+    is called once the first page arrives, e.g. for progress reporting.
+    """
+    fetch_page = _traced('page fetch', fetch_page)
+    first = fetch_page(0)
+    if on_total is not None:
+        on_total(first['total'])
+    offsets = iter(range(page_size, first['total'], page_size))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = deque(pool.submit(fetch_page, offset) for offset in islice(offsets, concurrency))
+        yield from first['items']
+        del first
+        while pending:
+            page = pending.popleft().result()
+            for offset in islice(offsets, 1):
+                pending.append(pool.submit(fetch_page, offset))
+            yield from page['items']
+
+
+def iter_batches(fetch_batch, batches, concurrency=PAGE_CONCURRENCY):
+    """ Yields fetch_batch(batch) for every batch, in order.
+
+    Like iter_pages, up to `concurrency` requests run at a time on a
+    small thread pool and no more results than that are buffered.
+    """
+    fetch_batch = _traced('page fetch', fetch_batch)
+    batches = iter(batches)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = deque(pool.submit(fetch_batch, batch) for batch in islice(batches, concurrency))
+        while pending:
+            result = pending.popleft().result()
+            for batch in islice(batches, 1):
+                pending.append(pool.submit(fetch_batch, batch))
+            yield result
+
+
+# Split a list into lists of at most `size` items
+def _chunks(items, size):
+    return (items[start:start + size] for start in range(0, len(items), size))
+
+
+# Stream full tracks by ID, TRACKS_PER_REQUEST per request; unknown IDs are skipped
+def iter_tracks_by_id(sp, track_ids, concurrency=PAGE_CONCURRENCY, on_total=None):
+    track_ids = list(track_ids)
+    if on_total is not None:
+        on_total(len(track_ids))
+
+    def fetch_tracks(ids):
+        return SPOTIFY.call(sp.tracks, ids)['tracks']
+    for tracks in iter_batches(fetch_tracks, _chunks(track_ids, TRACKS_PER_REQUEST), concurrency):
+        yield from iter_tracks({'track': track} for track in tracks)
+
+
+def _iter_album_track_ids(sp, album_ids, concurrency):
+    """ Yields the track IDs of the albums, ALBUMS_PER_REQUEST albums per request.
+
+    An album object carries its first ALBUM_TRACKS_PAGE_SIZE tracks; only
+    longer albums need further album_tracks pages.
+    """
+    def fetch_albums(ids):
+        return SPOTIFY.call(sp.albums, ids)['albums']
+    for albums in iter_batches(fetch_albums, _chunks(album_ids, ALBUMS_PER_REQUEST), concurrency):
+        for album in albums:
+            if album is None:
+                continue
+            page = album['tracks']
+            yield from (track['id'] for track in page['items'] if track.get('id'))
+            offset = len(page['items'])
+            while offset < page['total']:
+                more = SPOTIFY.call(sp.album_tracks, album['id'], limit=ALBUM_TRACKS_PAGE_SIZE, offset=offset)
+                yield from (track['id'] for track in more['items'] if track.get('id'))
+                offset += ALBUM_TRACKS_PAGE_SIZE
+
+
+# Stream the tracks of albums; simplified album tracks lack the ISRC, so full tracks are fetched in batches
+def iter_album_tracks(sp, album_ids, concurrency=PAGE_CONCURRENCY, on_total=None):
+    track_ids = list(dict.fromkeys(_iter_album_track_ids(sp, list(album_ids), concurrency)))
+    yield from iter_tracks_by_id(sp, track_ids, concurrency, on_total)
+
+
+# Stream an artist's discography: the tracks of every album and single, in the order Spotify lists them
+def iter_artist_tracks(sp, artist_id, groups=ARTIST_ALBUM_GROUPS, concurrency=PAGE_CONCURRENCY, on_total=None):
+    def fetch_page(offset):
+        return SPOTIFY.call(sp.artist_albums, artist_id, include_groups=groups, limit=ARTIST_ALBUMS_PAGE_SIZE,
+                            offset=offset)
+    album_ids = list(dict.fromkeys(album['id'] for album in
+                                   iter_pages(fetch_page, ARTIST_ALBUMS_PAGE_SIZE, concurrency)))
+    yield from iter_album_tracks(sp, album_ids, concurrency, on_total)
+
+
+# Stream the tracks of a playlist, from `cache` when its snapshot hasn't changed
+def iter_playlist_tracks(sp, playlist_id, concurrency=PAGE_CONCURRENCY, on_total=None, cache=None):
+    def fetch_page(offset):
+        return SPOTIFY.call(sp.playlist_tracks, playlist_id, fields=PLAYLIST_TRACK_FIELDS,
+                            limit=PLAYLIST_PAGE_SIZE, offset=offset)
+    if cache is None:
+        return iter_tracks(iter_pages(fetch_page, PLAYLIST_PAGE_SIZE, concurrency, on_total))
+    return _iter_cached_playlist(sp, playlist_id, fetch_page, concurrency, on_total, cache)
+
+
+# Discard a staged cache listing when the block fails or its consumer stops early
+@contextmanager
+def _staging(staged):
+    try:
+        yield staged
+    except BaseException:
+        staged.discard()
+        raise
+
+
+def _iter_cached_playlist(sp, playlist_id, fetch_page, concurrency, on_total, cache):
+    snapshot_id = SPOTIFY.call(sp.playlist, playlist_id, fields='snapshot_id')['snapshot_id']
+    listing = cache.playlist(playlist_id, snapshot_id)
+    if listing is not None:
+        if on_total is not None:
+            on_total(listing.size)
+        yield from cache.tracks(listing)
+        return
+    staged = cache.stage()
+    with _staging(staged):
+        for track in iter_tracks(iter_pages(fetch_page, PLAYLIST_PAGE_SIZE, concurrency, on_total)):
+            staged.add(track)
+            yield track
+    # Only a complete listing is stored
+    cache.put_playlist(playlist_id, snapshot_id, staged)
+
+
+# Stream the current user's saved tracks (this endpoint has no fields filter)
+def iter_saved_tracks(sp, concurrency=PAGE_CONCURRENCY, on_total=None, cache=None):
+    def fetch_page(offset):
+        return SPOTIFY.call(sp.current_user_saved_tracks, limit=SAVED_TRACKS_PAGE_SIZE, offset=offset)
+    if cache is None:
+        return iter_tracks(iter_pages(fetch_page, SAVED_TRACKS_PAGE_SIZE, concurrency, on_total))
+    return _iter_cached_saved_tracks(fetch_page, concurrency, on_total, cache)
+
+
+# Yield (added_at, Track) for every usable saved item
+def _iter_saved_entries(items):
+    for item in items:
+        track = track_from_item(item)
+        if track is not None:
+            yield item.get('added_at') or '', track
+
+
+def _fetch_new_saved_items(fetch_page, newest):
+    """ Pages newest first until an item added at or before `newest` shows up.
+
+    Returns (total, new items).
+    """
+    items, offset = [], 0
+    while True:
+        page = fetch_page(offset)
+        new = [item for item in page['items'] if (item.get('added_at') or '') > newest]
+        items.extend(new)
+        offset += SAVED_TRACKS_PAGE_SIZE
+        if len(new) < len(page['items']) or offset >= page['total']:
+            return page['total'], items
+
+
+def _iter_cached_saved_tracks(fetch_page, concurrency, on_total, cache):
+    """ Saved tracks with only the additions since the last sync fetched.
+
+    Saved tracks have no snapshot_id, so the cached list is trusted while
+    Spotify's total still adds up to the cached total plus the new items;
+    anything else (a removed song) means a full listing.
+    """
+    known = cache.saved_tracks()
+    if known is not None and known.size:
+        total, items = _fetch_new_saved_items(fetch_page, known.newest)
+        if total == known.total + len(items):
+            if on_total is not None:
+                on_total(total)
+            if items:
+                staged = cache.stage()
+                with _staging(staged):
+                    added_ids = set()
+                    for added_at, track in _iter_saved_entries(items):
+                        staged.add(track, added_at)
+                        added_ids.add(track.id)
+                    staged.extend(known, added_ids)
+                known = cache.put_saved_tracks(total, staged)
+            yield from cache.tracks(known)
+            return
+
+    totals = []
+
+    def remember_total(total):
+        totals.append(total)
+        if on_total is not None:
+            on_total(total)
+
+    staged = cache.stage()
+    with _staging(staged):
+        pages = iter_pages(fetch_page, SAVED_TRACKS_PAGE_SIZE, concurrency, remember_total)
+        for added_at, track in _iter_saved_entries(pages):
+            staged.add(track, added_at)
+            yield track
+    cache.put_saved_tracks(totals[0], staged)
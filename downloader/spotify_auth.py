@@ -0,0 +1,164 @@
+"""Spotify access tokens shared by every client in the process.
+
+spotipy asks its auth manager for a token before every request and only
+renews one once it has expired, so with several workers each of them can
+run into the expired token at once, refresh it and wait for the round
+trip. Here one TokenManager per set of credentials hands the same token to
+every client and renews it in a background thread REFRESH_AHEAD seconds
+before it expires, so requests find a valid token. The user token of the
+liked-songs flow is stored in the token cache file, which is replaced
+atomically so a crash or a second process never reads half a token.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from spotipy.cache_handler import CacheHandler, MemoryCacheHandler
+from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
+
+from downloader.tracing import span
+
+# Token cache of the liked-songs flow; spotipy's own default, so existing logins keep working
+TOKEN_CACHE_FILE = '.cache'
+
+# Seconds before expiry a token is renewed in the background
+REFRESH_AHEAD = 5 * 60
+
+# A token with less than this many seconds left is renewed before it is handed out
+MIN_REMAINING = 60
+
+# Seconds to wait before trying again after a background renewal failed
+RETRY_INTERVAL = 30
+
+
+class AtomicCacheFileHandler(CacheHandler):
+    """ The token cache file, written to a temporary file and moved into place.
+
+    The file is only readable by its owner, as spotipy's own cache file is.
+    """
+
+    def __init__(self, path=TOKEN_CACHE_FILE):
+        self.path = path
+
+    def get_cached_token(self):
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def save_token_to_cache(self, token_info):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        # mkstemp creates the file with 0600 permissions
+        fd, temp_path = tempfile.mkstemp(prefix='.token-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump(token_info, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+# Seconds a token has left
+def _remaining(token_info):
+    return token_info['expires_at'] - time.time()
+
+
+class TokenManager:
+    """ The access token of one spotipy auth manager, renewed before it expires.
+
+    Used as a spotipy.Spotify auth_manager. Renewal is guarded by a lock,
+    so however many workers ask at once, one request goes to Spotify. The
+    first token is fetched on first use, which for the liked-songs flow is
+    where the user is asked to log in.
+    """
+
+    def __init__(self, auth, refresh_ahead=REFRESH_AHEAD):
+        self.auth = auth
+        self.refresh_ahead = refresh_ahead
+        self._token = None
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def get_access_token(self, as_dict=False):
+        token = self._token
+        if token is None or _remaining(token) < MIN_REMAINING:
+            token = self._renew(token)
+        return token if as_dict else token['access_token']
+
+    # Renew the token unless another thread already replaced `stale` while this one waited for the lock
+    def _renew(self, stale):
+        with self._lock:
+            if self._token is not stale and _remaining(self._token) >= MIN_REMAINING:
+                return self._token
+            self._token = self._fetch()
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh, name='spotify-token', daemon=True)
+                self._refresher.start()
+            return self._token
+
+    def _fetch(self):
+        with span('auth'):
+            return self._fetch_token()
+
+    def _fetch_token(self):
+        # Another process sharing the cache file may have renewed the token already
+        cached = self.auth.cache_handler.get_cached_token()
+        if isinstance(self.auth, SpotifyOAuth):
+            cached = self.auth.validate_token(cached)
+        if cached and _remaining(cached) > self.refresh_ahead:
+            return cached
+        if cached and cached.get('refresh_token'):
+            return self.auth.refresh_access_token(cached['refresh_token'])
+        # Client credentials, or the first login of the liked-songs flow; spotipy stores the new token
+        self.auth.get_access_token(as_dict=False, check_cache=False)
+        return self.auth.cache_handler.get_cached_token()
+
+    def _refresh(self):
+        wait = max(0, _remaining(self._token) - self.refresh_ahead)
+        while not self._stop.wait(wait):
+            try:
+                with self._lock:
+                    self._token = self._fetch()
+            except Exception:
+                # The old token may still be good for a while; requests renew it themselves once it isn't
+                wait = RETRY_INTERVAL
+                continue
+            wait = max(RETRY_INTERVAL, _remaining(self._token) - self.refresh_ahead)
+
+    def close(self):
+        self._stop.set()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+# The process-wide manager for `key`, created by create() on first use
+def _shared(key, create):
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = TokenManager(create())
+        return _managers[key]
+
+
+def client_credentials(client_id, client_secret):
+    """ Token manager for the app's own access to public data. """
+    # Kept in memory: spotipy would otherwise write it to .cache too, over the user's token
+    return _shared(('client', client_id, client_secret),
+                   lambda: SpotifyClientCredentials(client_id=client_id, client_secret=client_secret,
+                                                    cache_handler=MemoryCacheHandler()))
+
+
+def user_authorization(client_id, client_secret, redirect_uri, scope, cache_path=TOKEN_CACHE_FILE):
+    """ Token manager acting for the user, with the token kept in `cache_path`. """
+    return _shared(('user', client_id, client_secret, redirect_uri, scope, cache_path),
+                   lambda: SpotifyOAuth(client_id=client_id, client_secret=client_secret, redirect_uri=redirect_uri,
+                                        scope=scope, cache_handler=AtomicCacheFileHandler(cache_path)))
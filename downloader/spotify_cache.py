@@ -0,0 +1,255 @@
+"""On-disk cache of Spotify playlist contents and saved tracks.
+
+A playlist is stored under its snapshot_id, which Spotify changes on
+every edit, so an unchanged playlist is served from disk after a single
+metadata request. Saved tracks have no snapshot; they are stored with
+their added_at times so a sync only needs the pages with newer ones.
+
+Either kind of list is a listing: one row per track, written in chunks
+of WRITE_CHUNK while the pages arrive and read back in chunks of
+READ_CHUNK, so neither side holds a whole library in memory. A new
+listing only replaces the cached one once it is complete. Listings
+written before Track gained fields count as missing, so they are fetched
+again with the new fields.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from downloader.tracks import Track, track_from_dict, track_to_dict
+
+# Cache database path, next to config.json
+SPOTIFY_CACHE_FILE = 'spotify_cache.db'
+
+# Tracks written to the database at once while a listing is fetched
+WRITE_CHUNK = 500
+
+# Tracks read from the database at once while a cached listing is streamed
+READ_CHUNK = 500
+
+# Seconds a replaced or abandoned listing is kept, for a slow run still reading it
+LISTING_GRACE = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    listing INTEGER PRIMARY KEY AUTOINCREMENT,
+    size INTEGER,
+    fields TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS listing_tracks (
+    listing INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    added_at TEXT,
+    track_id TEXT,
+    track TEXT NOT NULL,
+    PRIMARY KEY (listing, position)
+);
+CREATE TABLE IF NOT EXISTS playlist_snapshots (
+    playlist_id TEXT PRIMARY KEY,
+    snapshot_id TEXT NOT NULL,
+    listing INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS saved_listings (
+    user TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    listing INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Tables of caches from before listings, which kept each list as one JSON document; they are fetched again
+LEGACY_TABLES = ('playlists', 'saved_tracks')
+
+# Saved tracks belong to whoever the OAuth token cache is for
+CURRENT_USER = 'me'
+
+# Track fields a listing was written with; listings with other fields are not served
+TRACK_FIELDS = ','.join(Track._fields)
+
+# A complete cached listing: `total` is the item count Spotify reported for saved tracks, including items
+# that aren't usable tracks, and `newest` their latest added_at
+Listing = namedtuple('Listing', ['id', 'size', 'total', 'newest'], defaults=(None, None))
+
+
+class StagedListing:
+    """ A listing being written, WRITE_CHUNK tracks at a time.
+
+    Nothing reads it until SpotifyCache.put_playlist() or
+    put_saved_tracks() swaps it in; one that never is, say because the
+    run was interrupted, is dropped after LISTING_GRACE.
+    """
+
+    def __init__(self, cache, listing_id):
+        self.cache = cache
+        self.id = listing_id
+        self._position = 0
+        self._rows = []
+
+    def add(self, track, added_at=None):
+        self._rows.append((self.id, self._position, added_at, track.id,
+                           json.dumps(track_to_dict(track), ensure_ascii=False)))
+        self._position += 1
+        if len(self._rows) >= WRITE_CHUNK:
+            self.flush()
+
+    # Append the tracks of `listing` except those with an ID in skip_ids
+    def extend(self, listing, skip_ids=()):
+        self.flush()
+        self._position = self.cache._copy_tracks(listing, self.id, self._position, skip_ids)
+
+    def flush(self):
+        if self._rows:
+            self.cache._insert_tracks(self.id, self._rows)
+            self._rows = []
+
+    def discard(self):
+        self._rows = []
+        self.cache._drop_listing(self.id)
+
+
+class SpotifyCache:
+    """ Playlist tracks by snapshot_id, and the saved tracks with their added_at.
+
+    Like the other caches, one SQLite connection is shared between threads
+    behind a lock, which is only held for one chunk at a time.
+    """
+
+    def __init__(self, path=SPOTIFY_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            for table in LEGACY_TABLES:
+                columns = [row[1] for row in self._db.execute(f'PRAGMA table_info({table})')]
+                if 'tracks' in columns:
+                    self._db.execute(f'DROP TABLE {table}')
+            self._db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # Cached listing of the playlist at this snapshot, None when there is none
+    def playlist(self, playlist_id, snapshot_id):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT l.listing, l.size FROM playlist_snapshots p JOIN listings l ON l.listing = p.listing '
+                'WHERE p.playlist_id = ? AND p.snapshot_id = ? AND l.fields = ?',
+                (playlist_id, snapshot_id, TRACK_FIELDS)).fetchone()
+        return Listing(*row) if row is not None else None
+
+    # Cached listing of the saved tracks, newest first, None when there is none
+    def saved_tracks(self):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT l.listing, l.size, s.total FROM saved_listings s JOIN listings l ON l.listing = s.listing '
+                'WHERE s.user = ? AND l.fields = ?', (CURRENT_USER, TRACK_FIELDS)).fetchone()
+            if row is None:
+                return None
+            newest = self._db.execute('SELECT added_at FROM listing_tracks WHERE listing = ? ORDER BY position '
+                                      'LIMIT 1', (row[0],)).fetchone()
+        return Listing(*row, newest[0] if newest else None)
+
+    def tracks(self, listing):
+        """ Yields the tracks of a listing, reading READ_CHUNK at a time. """
+        position = -1
+        while True:
+            with self._lock:
+                rows = self._db.execute('SELECT position, track FROM listing_tracks WHERE listing = ? AND position > ? '
+                                        'ORDER BY position LIMIT ?', (listing.id, position, READ_CHUNK)).fetchall()
+            if not rows:
+                return
+            for _, data in rows:
+                yield track_from_dict(json.loads(data))
+            position = rows[-1][0]
+
+    # A new, empty listing to fill and swap in
+    def stage(self):
+        with self._lock, self._db:
+            cursor = self._db.execute('INSERT INTO listings (fields, updated_at) VALUES (?, ?)',
+                                      (TRACK_FIELDS, time.time()))
+        return StagedListing(self, cursor.lastrowid)
+
+    def put_playlist(self, playlist_id, snapshot_id, staged):
+        """ Makes a complete staged listing the playlist's tracks at this snapshot and returns it. """
+        staged.flush()
+        now = time.time()
+        with self._lock, self._db:
+            old = self._db.execute('SELECT listing FROM playlist_snapshots WHERE playlist_id = ?',
+                                   (playlist_id,)).fetchone()
+            size = self._complete(staged.id, old, now)
+            self._db.execute('INSERT OR REPLACE INTO playlist_snapshots '
+                             '(playlist_id, snapshot_id, listing, updated_at) VALUES (?, ?, ?, ?)',
+                             (playlist_id, snapshot_id, staged.id, now))
+        return Listing(staged.id, size)
+
+    def put_saved_tracks(self, total, staged):
+        """ Makes a complete staged listing the saved tracks and returns it.
+
+        `total` is the item count Spotify reported, including items that
+        aren't usable tracks.
+        """
+        staged.flush()
+        now = time.time()
+        with self._lock, self._db:
+            old = self._db.execute('SELECT listing FROM saved_listings WHERE user = ?', (CURRENT_USER,)).fetchone()
+            size = self._complete(staged.id, old, now)
+            self._db.execute('INSERT OR REPLACE INTO saved_listings (user, total, listing, updated_at) '
+                             'VALUES (?, ?, ?, ?)', (CURRENT_USER, total, staged.id, now))
+        return Listing(staged.id, size, total)
+
+    # Record the size of a finished listing, start the grace period of the one it replaces and drop expired ones;
+    # called with the lock held, inside the transaction of the swap
+    def _complete(self, listing_id, old, now):
+        size = self._db.execute('SELECT COUNT(*) FROM listing_tracks WHERE listing = ?', (listing_id,)).fetchone()[0]
+        self._db.execute('UPDATE listings SET size = ?, updated_at = ? WHERE listing = ?', (size, now, listing_id))
+        if old is not None:
+            self._db.execute('UPDATE listings SET updated_at = ? WHERE listing = ?', (now, old[0]))
+        expired = [row[0] for row in self._db.execute(
+            'SELECT listing FROM listings WHERE updated_at < ? AND listing NOT IN '
+            '(SELECT listing FROM playlist_snapshots UNION SELECT listing FROM saved_listings)',
+            (now - LISTING_GRACE,))]
+        self._db.executemany('DELETE FROM listing_tracks WHERE listing = ?', [(listing,) for listing in expired])
+        self._db.executemany('DELETE FROM listings WHERE listing = ?', [(listing,) for listing in expired])
+        return size
+
+    def _insert_tracks(self, listing_id, rows):
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO listing_tracks (listing, position, added_at, track_id, track) '
+                                 'VALUES (?, ?, ?, ?, ?)', rows)
+            self._db.execute('UPDATE listings SET updated_at = ? WHERE listing = ?', (time.time(), listing_id))
+
+    # Copy a listing's tracks behind `position` of another; returns the position after the last one copied
+    def _copy_tracks(self, listing, listing_id, position, skip_ids):
+        with self._lock, self._db:
+            # The IDs go through a table of this connection: one parameter each could pass SQLite's limit
+            self._db.execute('CREATE TEMP TABLE IF NOT EXISTS skipped_ids (track_id TEXT PRIMARY KEY)')
+            self._db.execute('DELETE FROM skipped_ids')
+            self._db.executemany('INSERT OR IGNORE INTO skipped_ids (track_id) VALUES (?)',
+                                 [(track_id,) for track_id in skip_ids])
+            self._db.execute(
+                'INSERT INTO listing_tracks (listing, position, added_at, track_id, track) '
+                'SELECT ?, position + ?, added_at, track_id, track FROM listing_tracks t WHERE listing = ? '
+                'AND NOT EXISTS (SELECT 1 FROM skipped_ids s WHERE s.track_id = t.track_id)',
+                (listing_id, position, listing.id))
+            self._db.execute('DELETE FROM skipped_ids')
+            last = self._db.execute('SELECT MAX(position) FROM listing_tracks WHERE listing = ?',
+                                    (listing_id,)).fetchone()[0]
+        return position if last is None else last + 1
+
+    def _drop_listing(self, listing_id):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM listing_tracks WHERE listing = ?', (listing_id,))
+            self._db.execute('DELETE FROM listings WHERE listing = ?', (listing_id,))
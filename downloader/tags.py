@@ -0,0 +1,102 @@
+"""Title, artist, album, track number, ISRC and cover tags for finished songs.
+
+Tags come from the Spotify track data the batch already holds, so no
+separate tagging pass over the library is needed. MP3 files get ID3v2.3
+tags, M4A files MP4 atoms and Opus files Vorbis comments. mutagen edits
+the tag area of the file in place: the audio is only moved once, when a
+file has no room for the tag yet, and the padding mutagen leaves behind
+lets later edits fit. mutagen is optional; without it songs stay untagged.
+"""
+
+import base64
+import os
+
+# Embedded cover type: front cover
+FRONT_COVER = 3
+
+
+# MIME type of an image from its first bytes; Spotify serves JPEG
+def _image_mime(data):
+    return 'image/png' if data.startswith(b'\x89PNG') else 'image/jpeg'
+
+
+def write_tags(path, track, cover=None):
+    """ Tags the song at `path` (mp3, m4a or opus) with `track` and the cover image bytes, if any.
+
+    Fields the track doesn't have are left alone. Returns False when
+    mutagen isn't installed or can't read the file, True otherwise.
+    """
+    try:
+        import mutagen
+    except ImportError:
+        return False
+    writers = {'.mp3': _tag_mp3, '.m4a': _tag_m4a, '.opus': _tag_opus}
+    writer = writers.get(os.path.splitext(path)[1].lower())
+    if writer is None:
+        return False
+    try:
+        writer(path, track, cover)
+    except mutagen.MutagenError:
+        return False
+    return True
+
+
+def _tag_mp3(path, track, cover):
+    from mutagen.id3 import APIC, ID3, TALB, TIT2, TPE1, TRCK, TSRC, ID3NoHeaderError
+    try:
+        tags = ID3(path)
+    except ID3NoHeaderError:
+        tags = ID3()
+    tags.setall('TIT2', [TIT2(encoding=3, text=track.name)])
+    tags.setall('TPE1', [TPE1(encoding=3, text=list(track.artists or (track.artist,)))])
+    if track.album:
+        tags.setall('TALB', [TALB(encoding=3, text=track.album)])
+    if track.track_number:
+        tags.setall('TRCK', [TRCK(encoding=3, text=str(track.track_number))])
+    if track.isrc:
+        tags.setall('TSRC', [TSRC(encoding=3, text=track.isrc)])
+    if cover:
+        tags.setall('APIC', [APIC(encoding=3, mime=_image_mime(cover), type=FRONT_COVER, desc='Cover', data=cover)])
+    # ID3v2.3 is what most players and file managers read
+    tags.save(path, v2_version=3)
+
+
+def _tag_m4a(path, track, cover):
+    from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
+    song = MP4(path)
+    if song.tags is None:
+        song.add_tags()
+    song.tags['\xa9nam'] = [track.name]
+    song.tags['\xa9ART'] = list(track.artists or (track.artist,))
+    if track.album:
+        song.tags['\xa9alb'] = [track.album]
+    if track.track_number:
+        song.tags['trkn'] = [(track.track_number, 0)]
+    if track.isrc:
+        song.tags['----:com.apple.iTunes:ISRC'] = [MP4FreeForm(track.isrc.encode('utf-8'))]
+    if cover:
+        image_format = MP4Cover.FORMAT_PNG if _image_mime(cover) == 'image/png' else MP4Cover.FORMAT_JPEG
+        song.tags['covr'] = [MP4Cover(cover, imageformat=image_format)]
+    song.save()
+
+
+def _tag_opus(path, track, cover):
+    from mutagen.flac import Picture
+    from mutagen.oggopus import OggOpus
+    song = OggOpus(path)
+    song['title'] = [track.name]
+    song['artist'] = list(track.artists or (track.artist,))
+    if track.album:
+        song['album'] = [track.album]
+    if track.track_number:
+        song['tracknumber'] = [str(track.track_number)]
+    if track.isrc:
+        song['isrc'] = [track.isrc]
+    if cover:
+        picture = Picture()
+        picture.type = FRONT_COVER
+        picture.mime = _image_mime(cover)
+        picture.desc = 'Cover'
+        picture.data = cover
+        song['metadata_block_picture'] = [base64.b64encode(picture.write()).decode('ascii')]
+    song.save()
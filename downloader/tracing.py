@@ -0,0 +1,224 @@
+"""Opt-in timed spans for the stages of every track, for chrome://tracing and Perfetto.
+
+Tracing is off unless a run is started with --trace. Until then span()
+hands out one shared no-op context manager, so instrumented code pays a
+function call and an attribute check. When it is on, every span becomes
+a complete ("X") event of the Chrome trace event format, tagged with the
+track it worked on and named after its stage (auth, page fetch, search,
+download, cover, postprocess, tag, publish). Its duration also goes into
+a histogram of that stage. When the run ends the events are written as
+a trace file, and the histograms are printed and written next to it.
+--profile additionally runs cProfile on every thread and writes pstats
+data for `python -m pstats` or snakeviz.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+# Events kept for the trace file; later spans still count in the histograms
+MAX_EVENTS = 1_000_000
+
+# Percentiles in the summary
+PERCENTILES = (50, 90, 99)
+
+# What span() returns while tracing is off; nullcontext keeps no state, so one instance serves every caller
+NO_SPAN = nullcontext()
+
+
+class StageHistogram:
+    """ Durations of one stage in power-of-two microsecond buckets.
+
+    Memory stays fixed however many spans a run has; percentiles are
+    the upper bound of the bucket they fall in, so they are at most
+    twice the real value.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = Counter()
+
+    def add(self, micros):
+        self.count += 1
+        self.total += micros
+        self.max = max(self.max, micros)
+        self.buckets[int(micros).bit_length()] += 1
+
+    def percentile(self, percent):
+        rank = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** bucket, self.max)
+        return self.max
+
+    def summary(self):
+        summary = {'count': self.count, 'total_s': round(self.total / 1e6, 3),
+                   'mean_ms': round(self.total / self.count / 1000, 3) if self.count else 0.0}
+        for percent in PERCENTILES:
+            summary[f'p{percent}_ms'] = round(self.percentile(percent) / 1000, 3)
+        summary['max_ms'] = round(self.max / 1000, 3)
+        summary['buckets_ms'] = {f'<{2 ** bucket / 1000:g}': self.buckets[bucket] for bucket in sorted(self.buckets)}
+        return summary
+
+
+class Tracer:
+    """ Collects spans from every thread while enabled. """
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self.enabled = False
+        self.max_events = max_events
+        self.dropped = 0
+        self._events = []
+        self._threads = {}
+        self._histograms = {}
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._events, self._threads, self._histograms, self.dropped = [], {}, {}, 0
+            self._origin = time.perf_counter_ns()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    @contextmanager
+    def span(self, name, args):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        except BaseException as e:
+            args = dict(args, error=type(e).__name__)
+            raise
+        finally:
+            self._record(name, start, time.perf_counter_ns(), args)
+
+    def _record(self, name, start, end, args):
+        thread = threading.current_thread()
+        micros = (end - start) / 1000
+        with self._lock:
+            self._histograms.setdefault(name, StageHistogram()).add(micros)
+            if len(self._events) >= self.max_events:
+                self.dropped += 1
+                return
+            self._threads[thread.native_id] = thread.name
+            self._events.append({'name': name, 'cat': 'stage', 'ph': 'X', 'ts': (start - self._origin) / 1000,
+                                 'dur': micros, 'pid': os.getpid(), 'tid': thread.native_id, 'args': args})
+
+    def write_trace(self, path):
+        """ Writes the spans in the Chrome trace event format, which Perfetto opens as well. """
+        with self._lock:
+            names = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                     for tid, name in self._threads.items()]
+            trace = {'traceEvents': names + self._events, 'displayTimeUnit': 'ms',
+                     'otherData': {'dropped_events': self.dropped}}
+            text = json.dumps(trace, ensure_ascii=False)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+    # Histogram summary of every stage, slowest total first
+    def summary(self):
+        with self._lock:
+            stages = sorted(self._histograms.items(), key=lambda item: item[1].total, reverse=True)
+            return {name: histogram.summary() for name, histogram in stages}
+
+
+# The process-wide tracer the instrumented code reports to
+TRACER = Tracer()
+
+
+def span(name, track=None, **args):
+    """ Times the block as stage `name` of `track` while tracing is on. """
+    if not TRACER.enabled:
+        return NO_SPAN
+    if track is not None:
+        args['track'] = f'{track.name} - {track.artist}'
+    return TRACER.span(name, args)
+
+
+# One line per stage: count, total and latency percentiles
+def format_summary(summary):
+    lines = [f'{"stage":<14}{"count":>8}{"total s":>10}{"mean ms":>10}'
+             + ''.join(f'{f"p{percent} ms":>10}' for percent in PERCENTILES) + f'{"max ms":>10}']
+    for name, stage in summary.items():
+        lines.append(f'{name:<14}{stage["count"]:>8}{stage["total_s"]:>10.2f}{stage["mean_ms"]:>10.1f}'
+                     + ''.join(f'{stage[f"p{percent}_ms"]:>10.1f}' for percent in PERCENTILES)
+                     + f'{stage["max_ms"]:>10.1f}')
+    return '\n'.join(lines)
+
+
+class ThreadProfiler:
+    """ cProfile over the calling thread and every thread started while it runs.
+
+    Before Python 3.12 a profiler only sees the thread that enabled it,
+    so each new thread enables its own from a threading.setprofile hook
+    and the results are merged. From 3.12 on cProfile sees every thread.
+    """
+
+    def __init__(self):
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._start_thread)
+        self._enable()
+
+    def _enable(self):
+        import cProfile
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    # Runs on the first event of each new thread, and is replaced there by the thread's own profiler
+    def _start_thread(self, frame, event, arg):
+        self._enable()
+
+    def stop(self, path):
+        import pstats
+        threading.setprofile(None)
+        with self._lock:
+            profiles, self._profiles = self._profiles, []
+        profiles[0].disable()
+        pstats.Stats(*profiles).dump_stats(path)
+
+
+# Summary file written next to a trace file
+def summary_path(trace_path):
+    return os.path.splitext(trace_path)[0] + '.summary.json'
+
+
+@contextmanager
+def traced_run(trace_path=None, profile_path=None, stream=None):
+    """ Traces the block into trace_path and profiles it into profile_path, each only when given.
+
+    The stage summary goes to `stream` (stderr by default) and to
+    summary_path(trace_path) once the block ends, however it ends.
+    """
+    profiler = ThreadProfiler() if profile_path else None
+    if trace_path:
+        TRACER.start()
+    if profiler is not None:
+        profiler.start()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.stop(profile_path)
+        if trace_path:
+            TRACER.stop()
+            TRACER.write_trace(trace_path)
+            summary = TRACER.summary()
+            with open(summary_path(trace_path), 'w', encoding='utf-8') as file:
+                json.dump(summary, file, indent=2, ensure_ascii=False)
+            print(format_summary(summary), file=stream or sys.stderr)
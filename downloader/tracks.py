@@ -0,0 +1,52 @@
+"""Compact track records built from Spotify API items."""
+
+from collections import namedtuple
+
+# Everything the download path needs to know about a Spotify track; the
+# fields after isrc are only used for tags and may be missing
+Track = namedtuple('Track', ['id', 'name', 'artist', 'artist_id', 'duration_ms', 'isrc',
+                             'artists', 'album', 'track_number', 'cover_url'],
+                   defaults=(None, None, None, None))
+
+# Widest cover image wanted for embedding; Spotify lists 640, 300 and 64 pixel versions
+COVER_WIDTH = 640
+
+
+# URL of the largest album image no wider than COVER_WIDTH, None when the album has none
+def cover_url(images):
+    fitting = [image for image in images or () if (image.get('width') or 0) <= COVER_WIDTH]
+    if not fitting:
+        return images[0]['url'] if images else None
+    return max(fitting, key=lambda image: image.get('width') or 0)['url']
+
+
+# Build a Track from a playlist or saved-track item, None for removed/local entries
+def track_from_item(item):
+    track = item.get('track')
+    if not track or not track.get('artists'):
+        return None
+    artist = track['artists'][0]
+    album = track.get('album') or {}
+    return Track(track.get('id'), track['name'], artist['name'], artist.get('id'),
+                 track.get('duration_ms'), (track.get('external_ids') or {}).get('isrc'),
+                 tuple(other['name'] for other in track['artists']), album.get('name'),
+                 track.get('track_number'), cover_url(album.get('images')))
+
+
+# Yield Track records for every usable item
+def iter_tracks(items):
+    for item in items:
+        track = track_from_item(item)
+        if track is not None:
+            yield track
+
+
+# Plain dict of a Track for JSON storage
+def track_to_dict(track):
+    return track._asdict()
+
+
+# Track from track_to_dict() output; tolerates dicts written before Track gained fields
+def track_from_dict(data):
+    track = Track(**{field: data.get(field) for field in Track._fields})
+    return track._replace(artists=tuple(track.artists)) if track.artists is not None else track
@@ -0,0 +1,97 @@
+"""FFmpeg audio conversion for the postprocessing stage.
+
+Audio is only re-encoded when it has to be. A stream whose codec the
+target container can hold is moved into place as downloaded, or remuxed
+(copied into the new container without decoding) when only the
+container differs, which costs a fraction of the CPU time of an encode.
+"""
+
+import os
+import subprocess
+
+# Default MP3 bitrate, matching the old FFmpegExtractAudio settings
+DEFAULT_MP3_BITRATE = '192'
+
+# Bitrates offered by the audio quality menu, in kbit/s
+AUDIO_BITRATES = ('320', '192', '128')
+
+DEFAULT_AUDIO_FORMAT = 'mp3'
+
+# Target format -> (codecs it holds without re-encoding, FFmpeg encoder, FFmpeg muxer)
+AUDIO_FORMATS = {
+    'mp3': (('mp3',), 'libmp3lame', 'mp3'),
+    'm4a': (('mp4a', 'aac'), 'aac', 'ipod'),
+    'opus': (('opus',), 'libopus', 'opus'),
+}
+
+# Codec of a downloaded file when yt-dlp doesn't report one
+EXTENSION_CODECS = {'.mp3': 'mp3', '.m4a': 'mp4a', '.aac': 'aac', '.opus': 'opus'}
+
+# yt-dlp format filter for a source stream that each target format can keep as it is
+PASSTHROUGH_FILTERS = {
+    'mp3': '[acodec=mp3]',
+    'm4a': '[acodec^=mp4a]',
+    'opus': '[acodec=opus]',
+}
+
+# FFmpeg is a separate process, so one transcode per core keeps every core busy
+TRANSCODE_WORKERS = os.cpu_count() or 1
+
+
+# AUDIO_FORMAT and AUDIO_BITRATE from config, falling back to the defaults for bad values
+def audio_settings(config):
+    audio_format = str(config.get('AUDIO_FORMAT') or DEFAULT_AUDIO_FORMAT).lower()
+    if audio_format not in AUDIO_FORMATS:
+        audio_format = DEFAULT_AUDIO_FORMAT
+    bitrate = str(config.get('AUDIO_BITRATE') or DEFAULT_MP3_BITRATE)
+    if not bitrate.isdigit():
+        bitrate = DEFAULT_MP3_BITRATE
+    return audio_format, bitrate
+
+
+def audio_format_selector(audio_format, bitrate):
+    """ yt-dlp format selection for audio that ends up as `audio_format` at `bitrate` kbit/s.
+
+    A stream the target can keep without re-encoding comes first, then any
+    audio, each time preferring the best one at or below the bitrate. A
+    stream that doesn't report its bitrate passes the bitrate filter.
+    """
+    choices = []
+    passthrough = PASSTHROUGH_FILTERS.get(audio_format)
+    if passthrough:
+        choices += [f'bestaudio{passthrough}[abr<=?{bitrate}]', f'bestaudio{passthrough}']
+    choices += [f'bestaudio[abr<=?{bitrate}]', 'bestaudio', 'best']
+    return '/'.join(choices)
+
+
+# Codec family of a downloaded stream, e.g. 'mp4a' for 'mp4a.40.2'
+def _codec(source_path, acodec):
+    if acodec and acodec != 'none':
+        return acodec.split('.')[0].lower()
+    return EXTENSION_CODECS.get(os.path.splitext(source_path)[1].lower())
+
+
+def finish_audio(source_path, output_path, acodec=None, bitrate=DEFAULT_MP3_BITRATE):
+    """ Turns a downloaded stream into output_path, whose extension names the target format.
+
+    The stream is moved into place when it already has the target codec
+    and container, remuxed when only the container differs and encoded at
+    `bitrate` kbit/s otherwise; acodec is the codec yt-dlp reported, if
+    any. FFmpeg writes to a temporary name that is renamed into place once
+    it finishes, so a half-written file never shows up under the final name.
+    """
+    extension = os.path.splitext(output_path)[1].lower()
+    codecs, encoder, muxer = AUDIO_FORMATS[extension[1:]]
+    passthrough = _codec(source_path, acodec) in codecs
+    if passthrough and os.path.splitext(source_path)[1].lower() == extension:
+        os.replace(source_path, output_path)
+        return output_path
+    codec_args = ['-codec:a', 'copy'] if passthrough else ['-codec:a', encoder, '-b:a', f'{bitrate}k']
+    temp_path = output_path + '.part'
+    subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-i', source_path, '-vn', *codec_args, '-f', muxer, temp_path],
+        check=True, stdin=subprocess.DEVNULL)
+    os.replace(temp_path, output_path)
+    if os.path.abspath(source_path) != os.path.abspath(output_path):
+        os.remove(source_path)
+    return output_path